@@ -6,11 +6,20 @@ Replaced previous content with a clear, emoji-free description.
 
 import streamlit as st
 
+from cluster import get_dask_client
+from models import WARM_MODELS, get_model_registry
+
 
 st.set_page_config(page_title="socio4health", page_icon=None, layout="wide")
 
 
 def main():
+    # Load the models configured in S4H_WARM_MODELS before the first classification request
+    if WARM_MODELS:
+        get_model_registry()
+    # Start the Dask cluster shared by all sessions
+    get_dask_client()
+
     st.title("socio4health")
 
     st.header("Introduction")
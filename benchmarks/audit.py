@@ -0,0 +1,155 @@
+"""Run the app with a log of the files each session writes, for benchmarks/load.py.
+
+    python -m benchmarks.audit <log.jsonl> run Home.py --server.port 8501
+
+Installs a Python audit hook, then hands the remaining arguments to the
+``streamlit`` command. Every file opened for writing, renamed or removed under
+the server's working directory (where ``bert_model/`` and ``./data`` resolve)
+or under a ``S4H_*_DIR`` directory is appended to the log as one JSON line
+with the Streamlit session it was done for:
+
+- on a script thread, the session running the script
+- on a job thread, the session that submitted the job
+- on any other thread (downloads, Dask's threaded scheduler), the session of
+  the thread that started it, as of the time of the write
+
+Writes done by native code (pyarrow's own file system) or by the processes
+of the distributed scheduler are not seen.
+"""
+
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+
+from streamlit.runtime.scriptrunner_utils.script_run_context import SCRIPT_RUN_CONTEXT_ATTR_NAME
+
+EVENTS = {"open", "os.rename", "os.remove", "os.rmdir", "shutil.rmtree"}
+WRITE_FLAGS = os.O_WRONLY | os.O_RDWR | os.O_CREAT | os.O_APPEND | os.O_TRUNC
+
+_local = threading.local()
+# thread -> thread that started it
+_parents = weakref.WeakKeyDictionary()
+
+
+def watched_roots():
+    """Return the directories whose writes are logged: the working directory and the S4H_*_DIR settings."""
+    roots = {os.getcwd()}
+    roots.update(os.path.abspath(value) for name, value in os.environ.items()
+                 if name.startswith("S4H_") and name.endswith("_DIR") and value)
+    return tuple(os.path.join(root, "") for root in sorted(roots))
+
+
+def _running_jobs():
+    # the job runner's log handler maps worker threads to the job they run
+    for handler in logging.getLogger().handlers:
+        running = getattr(handler, "running", None)
+        if isinstance(running, dict):
+            return running
+    return {}
+
+
+def session_of(thread):
+    """Return the id of the Streamlit session a thread works for, or None."""
+    jobs = _running_jobs()
+    seen = set()
+    while thread is not None and thread.ident not in seen:
+        seen.add(thread.ident)
+        ctx = getattr(thread, SCRIPT_RUN_CONTEXT_ATTR_NAME, None)
+        if ctx is not None:
+            return ctx.session_id
+        job = jobs.get(thread.ident)
+        if job is not None:
+            return job.session
+        thread = _parents.get(thread)
+    return None
+
+
+def _track_parents():
+    start = threading.Thread.start
+
+    @functools.wraps(start)
+    def tracked_start(self):
+        _parents[self] = threading.current_thread()
+        return start(self)
+
+    threading.Thread.start = tracked_start
+
+
+def _is_write(mode, flags):
+    if isinstance(mode, str):
+        return any(c in mode for c in "wax+")
+    return bool(flags & WRITE_FLAGS)
+
+
+def install(log_path, roots=None):
+    """
+    Start logging the writes under the watched directories.
+
+    Parameters:
+    log_path (str): JSON lines file the writes are appended to
+    roots (tuple | None): Directories to watch, defaults to watched_roots()
+    """
+    roots = roots or watched_roots()
+    log = open(log_path, "a", encoding="utf-8", buffering=1)
+    lock = threading.Lock()
+
+    def under_roots(path):
+        try:
+            path = os.path.abspath(os.fsdecode(path))
+        except TypeError:  # file descriptors
+            return None
+        return path if path.startswith(roots) else None
+
+    def hook(event, args):
+        if event not in EVENTS or getattr(_local, "busy", False):
+            return
+        _local.busy = True
+        try:
+            if event == "open":
+                if not _is_write(args[1], args[2] or 0):
+                    return
+                kind = "write"
+            elif event == "os.rename":
+                kind = "rename"
+                dir_fds = args[2:]
+            else:
+                kind = "remove"
+                dir_fds = args[1:]
+            if kind != "write" and any(fd is not None for fd in dir_fds):
+                # relative to a directory descriptor, e.g. the files shutil.rmtree removes one by one
+                return
+            path = under_roots(args[0])
+            target = under_roots(args[1]) if kind == "rename" else None
+            if path is None and target is None:
+                return
+            thread = threading.current_thread()
+            entry = {"time": time.time(), "kind": kind, "event": event, "path": path, "target": target,
+                     "session": session_of(thread), "thread": thread.name}
+            with lock:
+                log.write(json.dumps(entry) + "\n")
+        except Exception:
+            # never break the app's own file operations
+            pass
+        finally:
+            _local.busy = False
+
+    _track_parents()
+    sys.addaudithook(hook)
+
+
+def main():
+    log_path, *streamlit_args = sys.argv[1:]
+    install(log_path)
+    from streamlit.web import cli
+
+    sys.argv = ["streamlit", *streamlit_args]
+    sys.exit(cli.main())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Compare benchmark results with a baseline and flag regressions.
+
+    python -m benchmarks.compare baseline.json results.json --tolerance 0.2
+
+A flow regresses when it is slower than in the baseline by more than the
+tolerance (relative) and by more than ``--min-seconds`` (absolute, so that
+the noise of flows taking a few milliseconds is not reported), or when it
+fails where the baseline succeeded. The exit code is 1 if anything regressed.
+"""
+
+import argparse
+import json
+
+TOLERANCE = 0.2
+MIN_SECONDS = 0.05
+
+
+def scenario_key(scenario):
+    return f"{scenario['scale']}/{scenario['format']}/{scenario['files']} file(s)"
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(baseline, current, tolerance=TOLERANCE, min_seconds=MIN_SECONDS):
+    """
+    Compare the flows of two benchmark results.
+
+    Parameters:
+    baseline (dict): Earlier results
+    current (dict): New results
+    tolerance (float): Relative slowdown allowed
+    min_seconds (float): Absolute slowdown below which flows are never flagged
+
+    Returns:
+    list: One dict per scenario and flow with "scenario", "flow", "baseline", "current",
+    "change" (relative) and "status" ("ok", "regression", "improvement", "failed", "fixed",
+    "failing" when it failed in both, "new" or "missing")
+    """
+    before = {scenario_key(s): s["flows"] for s in baseline["scenarios"]}
+    after = {scenario_key(s): s["flows"] for s in current["scenarios"]}
+    rows = []
+    for key in list(dict.fromkeys(list(before) + list(after))):
+        old_flows, new_flows = before.get(key, {}), after.get(key, {})
+        for flow in list(dict.fromkeys(list(old_flows) + list(new_flows))):
+            old, new = old_flows.get(flow), new_flows.get(flow)
+            row = {"scenario": key, "flow": flow,
+                   "baseline": old["seconds"] if old else None, "current": new["seconds"] if new else None,
+                   "change": None}
+            if old is None:
+                row["status"] = "new"
+            elif new is None:
+                row["status"] = "missing"
+            elif new["error"] and not old["error"]:
+                row["status"] = "failed"
+            elif old["error"] and not new["error"]:
+                row["status"] = "fixed"
+            elif new["error"]:
+                row["status"] = "failing"
+            else:
+                row["change"] = (new["seconds"] - old["seconds"]) / old["seconds"] if old["seconds"] else None
+                slower = new["seconds"] - old["seconds"]
+                if slower > min_seconds and new["seconds"] > old["seconds"] * (1 + tolerance):
+                    row["status"] = "regression"
+                elif -slower > min_seconds and new["seconds"] < old["seconds"] * (1 - tolerance):
+                    row["status"] = "improvement"
+                else:
+                    row["status"] = "ok"
+            rows.append(row)
+    return rows
+
+
+def report(rows):
+    """Format a comparison as a plain-text table, regressions first."""
+    order = {"regression": 0, "failed": 1, "missing": 2, "failing": 3, "improvement": 4, "fixed": 5, "new": 6,
+             "ok": 7}
+    rows = sorted(rows, key=lambda r: order[r["status"]])
+
+    def seconds(value):
+        return f"{value:.3f}s" if value is not None else "-"
+
+    lines = [f"{'scenario':<24} {'flow':<12} {'baseline':>10} {'current':>10} {'change':>8}  status"]
+    for r in rows:
+        change = f"{r['change']:+.0%}" if r["change"] is not None else "-"
+        lines.append(f"{r['scenario']:<24} {r['flow']:<12} {seconds(r['baseline']):>10} "
+                     f"{seconds(r['current']):>10} {change:>8}  {r['status']}")
+    flagged = sum(r["status"] in ("regression", "failed") for r in rows)
+    lines.append(f"{flagged} regression(s) in {len(rows)} flow(s)")
+    return "\n".join(lines)
+
+
+def has_regressions(rows):
+    return any(r["status"] in ("regression", "failed") for r in rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare socio4health benchmark results with a baseline.")
+    parser.add_argument("baseline", help="Baseline results")
+    parser.add_argument("results", help="New results")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Relative slowdown allowed")
+    parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS,
+                        help="Slowdowns smaller than this are never flagged")
+    args = parser.parse_args(argv)
+
+    rows = compare(load_results(args.baseline), load_results(args.results), args.tolerance, args.min_seconds)
+    print(report(rows))
+    return 1 if has_regressions(rows) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,777 @@
+"""Load test of one app server shared by several concurrent sessions.
+
+    python -m benchmarks.load --sessions 1 4 16 --scale 10k --files 4
+
+For each number of sessions a fresh ``streamlit run`` server is started in
+``--data-dir``/app, so that ``bert_model/`` and ``./data`` resolve there as
+they do in a shared deployment, and that many sessions connect to it over
+Streamlit's websocket protocol, like browser tabs. Each session runs the same
+scripted workflow at once:
+
+- ``home``: open the Home page
+- ``dictionary``: upload the synthetic dictionary and standardize it
+- ``extract``: extract the synthetic survey from a URL served by a local HTTP server
+- ``model``: upload a model zip and extract it into ``bert_model/``; all
+  sessions upload the same model unless ``--models`` is larger than 1
+- ``rerun``: plain reruns of the Harmonizer page
+- ``nan_drop``, ``merge``, ``select``, ``export``: the Harmonizer page's buttons
+
+Steps that start background jobs last until the jobs' results are attached,
+polling them the way the browser does. The report gives, per step and for
+every script run, latency percentiles and errors; the server's resident
+memory before, at the peak and after the workflows, divided by the number of
+sessions; and the workspace each session left on disk.
+
+The server runs under benchmarks/audit.py, which logs the files written,
+renamed and removed under its working directory with the session they were
+done for. They are checked for cross-session interference:
+
+- a file written in place, moved away or removed by another session than the
+  one that last wrote it (e.g. two sessions extracting into ``bert_model/`` or
+  writing the same file under ``./data`` at the same time)
+- the areas (``bert_model``, ``data/downloads``, ...) several sessions wrote
+  to within ``--window`` seconds of each other, which is expected for shared
+  caches but shows where sessions contend
+
+The exit code is 1 if a session could not finish its workflow or any
+interference was found. A session stops when one of the steps the Harmonizer
+page needs (``home``, ``dictionary``, ``extract``) fails, including when the
+app itself reports the error, and the report lists the steps it never ran.
+Errors the app reports in later steps (such as a step whose optional
+dependencies are missing) are reported but do not fail the run.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import psutil
+import requests
+from tornado.websocket import websocket_connect
+
+from benchmarks import synthetic
+from benchmarks.run import REPO, serve
+
+STEPS = ("home", "dictionary", "extract", "model", "rerun", "nan_drop", "merge", "select", "export")
+# the Harmonizer page needs a standardized dictionary and extracted data
+REQUIRED = ("home", "dictionary", "extract")
+PERCENTILES = (50, 90, 95, 99)
+# writes by two sessions closer than this count as happening at the same time
+WINDOW_SECONDS = 1.0
+MEMORY_SAMPLE_SECONDS = 0.2
+MAX_MESSAGE_BYTES = 1024 ** 3
+# fields of WidgetState holding each widget's value
+VALUE_FIELDS = {
+    "checkbox": "bool_value",
+    "text_input": "string_value",
+    "selectbox": "string_value",
+    "multiselect": "string_array_value",
+    "file_uploader": "file_uploader_state_value",
+}
+
+
+class LoadError(Exception):
+    """A session could not go on with its workflow."""
+
+
+class Session:
+    """A browser tab connected to the app over Streamlit's websocket protocol."""
+
+    def __init__(self, index, base_url, timeout):
+        """
+        Parameters:
+        index (int): Number of the session in the reports
+        base_url (str): URL of the app server
+        timeout (float): Longest a script run or a job may take, in seconds
+        """
+        self.index = index
+        self.base_url = base_url
+        self.timeout = timeout
+        self.id = None
+        self.ws = None
+        self.pages = {}
+        self.page = ""
+        # widget id -> (element type, label, fragment id), as rendered by the latest runs
+        self.widgets = {}
+        # widget id -> (WidgetState field, value) set by the workflow
+        self.values = {}
+        self.auto_reruns = {}
+        self.run_done = None
+        self.uploads = {}
+        self.shown_errors = set()
+        self.new_errors = []
+        self.runs = []
+        self.steps = []
+        self.reader = None
+
+    async def connect(self):
+        url = self.base_url.replace("http", "ws", 1) + "/_stcore/stream"
+        self.ws = await websocket_connect(url, max_message_size=MAX_MESSAGE_BYTES)
+        self.reader = asyncio.ensure_future(self._read())
+
+    async def close(self):
+        if self.ws is not None:
+            self.ws.close()
+        if self.reader is not None:
+            await asyncio.gather(self.reader, return_exceptions=True)
+
+    async def _read(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        while True:
+            data = await self.ws.read_message()
+            if data is None:
+                self._finish_run(LoadError("The server closed the connection"))
+                return
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            self._handle(msg)
+
+    def _handle(self, msg):
+        from streamlit.proto.Alert_pb2 import Alert
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        kind = msg.WhichOneof("type")
+        if kind == "new_session":
+            if msg.new_session.HasField("initialize"):
+                self.id = msg.new_session.initialize.session_id
+            fragments = set(msg.new_session.fragment_ids_this_run)
+            if fragments:
+                self.widgets = {k: w for k, w in self.widgets.items() if w[2] not in fragments}
+            else:
+                self.widgets = {}
+                self.auto_reruns = {}
+        elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+            element = msg.delta.new_element
+            element_type = element.WhichOneof("type")
+            proto = getattr(element, element_type) if element_type else None
+            if element_type in VALUE_FIELDS or element_type == "button":
+                self.widgets[proto.id] = (element_type, proto.label, msg.delta.fragment_id)
+            elif element_type == "exception":
+                self._error(f"{proto.type}: {proto.message}")
+            elif element_type == "alert" and proto.format == Alert.ERROR:
+                self._error(proto.body)
+        elif kind == "navigation":
+            self.pages = {page.url_pathname: page.page_script_hash for page in msg.navigation.app_pages}
+        elif kind == "auto_rerun":
+            self.auto_reruns[msg.auto_rerun.fragment_id] = msg.auto_rerun.interval
+        elif kind == "file_urls_response":
+            future = self.uploads.pop(msg.file_urls_response.response_id, None)
+            if future is not None and not future.done():
+                future.set_result(msg.file_urls_response)
+        elif kind == "page_not_found":
+            self._error(f"Page not found: {msg.page_not_found.page_name}")
+        elif kind == "script_finished":
+            if msg.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                self._finish_run(None)
+
+    def _error(self, text):
+        if text not in self.shown_errors:
+            self.shown_errors.add(text)
+            self.new_errors.append(text)
+
+    def _finish_run(self, error):
+        if self.run_done is not None and not self.run_done.done():
+            if error is None:
+                self.run_done.set_result(None)
+            else:
+                self.run_done.set_exception(error)
+
+    async def _send(self, back_msg):
+        await self.ws.write_message(back_msg.SerializeToString(), binary=True)
+
+    async def rerun(self, fragment_id="", auto=False, trigger=None):
+        """
+        Ask the server for a script run, as the browser does after an interaction, and wait for it.
+
+        Parameters:
+        fragment_id (str): Fragment to rerun, or "" for the whole page
+        auto (bool): Whether this is the periodic rerun of a fragment with run_every
+        trigger (str | None): Id of the button clicked
+
+        Returns:
+        float: Duration of the run in seconds
+        """
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        msg = BackMsg()
+        client_state = msg.rerun_script
+        client_state.page_script_hash = self.pages.get(self.page, "")
+        client_state.page_name = self.page
+        client_state.fragment_id = fragment_id
+        client_state.is_auto_rerun = auto
+        for widget_id, (field, value) in self.values.items():
+            state = client_state.widget_states.widgets.add(id=widget_id)
+            if field == "string_array_value":
+                state.string_array_value.data.extend(value)
+            elif field == "file_uploader_state_value":
+                state.file_uploader_state_value.CopyFrom(value)
+            else:
+                setattr(state, field, value)
+        if trigger is not None:
+            client_state.widget_states.widgets.add(id=trigger, trigger_value=True)
+
+        self.run_done = asyncio.get_running_loop().create_future()
+        start = time.perf_counter()
+        await self._send(msg)
+        try:
+            await asyncio.wait_for(self.run_done, self.timeout)
+        except asyncio.TimeoutError:
+            raise LoadError(f"Script run still going after {self.timeout}s") from None
+        seconds = time.perf_counter() - start
+        self.runs.append(seconds)
+        return seconds
+
+    async def open_page(self, page=""):
+        """Switch to a page by its URL path ("" for Home), forgetting the widget values of the previous one."""
+        if page and page not in self.pages:
+            raise LoadError(f"No page '{page}' in {sorted(self.pages)}")
+        self.page = page
+        self.values = {}
+        await self.rerun()
+
+    def widget(self, element_type, label=None, key=None):
+        """Return the id and fragment of a widget rendered by the latest runs, by its label or key."""
+        for widget_id, (type_, widget_label, fragment_id) in self.widgets.items():
+            if type_ == element_type and (widget_label == label if key is None else widget_id.endswith(f"-{key}")):
+                return widget_id, fragment_id
+        raise LoadError(f"No {element_type} '{key or label}' on the page")
+
+    def has_button(self, label):
+        return any(type_ == "button" and widget_label == label for type_, widget_label, _ in self.widgets.values())
+
+    async def set_value(self, element_type, value, label=None, key=None):
+        widget_id, fragment_id = self.widget(element_type, label, key)
+        self.values[widget_id] = (VALUE_FIELDS[element_type], value)
+        await self.rerun(fragment_id)
+
+    async def click(self, label):
+        widget_id, fragment_id = self.widget("button", label)
+        await self.rerun(fragment_id, trigger=widget_id)
+
+    async def upload(self, label, name, data):
+        """Upload a file to a file uploader, as the browser does before the rerun."""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.Common_pb2 import FileUploaderState
+
+        widget_id, fragment_id = self.widget("file_uploader", label)
+        msg = BackMsg()
+        msg.file_urls_request.request_id = uuid.uuid4().hex
+        msg.file_urls_request.file_names.append(name)
+        msg.file_urls_request.session_id = self.id
+        future = asyncio.get_running_loop().create_future()
+        self.uploads[msg.file_urls_request.request_id] = future
+        await self._send(msg)
+        response = await asyncio.wait_for(future, self.timeout)
+        if response.error_msg:
+            raise LoadError(f"Upload of {name} refused: {response.error_msg}")
+        urls = response.file_urls[0]
+
+        def put():
+            r = requests.put(self.base_url + urls.upload_url, files={"file": (name, data)}, timeout=self.timeout)
+            r.raise_for_status()
+
+        await asyncio.to_thread(put)
+        state = FileUploaderState(max_file_id=0)
+        state.uploaded_file_info.add(name=name, size=len(data), file_id=urls.file_id).file_urls.CopyFrom(urls)
+        self.values[widget_id] = ("file_uploader_state_value", state)
+        await self.rerun(fragment_id)
+
+    async def settle(self):
+        """Poll the page's running jobs like the browser does, until their results are attached."""
+        deadline = time.monotonic() + self.timeout
+        while self.auto_reruns:
+            if time.monotonic() > deadline:
+                raise LoadError(f"Jobs still running after {self.timeout}s")
+            fragment_id, interval = min(self.auto_reruns.items(), key=lambda item: item[1])
+            await asyncio.sleep(interval)
+            await self.rerun(fragment_id, auto=True)
+
+    async def step(self, name, action):
+        """
+        Run and time one workflow step, recording the errors it raised or the app showed.
+
+        Returns:
+        bool: Whether the step went without errors
+        """
+        self.new_errors = []
+        error = None
+        start = time.perf_counter()
+        try:
+            await action()
+        except LoadError as e:
+            error = str(e)
+        seconds = time.perf_counter() - start
+        errors = ([error] if error else []) + self.new_errors
+        self.steps.append({"step": name, "seconds": seconds, "errors": errors})
+        if errors:
+            logging.warning(f"  session {self.index} {name}: {errors[0]}")
+        return not errors
+
+
+async def workflow(session, inputs, reruns, think):
+    """
+    Run the scripted workflow of one session.
+
+    Parameters:
+    session (Session): Connected session
+    inputs (dict): "url" of the survey, "extensions" to extract, "dictionary" CSV bytes and "model" zip bytes
+    reruns (int): Plain reruns of the Harmonizer page
+    think (float): Pause between steps, in seconds
+
+    Returns:
+    bool: Whether the session finished its workflow
+    """
+    async def dictionary():
+        await session.open_page("Dictionary_Standarization")
+        await session.upload("Choose a CSV or Excel file", "dictionary.csv", inputs["dictionary"])
+        await session.click("Standardize Dictionary")
+
+    async def extract():
+        await session.open_page("Extractor")
+        await session.set_value("selectbox", "URL", label="Choose data source")
+        await session.set_value("text_input", inputs["url"], key="url_input")
+        await session.set_value("multiselect", inputs["extensions"], key="extensions")
+        await session.click("Extract Data from URL")
+        await session.settle()
+
+    async def model():
+        await session.open_page("Harmonizer")
+        await session.upload("Upload model (zip with a model folder inside)", "model.zip", inputs["model"])
+        await session.click("Upload & Extract Model")
+
+    async def rerun():
+        for _ in range(reruns):
+            await session.rerun()
+
+    async def nan_drop():
+        if session.has_button("Profile missing values"):
+            await session.click("Profile missing values")
+            await session.settle()
+        await session.click("Drop NaN Columns")
+        await session.settle()
+
+    async def click(label):
+        await session.click(label)
+        await session.settle()
+
+    steps = {
+        "home": session.open_page,
+        "dictionary": dictionary,
+        "extract": extract,
+        "model": model,
+        "rerun": rerun,
+        "nan_drop": nan_drop,
+        "merge": lambda: click("Run Vertical Merge"),
+        "select": lambda: click("Run Data Selector"),
+        "export": lambda: click("Prepare downloads"),
+    }
+    blocked = False
+    for name in STEPS:
+        if blocked and name not in REQUIRED:
+            return False
+        if not await session.step(name, steps[name]) and name in REQUIRED:
+            blocked = True
+        if think:
+            await asyncio.sleep(think)
+    return not blocked
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Server:
+    """A ``streamlit run`` server of the app, logging the files it writes."""
+
+    def __init__(self, app_dir, audit_log, scheduler):
+        self.app_dir = Path(app_dir)
+        self.audit_log = Path(audit_log)
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ, S4H_DASK_SCHEDULER=scheduler,
+                   PYTHONPATH=os.pathsep.join(filter(None, [str(REPO), os.environ.get("PYTHONPATH")])))
+        self.log = open(self.app_dir.parent / "server.log", "ab")
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.audit", str(self.audit_log), "run", str(REPO / "Home.py"),
+             "--server.headless=true", f"--server.port={self.port}", "--server.address=127.0.0.1",
+             # the load test uploads with plain HTTP requests, without the browser's XSRF cookie
+             "--server.enableXsrfProtection=false", "--server.fileWatcherType=none",
+             "--browser.gatherUsageStats=false"],
+            cwd=self.app_dir, env=env, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise LoadError(f"The server exited with code {self.process.returncode}, see "
+                                f"{self.app_dir.parent / 'server.log'}")
+            try:
+                if requests.get(self.url + "/_stcore/health", timeout=1).ok:
+                    return
+            except requests.ConnectionError:
+                pass
+            time.sleep(0.2)
+        raise LoadError(f"The server did not start within {timeout}s")
+
+    def rss(self):
+        """Resident memory of the server and its child processes (e.g. Dask workers), in bytes."""
+        try:
+            process = psutil.Process(self.process.pid)
+            return sum(p.memory_info().rss for p in [process] + process.children(recursive=True))
+        except psutil.Error:
+            return None
+
+    def stop(self):
+        self.process.terminate()
+        try:
+            self.process.wait(30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.log.close()
+
+
+def percentiles(values):
+    """Return the count, percentiles and maximum of latencies."""
+    if not values:
+        return {"count": 0}
+    result = {"count": len(values)}
+    result.update((f"p{p}", float(v)) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)))
+    result["max"] = float(max(values))
+    return result
+
+
+def load_audit(path):
+    if not Path(path).exists():
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _area(path, root):
+    """Return the directory a write is reported under: bert_model, data/<subsystem> or a session's workspace."""
+    parts = Path(os.path.relpath(path, root)).parts
+    if parts and parts[0] == "..":
+        return path
+    depth = 1
+    if parts[0] == "data" and len(parts) > 2:
+        depth = 3 if parts[1] == "workspace" and len(parts) > 3 else 2
+    return "/".join(parts[:depth])
+
+
+def interference(events, root, names, window=WINDOW_SECONDS):
+    """
+    Find files sessions wrote over each other and areas they wrote to at the same time.
+
+    Events are replayed in order while tracking which session last wrote each
+    file that still exists, so a session writing in place, moving or removing
+    a file another session wrote is reported, while files a session moved
+    away or removed no longer belong to anyone.
+
+    Parameters:
+    events (list): Entries of the audit log
+    root (str): Working directory of the server, for reporting relative paths
+    names (dict): Session id -> name used in the report
+    window (float): Writes closer than this are simultaneous
+
+    Returns:
+    dict: "conflicts" (list of dicts with "kind", "path", "sessions", "files", "time")
+    and "areas" (area -> "writes", "sessions" and whether several sessions wrote to it "concurrently")
+    """
+    def name(session):
+        return names.get(session, session or "server")
+
+    def rel(path):
+        return os.path.relpath(path, root)
+
+    owners = {}
+    conflicts = {}
+
+    def conflict(kind, path, by, owner, time_, files=1):
+        entry = conflicts.setdefault((kind, path), {"kind": kind, "path": rel(path), "sessions": [], "files": 0,
+                                                    "time": time_})
+        for session in (owner, by):
+            if name(session) not in entry["sessions"]:
+                entry["sessions"].append(name(session))
+        entry["files"] += files
+
+    def foreign(path, session):
+        owner = owners.get(path)
+        return owner if owner is not None and None not in (owner[0], session) and owner[0] != session else None
+
+    areas = {}
+    for e in sorted(events, key=lambda e: e["time"]):
+        session, t = e["session"], e["time"]
+        for path in filter(None, (e["path"], e["target"])):
+            area = areas.setdefault(_area(path, root), {"writes": 0, "sessions": set(), "last": {},
+                                                         "concurrently": False})
+            area["writes"] += 1
+            if session is not None:
+                area["sessions"].add(session)
+                area["concurrently"] |= any(other != session and t - last <= window
+                                            for other, last in area["last"].items())
+                area["last"][session] = t
+
+        if e["kind"] == "write":
+            owner = foreign(e["path"], session)
+            if owner is not None:
+                kind = "concurrent writes" if t - owner[1] <= window else "overwrote another session's file"
+                conflict(kind, e["path"], session, owner[0], t)
+            owners[e["path"]] = (session, t)
+        elif e["kind"] == "rename":
+            prefix = os.path.join(e["path"], "") if e["path"] else None
+            moved = {p: o for p, o in owners.items() if prefix and (p == e["path"] or p.startswith(prefix))}
+            others = [o for o in (foreign(p, session) for p in moved) if o is not None]
+            if others:
+                conflict("moved another session's file", e["path"], session, others[0][0], t, len(others))
+            for p in moved:
+                del owners[p]
+            if e["target"]:
+                for p in moved:
+                    owners[e["target"] + p[len(e["path"]):]] = (session, t)
+                if not moved:
+                    owners[e["target"]] = (session, t)
+        else:
+            prefix = os.path.join(e["path"], "")
+            removed = [p for p in owners if p == e["path"] or p.startswith(prefix)]
+            others = [o for o in (foreign(p, session) for p in removed) if o is not None]
+            if others:
+                conflict("removed another session's files", e["path"], session, others[0][0], t, len(others))
+            for p in removed:
+                del owners[p]
+
+    return {
+        "conflicts": sorted(conflicts.values(), key=lambda c: c["time"]),
+        "areas": {area: {"writes": a["writes"], "sessions": len(a["sessions"]), "concurrently": a["concurrently"]}
+                  for area, a in sorted(areas.items())},
+    }
+
+
+def directory_size(path):
+    return sum(p.stat().st_size for p in Path(path).rglob("*") if p.is_file())
+
+
+async def run_level(n, inputs, args, data_dir):
+    """Start a fresh server, run n sessions on it at once and collect their measurements."""
+    app_dir = data_dir / "app"
+    shutil.rmtree(app_dir, ignore_errors=True)
+    app_dir.mkdir(parents=True)
+    audit_log = data_dir / f"audit-{n}.jsonl"
+    audit_log.unlink(missing_ok=True)
+    server = Server(app_dir, audit_log, args.scheduler)
+    memory = []
+    try:
+        server.wait_ready(args.timeout)
+        # load the app's modules once, so that the baseline is what an idle server holds
+        warmup = Session(0, server.url, args.timeout)
+        await warmup.connect()
+        await warmup.open_page()
+        await warmup.close()
+        await asyncio.sleep(1)
+        baseline = server.rss()
+
+        async def sample():
+            while True:
+                memory.append(server.rss())
+                await asyncio.sleep(MEMORY_SAMPLE_SECONDS)
+
+        sampler = asyncio.ensure_future(sample())
+        sessions = [Session(i + 1, server.url, args.timeout) for i in range(n)]
+
+        async def start(session):
+            await asyncio.sleep(args.ramp_up * (session.index - 1) / max(n - 1, 1))
+            await session.connect()
+            session_inputs = dict(inputs, model=inputs["models"][(session.index - 1) % len(inputs["models"])])
+            return await workflow(session, session_inputs, args.reruns, args.think)
+
+        start_time = time.perf_counter()
+        outcomes = await asyncio.gather(*(start(s) for s in sessions), return_exceptions=True)
+        seconds = time.perf_counter() - start_time
+        sampler.cancel()
+        retained = server.rss()
+        for session in sessions:
+            await session.close()
+    finally:
+        server.stop()
+
+    failed = {}
+    for session, outcome in zip(sessions, outcomes):
+        if isinstance(outcome, BaseException):
+            failed[session.index] = f"{type(outcome).__name__}: {outcome}"
+        elif not outcome:
+            failed[session.index] = next(f"{s['step']}: {s['errors'][0]}" for s in session.steps if s["errors"])
+
+    steps, skipped = {}, {}
+    for name in STEPS:
+        entries = [s for session in sessions for s in session.steps if s["step"] == name]
+        steps[name] = percentiles([s["seconds"] for s in entries if not s["errors"]])
+        steps[name]["errors"] = sum(bool(s["errors"]) for s in entries)
+        if len(entries) < n:
+            skipped[name] = n - len(entries)
+    errors = {}
+    for session in sessions:
+        for s in session.steps:
+            for text in s["errors"]:
+                key = f"{s['step']}: {text}"
+                errors[key] = errors.get(key, 0) + 1
+
+    peak = max((m for m in memory if m is not None), default=None)
+    workspace = app_dir / "data" / "workspace"
+    names = {s.id: f"session {s.index}" for s in sessions if s.id}
+    return {
+        "sessions": n,
+        "seconds": seconds,
+        "failed": failed,
+        "steps": steps,
+        "skipped": skipped,
+        "runs": percentiles([r for session in sessions for r in session.runs]),
+        "errors": dict(sorted(errors.items(), key=lambda item: -item[1])),
+        "memory": {
+            "baseline": baseline,
+            "peak": peak,
+            "retained": retained,
+            "peak_per_session": (peak - baseline) / n if peak and baseline else None,
+            "retained_per_session": (retained - baseline) / n if retained and baseline else None,
+            "workspace_per_session": directory_size(workspace) / n if workspace.exists() else 0,
+        },
+        "interference": interference(load_audit(audit_log), str(app_dir), names, args.window),
+    }
+
+
+def report(level):
+    """Format the results of one number of sessions as plain text."""
+    from cluster import format_bytes
+
+    def size(value):
+        return format_bytes(value) if value is not None else "-"
+
+    n = level["sessions"]
+    lines = [f"{n} session(s): {n - len(level['failed'])} finished, {len(level['failed'])} failed, "
+             f"{level['seconds']:.1f}s"]
+    header = "".join(f"{f'p{p}':>9}" for p in PERCENTILES)
+    lines.append(f"  {'step':<12}{'count':>6}{'errors':>7}{header}{'max':>9}")
+    for name, stats in list(level["steps"].items()) + [("script run", dict(level["runs"], errors=0))]:
+        values = "".join(f"{stats[f'p{p}']:>8.2f}s" if stats["count"] else f"{'-':>9}" for p in PERCENTILES)
+        top = f"{stats['max']:>8.2f}s" if stats["count"] else f"{'-':>9}"
+        lines.append(f"  {name:<12}{stats['count']:>6}{stats['errors']:>7}{values}{top}")
+    memory = level["memory"]
+    lines.append(f"  memory: {size(memory['baseline'])} idle, {size(memory['peak'])} peak "
+                 f"({size(memory['peak_per_session'])} per session), {size(memory['retained'])} after the "
+                 f"workflows ({size(memory['retained_per_session'])} per session), "
+                 f"{size(memory['workspace_per_session'])} of workspace per session")
+    for session, error in level["failed"].items():
+        lines.append(f"  session {session} failed: {error}")
+    if level["skipped"]:
+        lines.append("  steps never run: " + ", ".join(f"{name} in {count} session(s)"
+                                                       for name, count in level["skipped"].items()))
+    if level["errors"]:
+        lines.append("  errors:")
+        lines.extend(f"    {count}x {text}" for text, count in level["errors"].items())
+    found = level["interference"]
+    shared = {area: a for area, a in found["areas"].items() if a["sessions"] > 1}
+    if shared:
+        lines.append("  written by several sessions:")
+        lines.extend(f"    {area}: {a['writes']} writes by {a['sessions']} sessions"
+                     f"{', at the same time' if a['concurrently'] else ''}" for area, a in shared.items())
+    if found["conflicts"]:
+        lines.append("  interference:")
+        lines.extend(f"    {c['kind']}: {c['path']} ({', '.join(c['sessions'])}; {c['files']} file(s))"
+                     for c in found["conflicts"])
+    else:
+        lines.append("  no interference between sessions")
+    return "\n".join(lines)
+
+
+def prepare_inputs(data_dir, scale, files, models, model_mb):
+    """Write the survey, dictionary and model zips every session uses."""
+    directory = data_dir / "synthetic" / f"{scale}-csv-{files}"
+    if not (directory / ".complete").exists():
+        shutil.rmtree(directory, ignore_errors=True)
+        logging.info(f"Writing {synthetic.SCALES[scale]} rows of csv data in {files} file(s)")
+        paths = synthetic.write_survey(directory, synthetic.SCALES[scale], files, "csv")
+        if files > 1:
+            synthetic.archive(paths, directory / "survey.zip")
+        (directory / ".complete").touch()
+    zips = []
+    for i in range(models):
+        path = data_dir / "synthetic" / f"model-{i + 1}-{model_mb}mb.zip"
+        if not path.exists():
+            synthetic.model_archive(path, model_mb, seed=i)
+        zips.append(path.read_bytes())
+    return {
+        "path": f"{directory.name}/{'survey.zip' if files > 1 else 'survey_01.csv'}",
+        "extensions": [".csv", ".zip"] if files > 1 else [".csv"],
+        "dictionary": synthetic.dictionary().to_csv(index=False).encode("utf-8"),
+        "models": zips,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test one socio4health server with concurrent sessions.")
+    parser.add_argument("--sessions", nargs="+", type=int, default=[1, 4], help="Concurrent sessions, one run each")
+    parser.add_argument("--scale", default="10k", choices=list(synthetic.SCALES), help="Rows of the survey")
+    parser.add_argument("--files", type=int, default=2, help="Number of files the survey is split into")
+    parser.add_argument("--models", type=int, default=1, help="Distinct model zips the sessions upload")
+    parser.add_argument("--model-mb", type=float, default=20, help="Size of each model zip")
+    parser.add_argument("--reruns", type=int, default=3, help="Plain reruns of the Harmonizer page per session")
+    parser.add_argument("--ramp-up", type=float, default=0, help="Seconds over which the sessions start")
+    parser.add_argument("--think", type=float, default=0, help="Pause between the steps of a session")
+    parser.add_argument("--timeout", type=float, default=1800, help="Longest a script run or job may take")
+    parser.add_argument("--window", type=float, default=WINDOW_SECONDS,
+                        help="Writes by two sessions closer than this many seconds are simultaneous")
+    parser.add_argument("--scheduler", default="threads", choices=("threads", "distributed"))
+    parser.add_argument("--data-dir", default="./data/load", help="Directory for synthetic data and the server")
+    parser.add_argument("--output", help="Results file (default: load-<time>.json in the data directory)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    data_dir = Path(args.data_dir).resolve()
+    inputs = prepare_inputs(data_dir, args.scale, args.files, args.models, args.model_mb)
+    inputs["url"] = f"{serve(data_dir / 'synthetic')}/{inputs.pop('path')}"
+
+    levels = []
+    for n in args.sessions:
+        logging.info(f"Running {n} concurrent session(s)")
+        level = asyncio.run(run_level(n, inputs, args, data_dir))
+        print(report(level))
+        if level["failed"]:
+            logging.error(f"{len(level['failed'])} of {n} session(s) did not finish their workflow; "
+                          f"steps never run: {', '.join(level['skipped']) or '-'}")
+        levels.append(level)
+
+    created = datetime.now(timezone.utc)
+    results = {
+        "created": created.isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scheduler": args.scheduler,
+        "scale": args.scale,
+        "files": args.files,
+        "levels": levels,
+    }
+    output = Path(args.output) if args.output else data_dir / f"load-{created:%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    logging.info(f"Results written to {output}")
+    return 1 if any(level["failed"] or level["interference"]["conflicts"] for level in levels) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
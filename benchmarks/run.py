@@ -0,0 +1,403 @@
+"""Headless benchmarks of the app on synthetic survey data.
+
+    python -m benchmarks.run --scales 10k 1m --formats csv fwf --files 1 20 \\
+        --baseline data/benchmarks/baseline.json
+
+Each scenario (number of rows x file format x number of files) drives
+``Home.py`` and the three pages with Streamlit's ``AppTest``, the way a user
+would, and times these flows:
+
+- ``home``: first run of the Home page
+- ``standardize``: standardization of the dictionary; AppTest cannot upload
+  files, so the function the Dictionary page calls on an upload is timed
+- ``fwf_specs``: the Dictionary page run that derives the fixed-width specs (fixed-width scenarios only)
+- ``extract``: extraction on the Extractor page from a URL served by a local
+  HTTP server, pointing to the file or, for several files, to a zip archive
+- ``harmonizer``: first run of the Harmonizer page with the extracted data
+- ``rerun``: median of plain reruns of the Harmonizer page
+- ``nan_drop``, ``merge``, ``select``, ``export``: the Harmonizer page's buttons
+
+Flows that start background jobs are timed until the job's result is
+attached to the session. Each flow also keeps the instrumentation records of
+the steps it ran. Results are written as JSON; ``--baseline`` compares them
+with earlier results and flags regressions (see benchmarks/compare.py), and
+``--save-baseline`` stores them as the new baseline. A failed flow ends its
+run, since the flows after it depend on it, and makes the exit status 1.
+
+All app data (workspace, ingestion, downloads, caches) goes to ``--data-dir``,
+and computations use the threaded Dask scheduler unless ``--scheduler
+distributed`` is given.
+"""
+
+import argparse
+import functools
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from benchmarks import compare, synthetic
+
+REPO = Path(__file__).resolve().parent.parent
+HOME = "Home.py"
+DICTIONARY_PAGE = "pages/1_Dictionary_Standarization.py"
+EXTRACTOR_PAGE = "pages/2_Extractor.py"
+HARMONIZER_PAGE = "pages/3_Harmonizer.py"
+
+FLOWS = ("home", "standardize", "fwf_specs", "extract", "harmonizer", "rerun", "nan_drop", "merge", "select",
+         "export")
+# session state handed from one page to the next, as it is when the user switches pages
+STATE_KEYS = ("workspace_id", "Data_Sources", "standardized_dict", "colnames", "colspecs", "coltypes", "is_fwf",
+              "ingested", "recipe")
+# emptied before each run, so that no run reuses what an earlier one extracted or standardized
+DATA_DIRS = ("workspace", "ingest", "downloads", "dictionaries", "recipes")
+POLL_SECONDS = 0.02
+
+
+class BenchmarkError(Exception):
+    """A flow could not be completed."""
+
+
+def configure(data_dir, scheduler):
+    """Point the app's data directories to data_dir; must run before the app modules are imported."""
+    data_dir = Path(data_dir).resolve()
+    os.environ.update({
+        "S4H_WORKSPACE_DIR": str(data_dir / "workspace"),
+        "S4H_INGEST_DIR": str(data_dir / "ingest"),
+        "S4H_DOWNLOAD_DIR": str(data_dir / "downloads"),
+        "S4H_DICTIONARY_DIR": str(data_dir / "dictionaries"),
+        "S4H_RECIPE_CACHE_DIR": str(data_dir / "recipes"),
+        "S4H_CACHE_DIR": str(data_dir / "cache"),
+        "S4H_DASK_SPILL_DIR": str(data_dir / "dask-spill"),
+        "S4H_DASK_SCHEDULER": scheduler,
+    })
+    return data_dir
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory):
+    """Serve a directory over HTTP on a free local port, returning its base URL."""
+    handler = functools.partial(_QuietHandler, directory=str(directory))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="s4h-bench-http").start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+class Page:
+    """A page driven headlessly, starting from a given session state."""
+
+    def __init__(self, script, state, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.at = AppTest.from_file(str(REPO / script), default_timeout=timeout)
+        for key, value in state.items():
+            self.at.session_state[key] = value
+        self.timeout = timeout
+
+    def run(self):
+        self.at.run()
+        if self.at.exception:
+            raise BenchmarkError(self.at.exception[0].value)
+        return self
+
+    def has_button(self, label):
+        return any(b.label == label for b in self.at.button)
+
+    def click(self, label):
+        buttons = [b for b in self.at.button if b.label == label]
+        if not buttons:
+            raise BenchmarkError(f"No '{label}' button on the page")
+        buttons[0].click()
+        return self.run()
+
+    def wait_for_jobs(self):
+        """Wait for the session's jobs to finish, then rerun so that their results are attached."""
+        from jobs import get_job_runner
+
+        runner = get_job_runner()
+        job_ids = list(self.at.session_state["jobs"]) if "jobs" in self.at.session_state else []
+        deadline = time.monotonic() + self.timeout
+        jobs = [runner.get(job_id) for job_id in job_ids]
+        jobs = [job for job in jobs if job is not None]
+        while not all(job.done for job in jobs):
+            if time.monotonic() > deadline:
+                raise BenchmarkError(f"Jobs still running after {self.timeout}s")
+            time.sleep(POLL_SECONDS)
+        # the first run attaches the results and requests a rerun, which AppTest leaves to the next run
+        self.run().run()
+        failed = [job for job in jobs if job.state == "error"]
+        if failed:
+            raise BenchmarkError(f"{failed[0].label} failed: {failed[0].error}")
+        return self
+
+    def state(self):
+        return {key: self.at.session_state[key] for key in STATE_KEYS if key in self.at.session_state}
+
+
+def summarize_steps(entries):
+    """Aggregate instrumentation records by step."""
+    steps = {}
+    for e in entries:
+        step = steps.setdefault(e["step"], {"calls": 0, "seconds": 0.0, "rss_growth": 0, "tasks": 0,
+                                            "rows_out": None})
+        step["calls"] += 1
+        step["seconds"] += e["wall"]
+        step["rss_growth"] = max(step["rss_growth"], e["rss_growth"] or 0)
+        step["tasks"] += e["tasks"] or e["transitions"] or 0
+        if e["depth"] == 0 or step["rows_out"] is None:
+            step["rows_out"] = e["rows_out"]
+    return steps
+
+
+def timed(flows, name, act):
+    """
+    Run and time one flow, recording its error instead of raising it.
+
+    Parameters:
+    flows (dict): Results of the run, updated in place
+    name (str): Flow name
+    act (callable): The flow; it may return its own duration in seconds, as a float
+
+    Returns:
+    bool: Whether the flow succeeded
+    """
+    from instrumentation import clear, records
+
+    clear()
+    error = None
+    start = time.perf_counter()
+    try:
+        seconds = act()
+    except Exception as e:
+        seconds, error = None, f"{type(e).__name__}: {e}"
+    if not isinstance(seconds, float):
+        seconds = time.perf_counter() - start
+    flows[name] = {"seconds": seconds, "error": error, "steps": summarize_steps(records())}
+    if error:
+        logging.warning(f"  {name}: failed after {seconds:.2f}s: {error}")
+    else:
+        logging.info(f"  {name}: {seconds:.3f}s")
+    return error is None
+
+
+def run_flows(source_url, fmt, files, reruns, timeout):
+    """
+    Run every flow once on one scenario.
+
+    Parameters:
+    source_url (str): URL of the survey file or archive
+    fmt (str): "csv" or "fwf"
+    files (int): Number of survey files
+    reruns (int): Number of plain reruns timed
+    timeout (float): Longest a page run or a job may take, in seconds
+
+    Returns:
+    dict: Flow name -> "seconds", "error" and "steps"
+    """
+    flows = {}
+    dictionary = synthetic.dictionary()
+    state = {}
+
+    timed(flows, "home", lambda: Page(HOME, {}, timeout).run())
+
+    def standardize():
+        from dictionaries import content_hash, standardize_dictionary
+
+        data = dictionary.to_csv(index=False).encode("utf-8")
+        standardized, _ = standardize_dictionary(content_hash(data), "dictionary.csv", data)
+        if standardized is None:
+            raise BenchmarkError("Standardization returned nothing")
+        state["standardized_dict"] = standardized
+
+    if not timed(flows, "standardize", standardize):
+        return flows
+
+    if fmt == "fwf":
+        page = Page(DICTIONARY_PAGE, state, timeout)
+
+        def fwf_specs():
+            page.run()
+            start = time.perf_counter()
+            page.at.toggle[0].set_value(True)
+            page.run()
+            seconds = time.perf_counter() - start
+            state.update(page.state())
+            if not state.get("colspecs"):
+                raise BenchmarkError("No column specs were derived")
+            return seconds
+
+        timed(flows, "fwf_specs", fwf_specs)
+
+    def extract():
+        page = Page(EXTRACTOR_PAGE, state, timeout).run()
+        page.at.selectbox[0].set_value("URL")
+        page.run()
+        extensions = [".csv" if fmt == "csv" else ".txt"] + ([".zip"] if files > 1 else [])
+        page.at.text_input(key="url_input").set_value(source_url)
+        page.at.multiselect(key="extensions").set_value(extensions)
+        page.run()
+        if fmt == "fwf":
+            page.at.toggle[0].set_value(True)
+            page.run()
+        start = time.perf_counter()
+        page.click("Extract Data from URL").wait_for_jobs()
+        seconds = time.perf_counter() - start
+        state.update(page.state())
+        if not state.get("Data_Sources"):
+            raise BenchmarkError("No datasets were extracted")
+        return seconds
+
+    if not timed(flows, "extract", extract):
+        return flows
+
+    harmonizer = Page(HARMONIZER_PAGE, state, timeout)
+    timed(flows, "harmonizer", harmonizer.run)
+
+    def rerun():
+        times = []
+        for _ in range(reruns):
+            start = time.perf_counter()
+            harmonizer.run()
+            times.append(time.perf_counter() - start)
+        return statistics.median(times)
+
+    def nan_drop():
+        if harmonizer.has_button("Profile missing values"):
+            harmonizer.click("Profile missing values").wait_for_jobs()
+        harmonizer.click("Drop NaN Columns").wait_for_jobs()
+
+    def export():
+        harmonizer.click("Prepare downloads").wait_for_jobs()
+        if not harmonizer.at.session_state["exports"]:
+            raise BenchmarkError("No files were exported")
+
+    timed(flows, "rerun", rerun)
+    timed(flows, "nan_drop", nan_drop)
+    timed(flows, "merge", lambda: harmonizer.click("Run Vertical Merge").wait_for_jobs())
+    timed(flows, "select", lambda: harmonizer.click("Run Data Selector").wait_for_jobs())
+    timed(flows, "export", export)
+    return flows
+
+
+def prepare_source(data_dir, scale, fmt, files):
+    """Write the synthetic files of a scenario once, returning their path relative to the served directory."""
+    name = f"{scale}-{fmt}-{files}"
+    directory = data_dir / "synthetic" / name
+    done = directory / ".complete"
+    if not done.exists():
+        shutil.rmtree(directory, ignore_errors=True)
+        logging.info(f"Writing {synthetic.SCALES[scale]} rows of {fmt} data in {files} file(s)")
+        paths = synthetic.write_survey(directory, synthetic.SCALES[scale], files, fmt)
+        if files > 1:
+            synthetic.archive(paths, directory / "survey.zip")
+        done.touch()
+    target = "survey.zip" if files > 1 else ("survey_01.csv" if fmt == "csv" else "survey_01.txt")
+    return f"{name}/{target}"
+
+
+def reset(data_dir):
+    import streamlit as st
+
+    for name in DATA_DIRS:
+        shutil.rmtree(data_dir / name, ignore_errors=True)
+    st.cache_data.clear()
+
+
+def run_scenario(data_dir, base_url, scale, fmt, files, repeat, reruns, timeout):
+    from instrumentation import peak_rss
+
+    source = prepare_source(data_dir, scale, fmt, files)
+    runs = []
+    for i in range(repeat):
+        logging.info(f"{scale}/{fmt}/{files} file(s), run {i + 1} of {repeat}")
+        reset(data_dir)
+        runs.append(run_flows(f"{base_url}/{source}", fmt, files, reruns, timeout))
+
+    flows = {}
+    for name in FLOWS:
+        results = [run[name] for run in runs if name in run]
+        if not results:
+            continue
+        errors = [r["error"] for r in results if r["error"]]
+        flows[name] = {
+            "seconds": statistics.median(r["seconds"] for r in results),
+            "runs": [r["seconds"] for r in results],
+            "error": errors[0] if errors else None,
+            "steps": results[-1]["steps"],
+        }
+    return {"scale": scale, "rows": synthetic.SCALES[scale], "format": fmt, "files": files,
+            "flows": flows, "peak_rss": peak_rss()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the socio4health app headlessly on synthetic data.")
+    parser.add_argument("--scales", nargs="+", default=["10k"], choices=list(synthetic.SCALES),
+                        help="Total rows of each scenario")
+    parser.add_argument("--formats", nargs="+", default=list(synthetic.FORMATS), choices=synthetic.FORMATS)
+    parser.add_argument("--files", nargs="+", type=int, default=[1, 4], help="Number of files the rows are split into")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs of each scenario; the median is kept")
+    parser.add_argument("--reruns", type=int, default=5, help="Plain reruns timed per run")
+    parser.add_argument("--timeout", type=float, default=3600, help="Longest a page run or job may take, in seconds")
+    parser.add_argument("--scheduler", default="threads", choices=("threads", "distributed"))
+    parser.add_argument("--data-dir", default="./data/benchmarks", help="Directory for synthetic and app data")
+    parser.add_argument("--output", help="Results file (default: results-<time>.json in the data directory)")
+    parser.add_argument("--baseline", help="Earlier results to compare with")
+    parser.add_argument("--save-baseline", help="Also store the results as this baseline")
+    parser.add_argument("--tolerance", type=float, default=compare.TOLERANCE, help="Relative slowdown allowed")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    os.chdir(REPO)
+    data_dir = configure(args.data_dir, args.scheduler)
+    base_url = serve(data_dir / "synthetic")
+
+    scenarios = []
+    for scale in args.scales:
+        for fmt in args.formats:
+            for files in args.files:
+                scenarios.append(run_scenario(data_dir, base_url, scale, fmt, files, args.repeat, args.reruns,
+                                              args.timeout))
+    created = datetime.now(timezone.utc)
+    results = {
+        "created": created.isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "scheduler": args.scheduler,
+        "scenarios": scenarios,
+    }
+
+    output = Path(args.output) if args.output else data_dir / f"results-{created:%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    logging.info(f"Results written to {output}")
+    if args.save_baseline:
+        Path(args.save_baseline).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(output, args.save_baseline)
+        logging.info(f"Baseline saved to {args.save_baseline}")
+
+    failed = [f"{scenario['scale']}/{scenario['format']}/{scenario['files']} {name}: {flow['error']}"
+              for scenario in scenarios for name, flow in scenario["flows"].items() if flow["error"]]
+    for failure in failed:
+        logging.error(f"Failed flow {failure}")
+    if args.baseline:
+        rows = compare.compare(compare.load_results(args.baseline), results, args.tolerance)
+        print(compare.report(rows))
+        return 1 if failed or compare.has_regressions(rows) else 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
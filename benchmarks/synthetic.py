@@ -0,0 +1,197 @@
+"""Synthetic household survey microdata and its dictionary.
+
+The variables mimic a labour-force survey: identifiers with leading zeros,
+small integer codes with documented answers, incomes and weights, and
+questions only some respondents answer, including one that is missing for
+most rows so that NaN cleaning has something to drop. Files are written as
+CSV or as fixed-width text matching the positions in the dictionary, in
+latin1, in chunks so that the largest scales never need to fit in memory.
+"""
+
+import json
+import os
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000, "10m": 10_000_000}
+FORMATS = ("csv", "fwf")
+CHUNK_ROWS = 500_000
+
+# name, question, category, declared type, width, possible answers, share of missing values
+VARIABLES = (
+    ("DIRECTORIO", "Household identifier", "Identification", "char", 8, None, 0.0),
+    ("ORDEN", "Person number within the household", "Identification", "int", 2, None, 0.0),
+    ("AREA", "Department code", "Housing", "char", 2, None, 0.0),
+    ("P6020", "Sex", "Identification", "int", 1, "1. Man; 2. Woman", 0.0),
+    ("P6040", "Age in completed years", "Identification", "int", 3, None, 0.0),
+    ("P6210", "Highest education level attained", "Education", "int", 1,
+     "1. No schooling; 2. Preschool; 3. Primary; 4. Lower secondary; 5. Upper secondary; 6. Higher; 9. Unknown", 0.05),
+    ("P6170", "Currently attends school", "Education", "int", 1, "1. Yes; 2. No", 0.1),
+    ("P5090", "Tenure of the dwelling", "Housing", "int", 1,
+     "1. Owned, paid; 2. Owned, paying; 3. Rented; 4. Usufruct; 5. Occupied; 6. Other", 0.0),
+    ("P6090", "Affiliated to a health insurance", "Social Security", "int", 1, "1. Yes; 2. No; 9. Unknown", 0.02),
+    ("P7020", "Lived elsewhere five years ago", "Migration", "int", 1, "1. Yes; 2. No", 0.7),
+    ("P6430", "Position in main job", "Nonstandard job", "int", 1,
+     "1. Employee; 2. Government; 3. Domestic; 4. Own account; 5. Employer; 6. Unpaid; 9. Other", 0.4),
+    ("INGLABO", "Monthly labour income", "Business", "float", 12, None, 0.5),
+    ("P3271", "Children born alive", "Fertility", "int", 2, None, 0.95),
+    ("FEX_C", "Expansion factor", "Identification", "float", 12, None, 0.0),
+)
+
+
+def dictionary():
+    """
+    Return the dictionary of the synthetic survey, in the raw layout s4h_standardize_dict() expects.
+
+    Returns:
+    pd.DataFrame: For each variable, a row with its question, category, declared type and fixed-width position,
+    followed by one row per possible answer with its value and description
+    """
+    rows, position = [], 1
+    for name, question, category, kind, width, answers, _ in VARIABLES:
+        rows.append({
+            "question": question,
+            "variable_name": name,
+            "description": question,
+            "value": None,
+            "category": category,
+            "type": kind,
+            "initial_position": position,
+            "size": width,
+        })
+        for option in answers.split("; ") if answers else []:
+            value, description = option.split(". ", 1)
+            rows.append({"question": question, "variable_name": name, "description": description,
+                         "value": int(value)})
+        position += width
+    return pd.DataFrame(rows)
+
+
+def _codes(answers):
+    return [int(option.split(".")[0]) for option in answers.split("; ")]
+
+
+def generate(rows, rng, first_id=0):
+    """
+    Generate survey rows.
+
+    Parameters:
+    rows (int): Number of rows
+    rng (np.random.Generator): Random generator
+    first_id (int): Offset of the household identifiers
+
+    Returns:
+    pd.DataFrame: The rows, with missing values as NaN
+    """
+    data = {}
+    for name, _, _, kind, width, answers, missing in VARIABLES:
+        if name == "DIRECTORIO":
+            values = (first_id + np.arange(rows) // 4).astype(str)
+            values = np.char.zfill(values, width)
+        elif name == "AREA":
+            values = np.char.zfill(rng.integers(1, 100, rows).astype(str), width)
+        elif answers is not None:
+            values = rng.choice(_codes(answers), rows).astype(float)
+        elif name == "ORDEN":
+            values = (np.arange(rows) % 4 + 1).astype(float)
+        elif name == "P6040":
+            values = rng.integers(0, 100, rows).astype(float)
+        elif name == "P3271":
+            values = rng.integers(0, 11, rows).astype(float)
+        elif name == "INGLABO":
+            values = np.round(rng.lognormal(13.5, 0.8, rows), 2)
+        else:
+            values = np.round(rng.uniform(50, 900, rows), 4)
+        if missing:
+            values = np.where(rng.random(rows) < missing, np.nan, values)
+        data[name] = values
+    df = pd.DataFrame(data)
+    for name, _, _, kind, _, _, _ in VARIABLES:
+        if kind == "int":
+            df[name] = df[name].astype("Int64")
+    return df
+
+
+def _fwf_lines(df):
+    widths = [v[4] for v in VARIABLES]
+    out = np.full((len(df), sum(widths) + 1), ord(" "), dtype=np.uint8)
+    out[:, -1] = ord("\n")
+    start = 0
+    for (name, _, _, kind, width, _, _) in VARIABLES:
+        column = df[name]
+        if kind == "float":
+            text = column.map(lambda v: "" if pd.isna(v) else f"{v:.2f}")
+        else:
+            text = column.astype("string").fillna("")
+        # right-aligned like most survey files; values never exceed their width
+        raw = np.char.rjust(text.to_numpy(dtype=str), width).astype(f"S{width}")
+        out[:, start:start + width] = raw.view(np.uint8).reshape(len(df), width)
+        start += width
+    return out.tobytes()
+
+
+def write_survey(directory, rows, files, fmt, seed=0):
+    """
+    Write a synthetic survey split into several files.
+
+    Parameters:
+    directory (str): Directory the files are written to
+    rows (int): Total number of rows
+    files (int): Number of files the rows are split into
+    fmt (str): "csv" or "fwf"
+    seed (int): Random seed, so a scenario always has the same data
+
+    Returns:
+    list: Paths of the files
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    extension = ".csv" if fmt == "csv" else ".txt"
+    paths, first_id = [], 0
+    for i, n in enumerate(np.diff(np.linspace(0, rows, files + 1).astype(int))):
+        path = directory / f"survey_{i + 1:02d}{extension}"
+        with open(path, "wb") as f:
+            for start in range(0, n, CHUNK_ROWS):
+                df = generate(min(CHUNK_ROWS, n - start), rng, first_id)
+                first_id += len(df) // 4 + 1
+                if fmt == "csv":
+                    f.write(df.to_csv(index=False, header=start == 0, float_format="%.2f").encode("latin1"))
+                else:
+                    f.write(_fwf_lines(df))
+        paths.append(str(path))
+    return paths
+
+
+def model_archive(zip_path, megabytes, seed=0):
+    """
+    Write a zip shaped like an uploaded classification model: one folder with a config and weights.
+
+    The weights are random bytes, so the archive exercises model extraction
+    only; it cannot be loaded by transformers.
+
+    Parameters:
+    zip_path (str): Path of the archive
+    megabytes (float): Size of the weights file
+    seed (int): Random seed; different seeds give different models
+
+    Returns:
+    str: Path of the archive
+    """
+    rng = np.random.default_rng(seed)
+    config = {"architectures": ["BertForSequenceClassification"], "model_type": "bert", "seed": seed}
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("model/config.json", json.dumps(config, indent=2))
+        zf.writestr("model/model.safetensors", rng.bytes(int(megabytes * 1024 ** 2)))
+    return str(zip_path)
+
+
+def archive(paths, zip_path):
+    """Pack files into a zip archive, as surveys with several files are usually published."""
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as zf:
+        for path in paths:
+            zf.write(path, os.path.basename(path))
+    return str(zip_path)
@@ -0,0 +1,57 @@
+"""Small persistent key-value caches shared by all sessions.
+
+Each cache is a table in a SQLite file under ``S4H_CACHE_DIR`` (default
+``./data/cache``). SQLite handles concurrent readers and writers from several
+sessions and threads, and the cache survives restarts of the app.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+CACHE_DIR = Path(os.environ.get("S4H_CACHE_DIR", "./data/cache"))
+# SQLite limits the number of bound parameters per statement
+_CHUNK = 500
+
+
+class KeyValueCache:
+    """Persistent mapping from string keys to JSON-serializable values."""
+
+    def __init__(self, name, directory=None):
+        directory = Path(directory) if directory is not None else CACHE_DIR
+        directory.mkdir(parents=True, exist_ok=True)
+        self.path = directory / f"{name}.sqlite"
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        """Return the cached values of the keys that are present."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        conn = self._connect()
+        for i in range(0, len(keys), _CHUNK):
+            chunk = keys[i:i + _CHUNK]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(f"SELECT key, value FROM cache WHERE key IN ({placeholders})", chunk)
+            found.update((key, json.loads(value)) for key, value in rows)
+        return found
+
+    def set_many(self, items):
+        """Store several key/value pairs, replacing existing ones."""
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                             [(key, json.dumps(value)) for key, value in items.items()])
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
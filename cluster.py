@@ -0,0 +1,135 @@
+"""Shared Dask execution backend of the app.
+
+By default every session and background job computes with a
+``dask.distributed`` LocalCluster started once per server process. Its worker
+processes run the heavy steps outside the Streamlit process, and workers spill
+to ``S4H_DASK_SPILL_DIR`` (default ``./data/dask-spill``) instead of running out
+of memory. Where the cluster cannot be started (dask.distributed's
+SubprocessCluster does not run on Windows) or reached, the app computes in its
+own process with Dask's threaded scheduler. The cluster is configured with
+environment variables:
+
+- ``S4H_DASK_SCHEDULER``: "distributed" (default) or "threads" to compute in the app process
+- ``S4H_DASK_ADDRESS``: address of an existing scheduler to connect to instead
+- ``S4H_DASK_WORKERS``, ``S4H_DASK_THREADS_PER_WORKER``: cluster size (Dask defaults if unset)
+- ``S4H_DASK_MEMORY_LIMIT``: memory limit per worker, e.g. "4GB" (default "auto")
+"""
+
+import logging
+import os
+import time
+
+import streamlit as st
+
+SCHEDULER = os.environ.get("S4H_DASK_SCHEDULER", "distributed")
+ADDRESS = os.environ.get("S4H_DASK_ADDRESS")
+N_WORKERS = int(os.environ["S4H_DASK_WORKERS"]) if os.environ.get("S4H_DASK_WORKERS") else None
+THREADS_PER_WORKER = (int(os.environ["S4H_DASK_THREADS_PER_WORKER"])
+                      if os.environ.get("S4H_DASK_THREADS_PER_WORKER") else None)
+MEMORY_LIMIT = os.environ.get("S4H_DASK_MEMORY_LIMIT", "auto")
+SPILL_DIR = os.environ.get("S4H_DASK_SPILL_DIR", "./data/dask-spill")
+
+
+@st.cache_resource
+def get_dask_client():
+    """
+    Start (or connect to) the cluster shared by all sessions and make it Dask's default scheduler.
+
+    Returns:
+    Client | None: The distributed client, or None when computations run in the app process
+    """
+    if SCHEDULER != "distributed":
+        return None
+    try:
+        from dask.distributed import Client
+        from distributed.deploy.subprocess import SubprocessCluster
+    except ImportError:
+        logging.warning("dask.distributed is not installed; computing in the app process.")
+        return None
+
+    try:
+        if ADDRESS:
+            return Client(ADDRESS, set_as_default=True)
+        # Streamlit replaces __main__ with the page script, which multiprocessing would re-run in
+        # every worker it spawns; the scheduler and workers are therefore started as separate commands
+        worker_kwargs = {"local_directory": SPILL_DIR}
+        if MEMORY_LIMIT != "auto":
+            worker_kwargs["memory_limit"] = MEMORY_LIMIT
+        cluster = SubprocessCluster(
+            n_workers=N_WORKERS,
+            threads_per_worker=THREADS_PER_WORKER,
+            worker_kwargs=worker_kwargs,
+        )
+        return Client(cluster, set_as_default=True)
+    except Exception as e:
+        # e.g. SubprocessCluster raises RuntimeError on Windows
+        logging.warning(f"Could not start the Dask cluster ({e}); computing in the app process.")
+        return None
+
+
+def _transition_count(dask_scheduler):
+    return dask_scheduler.transition_counter
+
+
+def cluster_stats(client):
+    """
+    Summarize the workers of a cluster.
+
+    Returns:
+    dict: Per-worker "memory", "memory_limit", "spilled" and "executing",
+    and the scheduler's total task "transitions"
+    """
+    workers = {}
+    for address, info in client.scheduler_info(n_workers=-1)["workers"].items():
+        metrics = info.get("metrics", {})
+        workers[info.get("name", address)] = {
+            "memory": metrics.get("memory", 0),
+            "memory_limit": info.get("memory_limit", 0),
+            "spilled": metrics.get("spilled_bytes", {}).get("disk", 0),
+            "executing": metrics.get("task_counts", {}).get("executing", 0),
+        }
+    return {"workers": workers, "transitions": client.run_on_scheduler(_transition_count)}
+
+
+def format_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}"
+        n /= 1024
+    return f"{n:.1f} TB"
+
+
+def _render_cluster_panel():
+    client = get_dask_client()
+    st.subheader("Compute resources")
+    if client is None:
+        st.write("Computations run in the app process.")
+        return
+
+    try:
+        stats = cluster_stats(client)
+    except Exception as e:
+        st.warning(f"Cluster unavailable: {e}")
+        return
+
+    # throughput is measured between two refreshes of the panel
+    now = time.time()
+    last = st.session_state.get("cluster_sample")
+    st.session_state.cluster_sample = (now, stats["transitions"])
+    if last is not None and now > last[0]:
+        rate = (stats["transitions"] - last[1]) / (now - last[0])
+        st.write(f"Task transitions: {rate:.1f}/s")
+
+    for name, worker in stats["workers"].items():
+        limit = format_bytes(worker["memory_limit"]) if worker["memory_limit"] else "no limit"
+        st.write(f"Worker {name}: {format_bytes(worker['memory'])} of {limit}, "
+                 f"{format_bytes(worker['spilled'])} spilled, {worker['executing']} tasks running")
+    if client.dashboard_link:
+        st.markdown(f"[Dask dashboard]({client.dashboard_link})")
+    st.button("Refresh resources")
+
+
+def show_cluster_panel():
+    """Sidebar panel with the memory, spilled bytes and task throughput of the shared cluster."""
+    with st.sidebar:
+        st.fragment(_render_cluster_panel)()
@@ -0,0 +1,147 @@
+"""Dictionary parsing, standardization and fixed-width specs cached by content.
+
+The Dictionary Standardization page used to read the uploaded dictionary again
+on every rerun and to derive the fixed-width column specs on every interaction
+while the fixed-width toggle was on. Here an upload is identified by the
+SHA-256 of its content: the parsed dictionary and the fixed-width specs are
+kept in memory for all sessions, and the standardized dictionary is also
+written under ``S4H_DICTIONARY_DIR`` (default ``./data/dictionaries``), so a
+dictionary is standardized once and every later upload of the same file, in
+any session and after restarts, reuses the result. Stored results are JSON
+(never unpickled from the shared directory) and keyed by the installed
+socio4health version as well, so upgrading the library standardizes again.
+"""
+
+import hashlib
+import importlib.metadata
+import io
+import os
+import uuid
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from socio4health.utils import extractor_utils
+
+from fwf import declared_types
+from instrumentation import instrumented
+
+DICTIONARY_DIR = Path(os.environ.get("S4H_DICTIONARY_DIR", "./data/dictionaries"))
+SOCIO4HEALTH_VERSION = importlib.metadata.version("socio4health")
+
+
+def content_hash(data):
+    """Return the SHA-256 of the content of an uploaded file."""
+    return hashlib.sha256(data).hexdigest()
+
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def parse_dictionary(key, name, _data):
+    """
+    Read an uploaded dictionary, once per content.
+
+    Parameters:
+    key (str): Content hash of the file, from content_hash()
+    name (str): File name, whose extension tells CSV from Excel
+    _data (bytes | memoryview): Content of the file, not hashed by Streamlit
+
+    Returns:
+    pd.DataFrame: Raw dictionary
+    """
+    if name.endswith('.csv'):
+        return pd.read_csv(io.BytesIO(_data))
+    return pd.read_excel(io.BytesIO(_data))
+
+
+def _plain(value):
+    # socio4health leaves the positions of fixed-width variables as numpy arrays of one value
+    if isinstance(value, np.ndarray):
+        if value.size == 1:
+            return value.item()
+        return value.tolist() if value.size else np.nan
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def write_dictionary(dictionary, path):
+    """
+    Store a dictionary as JSON, never as a pickle that could run code when read back.
+
+    The table orient stores the dtypes, and mixed columns keep their numbers and
+    strings. The file is written under a private name first, so that sessions
+    writing the same dictionary never read half a file.
+
+    Parameters:
+    dictionary (pd.DataFrame): Dictionary, with numpy values in object columns converted by plain_dictionary()
+    path (Path): Destination file
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    dictionary.to_json(tmp_path, orient="table", index=False)
+    os.replace(tmp_path, path)
+
+
+def read_dictionary(path):
+    """Read a dictionary stored by write_dictionary()."""
+    with open(path, "r", encoding="utf-8") as f:
+        return pd.read_json(f, orient="table")
+
+
+def plain_dictionary(dictionary):
+    """Return a dictionary whose object columns hold plain Python values, as JSON can store them."""
+    dictionary = dictionary.copy()
+    for column in dictionary.columns[dictionary.dtypes == object]:
+        dictionary[column] = dictionary[column].map(_plain)
+    return dictionary
+
+
+def standardized_path(key):
+    return DICTIONARY_DIR / f"{key}.{SOCIO4HEALTH_VERSION}.json"
+
+
+@instrumented("Dictionary standardization")
+def standardize_dictionary(key, name, data):
+    """
+    Return the standardized dictionary of an upload, standardizing it only the first time.
+
+    Parameters:
+    key (str): Content hash of the file, from content_hash()
+    name (str): File name
+    data (bytes | memoryview): Content of the file
+
+    Returns:
+    tuple: Standardized dictionary (or None if standardization failed) and whether it came from the cache
+    """
+    path = standardized_path(key)
+    if path.exists():
+        return read_dictionary(path), True
+    from socio4health.utils import harmonizer_utils
+
+    raw = parse_dictionary(key, name, data)
+    if raw is None:
+        return None, False
+    standardized = harmonizer_utils.s4h_standardize_dict(raw)
+    if standardized is not None:
+        # the same values whether the dictionary was just standardized or read from the cache
+        standardized = plain_dictionary(standardized)
+        write_dictionary(standardized, path)
+    return standardized, False
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def fwf_specs(dictionary):
+    """
+    Derive the fixed-width column names, specs and declared types of a standardized dictionary.
+
+    Streamlit hashes the dictionary's content, so the specs are derived once per
+    dictionary and shared by every session.
+
+    Parameters:
+    dictionary (pd.DataFrame): Standardized dictionary
+
+    Returns:
+    tuple: Column names, (start, end) specs and declared type of each column
+    """
+    colnames, colspecs = extractor_utils.s4h_parse_fwf_dict(dictionary)
+    return colnames, colspecs, declared_types(dictionary)
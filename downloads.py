@@ -0,0 +1,302 @@
+"""Concurrent, resumable and cached downloads for URL extraction.
+
+Extractor downloads the files it scrapes one after the other and fetches all
+of them again when an extraction is retried. Here the scraped links are
+downloaded through one pooled HTTP session with at most ``S4H_MAX_DOWNLOADS``
+(default 4) transfers at a time. Interrupted transfers resume from where they
+stopped with HTTP range requests, and finished files are cached under
+``S4H_DOWNLOAD_DIR`` (default ``./data/downloads``): each URL keeps its ETag
+and Last-Modified validators, so a later extraction only asks the server
+whether the file changed and reuses it when it did not.
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from fwf import FwfExtractor
+from instrumentation import instrumented
+from jobs import current_job
+from sniffing import settings_for
+from workspace import write_datasets
+
+DOWNLOAD_DIR = Path(os.environ.get("S4H_DOWNLOAD_DIR", "./data/downloads"))
+MAX_DOWNLOADS = int(os.environ.get("S4H_MAX_DOWNLOADS", "4"))
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
+# archives Extractor unpacks, as in Extractor.compressed_ext
+COMPRESSED_EXTENSIONS = ('.zip', '.7z', '.tar', '.gz', '.tgz')
+
+# two sessions fetching the same URL must not write the same partial file;
+# url -> [lock, number of downloads holding or waiting for it]
+_url_locks = {}
+_url_locks_lock = threading.Lock()
+# the scraper writes its results to a fixed file in the working directory
+_scrape_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _url_lock(url):
+    with _url_locks_lock:
+        entry = _url_locks.setdefault(url, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        # the lock of a URL is dropped once no download uses it
+        with _url_locks_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _url_locks[url]
+
+
+class Downloader:
+    """Download files into a directory with a pooled session, resuming and reusing earlier transfers."""
+
+    def __init__(self, directory, max_workers=MAX_DOWNLOADS, progress=None):
+        """
+        Parameters:
+        directory (str): Directory of the downloaded files and their cache entries
+        max_workers (int): Maximum number of concurrent transfers
+        progress (callable | None): Called with (filename, fraction, text) as transfers advance
+        """
+        self.directory = Path(directory)
+        self.cache_dir = self.directory / ".cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_workers = max_workers
+        self.progress = progress
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers,
+                              max_retries=Retry(total=3, backoff_factor=1, status_forcelist=(502, 503, 504)))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _report(self, filename, fraction, text):
+        if self.progress is not None:
+            self.progress(filename, fraction, text)
+
+    def _meta_path(self, url):
+        return self.cache_dir / (hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def _load_meta(self, url):
+        path = self._meta_path(url)
+        if not path.exists():
+            return {}
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_meta(self, url, meta):
+        tmp_path = self._meta_path(url).with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._meta_path(url))
+
+    def download(self, url, filename):
+        """
+        Download one file, unless the cached copy is still current.
+
+        Parameters:
+        url (str): URL of the file
+        filename (str): Name of the file in the download directory
+
+        Returns:
+        str: Path of the downloaded file
+        """
+        with _url_lock(url):
+            return self._download(url, filename)
+
+    def _download(self, url, filename):
+        target = self.directory / filename
+        part = target.with_name(target.name + ".part")
+        meta = self._load_meta(url)
+
+        headers = {}
+        if meta.get("complete") and target.exists():
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        elif part.exists() and (meta.get("etag") or meta.get("last_modified")):
+            # resume only if the server still has the same version of the file
+            headers["Range"] = f"bytes={part.stat().st_size}-"
+            headers["If-Range"] = meta.get("etag") or meta["last_modified"]
+
+        with self.session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as response:
+            if response.status_code == 416 and "Range" in headers:
+                # the partial file is at least as large as the file on the server; start over
+                logging.info(f"Cannot resume {filename}; downloading it again")
+                part.unlink(missing_ok=True)
+                return self._download(url, filename)
+            if response.status_code == 304:
+                logging.info(f"Using cached download of {filename}")
+                self._report(filename, 1.0, "cached")
+                return str(target)
+            response.raise_for_status()
+
+            resumed = response.status_code == 206
+            done = part.stat().st_size if resumed else 0
+            length = response.headers.get("Content-Length")
+            total = done + int(length) if length is not None else None
+            meta = {
+                "url": url,
+                "filename": filename,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "complete": False,
+            }
+            self._save_meta(url, meta)
+            if resumed:
+                logging.info(f"Resuming {filename} at {done} bytes")
+
+            with open(part, "ab" if resumed else "wb") as f:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+                    done += len(chunk)
+                    if total:
+                        self._report(filename, done / total, f"{done / 1024 ** 2:.1f} of {total / 1024 ** 2:.1f} MB")
+                    else:
+                        self._report(filename, 0.0, f"{done / 1024 ** 2:.1f} MB")
+
+        os.replace(part, target)
+        meta["complete"] = True
+        self._save_meta(url, meta)
+        self._report(filename, 1.0, "done")
+        logging.info(f"Successfully downloaded: {filename}")
+        return str(target)
+
+    @instrumented("Download")
+    def download_all(self, links):
+        """
+        Download several files concurrently.
+
+        Parameters:
+        links (dict): File name -> URL
+
+        Returns:
+        tuple: Paths of the downloaded files and (file name, error) of the failed ones
+        """
+        def fetch(item):
+            filename, url = item
+            try:
+                return self.download(url, filename), None
+            except Exception as e:
+                logging.warning(f"Failed to download {filename}: {e}")
+                self._report(filename, 0.0, f"failed: {e}")
+                return None, (filename, str(e))
+
+        files, failed = [], []
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="s4h-download") as executor:
+            for path, error in executor.map(fetch, links.items()):
+                if error is None:
+                    files.append(path)
+                else:
+                    failed.append(error)
+        return files, failed
+
+
+def scrape_links(url, depth, down_ext, key_words):
+    """
+    Return the downloadable files found from a URL, as Extractor's scraper does.
+
+    A URL that already points to a file with one of the extensions, or to an
+    archive, is returned as is.
+
+    Returns:
+    dict: File name -> URL
+    """
+    if url.lower().split("?")[0].endswith(tuple(down_ext) + COMPRESSED_EXTENSIONS):
+        return {url.split("?")[0].rstrip("/").split("/")[-1]: url}
+
+    from socio4health.utils.extractor_utils import run_standard_spider
+
+    with _scrape_lock:
+        if not run_standard_spider(url, depth, down_ext, key_words):
+            raise ValueError(f"Web scraping of {url} failed")
+        with open("Output_scrap.json", "r", encoding="utf-8") as f:
+            links = json.load(f)
+        os.remove("Output_scrap.json")
+    return links
+
+
+def _stage(files, directory):
+    """Link (or copy) the downloaded files into a directory of their own for Extractor."""
+    os.makedirs(directory, exist_ok=True)
+    for path in files:
+        target = os.path.join(directory, os.path.basename(path))
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copy2(path, target)
+
+
+@instrumented("Extraction from URL")
+def download_and_extract(url, depth, key_words, options, directory):
+    """
+    Job body: find the files of a URL, download them concurrently and extract them into the workspace.
+
+    Parameters:
+    url (str): Page to scrape, or direct link to a file
+    depth (int): Scraping depth
+    key_words (list | None): Keywords the scraped links must contain
+    options (dict): Keyword arguments for FwfExtractor, including down_ext
+    directory (str): Workspace directory of the session
+
+    Returns:
+    list: Workspace handles of the extracted datasets
+    """
+    down_ext = list(options.get("down_ext") or [])
+    links = scrape_links(url, depth, down_ext, key_words or [])
+    if not links:
+        raise ValueError("No files were found at the URL. Please check the extensions and keywords.")
+    logging.info(f"Found {len(links)} files to download")
+
+    job = current_job()
+    progress = None
+    if job is not None:
+        def progress(filename, fraction, text):
+            job.progress[filename] = (fraction, text)
+
+    download_dir = DOWNLOAD_DIR / hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    files, failed = Downloader(download_dir, progress=progress).download_all(links)
+    if failed:
+        logging.warning(f"{len(failed)} of {len(links)} files could not be downloaded: "
+                        + ", ".join(name for name, _ in failed))
+    if not files:
+        raise ValueError("None of the files could be downloaded.")
+
+    # files are extracted in groups that share their detected separator and encoding
+    groups = {}
+    for path in files:
+        settings = settings_for(path, options.get("sep"), options.get("encoding"), options.get("is_fwf", False))
+        groups.setdefault(settings, []).append(path)
+
+    # only this run's files are extracted, not older downloads of the same URL
+    work_dir = tempfile.mkdtemp(prefix="s4h-extract-")
+    try:
+        result = []
+        for i, ((sep, encoding), paths) in enumerate(groups.items()):
+            _stage(paths, os.path.join(work_dir, f"input_{i}"))
+            # Extractor only opens files with one of down_ext, which a direct link to an archive may lack
+            archives = [ext for ext in COMPRESSED_EXTENSIONS
+                        if ext not in down_ext and any(p.lower().endswith(ext) for p in paths)]
+            extractor = FwfExtractor(input_path=os.path.join(work_dir, f"input_{i}"),
+                                     output_path=os.path.join(work_dir, f"extracted_{i}"),
+                                     **dict(options, sep=sep, encoding=encoding, down_ext=down_ext + archives))
+            result.extend(extractor.s4h_extract() or [])
+        if not result:
+            raise ValueError("No data was extracted. Please check your input.")
+        return write_datasets(result, directory)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,122 @@
+"""Export of workspace datasets to files for download.
+
+Datasets are written one partition at a time, so exporting never holds more
+than a partition in memory, as CSV, gzip-compressed CSV or Parquet. Archives
+are assembled from those files with ``zipfile`` streaming them from disk.
+Exports live in the session workspace (``_exports``) and are named after the
+dataset they come from; stored datasets never change, so each one is computed
+exactly once per format and later downloads are served from the file. They
+count towards the workspace quota and are garbage collected with their
+datasets (see workspace.collect_garbage).
+"""
+
+import gzip
+import hashlib
+import os
+import zipfile
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instrumentation import instrumented
+from workspace import enforce_quota, export_name, parquet_schema
+
+# label shown to the user: (file extension, mime type)
+FORMATS = {
+    "CSV": ("csv", "text/csv"),
+    "Compressed CSV (.csv.gz)": ("csv.gz", "application/gzip"),
+    "Parquet": ("parquet", "application/octet-stream"),
+}
+MIME_TYPES = dict(FORMATS.values(), zip="application/zip")
+
+
+def _partitions(df):
+    for i in range(df.npartitions):
+        yield df.partitions[i].compute()
+
+
+def export_dataset(df, path, ext):
+    """
+    Write a Dask DataFrame to a single file, partition by partition.
+
+    Parameters:
+    df (dd.DataFrame): Dataset to export
+    path (str): Destination file
+    ext (str): "csv", "csv.gz" or "parquet"
+    """
+    tmp_path = f"{path}.part"
+    if ext == "parquet":
+        writer = None
+        try:
+            for part in _partitions(df):
+                table = pa.Table.from_pandas(part, preserve_index=False,
+                                             schema=writer.schema if writer is not None else None)
+                if writer is None:
+                    # categorical columns get indices wide enough for the categories of every partition
+                    schema = table.schema
+                    for name, type_ in parquet_schema(df).items():
+                        schema = schema.set(schema.get_field_index(name), pa.field(name, type_))
+                    table = table.cast(schema)
+                    writer = pq.ParquetWriter(tmp_path, schema)
+                writer.write_table(table)
+            if writer is None:
+                pq.write_table(pa.Table.from_pandas(df._meta, preserve_index=False), tmp_path)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        opener = gzip.open if ext == "csv.gz" else open
+        with opener(tmp_path, "wt", encoding="utf-8", newline="") as f:
+            for i, part in enumerate(_partitions(df)):
+                part.to_csv(f, index=False, header=(i == 0))
+    os.replace(tmp_path, path)
+
+
+def build_zip(paths, arcnames, zip_path):
+    """Bundle exported files into a zip archive, copying them from disk in chunks."""
+    tmp_path = f"{zip_path}.part"
+    with zipfile.ZipFile(tmp_path, "w") as zf:
+        # the bundled exports, so that the archive is garbage collected with them
+        zf.comment = "\n".join(os.path.basename(path) for path in paths).encode("utf-8")
+        for path, arcname in zip(paths, arcnames):
+            # gzip and Parquet files are already compressed
+            compress = zipfile.ZIP_DEFLATED if arcname.endswith(".csv") else zipfile.ZIP_STORED
+            zf.write(path, arcname, compress_type=compress)
+    os.replace(tmp_path, zip_path)
+
+
+@instrumented("Export")
+def export_datasets(handles, fmt, directory):
+    """
+    Job body: export stored datasets, reusing earlier exports of the same dataset and format.
+
+    Parameters:
+    handles (list): DatasetHandle of each dataset to export
+    fmt (str): Key of FORMATS
+    directory (str): Export directory of the session
+
+    Returns:
+    list: (file path, download name) for each dataset, plus one for the zip
+    archive when there is more than one dataset
+    """
+    ext, _ = FORMATS[fmt]
+    Path(directory).mkdir(parents=True, exist_ok=True)
+
+    files = []
+    for i, handle in enumerate(handles):
+        path = os.path.join(directory, f"{export_name(handle)}.{ext}")
+        if not os.path.exists(path):
+            # the export directory is inside the session directory, which must not be evicted
+            enforce_quota(os.path.dirname(directory))
+            export_dataset(handle.open(), path, ext)
+        files.append((path, f"dataframe_{i + 1}.{ext}"))
+
+    if len(files) > 1:
+        digest = hashlib.sha256("|".join(path for path, _ in files).encode("utf-8")).hexdigest()[:16]
+        zip_path = os.path.join(directory, f"{digest}.zip")
+        if not os.path.exists(zip_path):
+            enforce_quota(os.path.dirname(directory))
+            build_zip([path for path, _ in files], [name for _, name in files], zip_path)
+        files.append((zip_path, "dataframes.zip"))
+    return files
@@ -0,0 +1,248 @@
+"""Fast reader for fixed-width files.
+
+Extractor reads fixed-width files with ``dask.dataframe.read_fwf``, which
+splits every line in Python. Here a file is memory-mapped and cut into chunks
+of about ``S4H_FWF_CHUNK_MB`` (default 64) megabytes that end on a line break.
+Each chunk is parsed by a Dask task: the column specifications become byte
+offsets that are gathered for all lines of the chunk at once with numpy, the
+columns are converted with pyarrow to the types declared in the dictionary,
+and the task writes its own Parquet partition.
+
+Offsets are bytes, so this only applies to single-byte encodings (latin1,
+cp1252, ...). UTF-8 chunks holding non-ASCII text, where characters and bytes
+differ, are parsed with pandas instead.
+"""
+
+import codecs
+import logging
+import mmap
+import os
+import uuid
+from pathlib import Path
+
+import dask
+import dask.dataframe as dd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from socio4health import Extractor
+
+from instrumentation import instrumented
+
+CHUNK_BYTES = int(float(os.environ.get("S4H_FWF_CHUNK_MB", "64")) * 1024 ** 2)
+
+# dictionary columns that may declare the type of each variable
+TYPE_COLUMNS = ("type", "data_type", "dtype", "variable_type", "tipo", "tipo_dato")
+INTEGER_TYPES = ("int", "entero", "integer")
+FLOAT_TYPES = ("float", "double", "real", "dec", "num", "n")
+STRING_TYPES = ("str", "char", "text", "alfa", "alpha", "caracter", "cadena", "c", "a")
+
+
+def _type_of(declared):
+    declared = str(declared).strip().lower()
+    if not declared or declared == "nan":
+        return "string"
+    # one-letter codes ("N", "C") must match exactly, longer names are prefixes ("numeric", "character")
+    for kind, names in (("int", INTEGER_TYPES), ("string", STRING_TYPES), ("float", FLOAT_TYPES)):
+        if any(declared == name or (len(name) > 1 and declared.startswith(name)) for name in names):
+            return kind
+    return "string"
+
+
+def declared_types(dictionary):
+    """
+    Return the type declared in a standardized dictionary for each variable.
+
+    Parameters:
+    dictionary (pd.DataFrame): Standardized dictionary
+
+    Returns:
+    dict: Variable name -> "int", "float" or "string"; empty if the dictionary declares no types
+    """
+    columns = {str(c).strip().lower(): c for c in dictionary.columns}
+    type_column = next((columns[name] for name in TYPE_COLUMNS if name in columns), None)
+    if type_column is None:
+        logging.info(f"The dictionary declares no variable types (no column named any of {', '.join(TYPE_COLUMNS)}); "
+                     "fixed-width columns are read as text")
+        return {}
+    return {str(name): _type_of(declared)
+            for name, declared in zip(dictionary["variable_name"], dictionary[type_column])}
+
+
+def _single_byte(encoding):
+    try:
+        return len("é".encode(encoding, errors="ignore")) <= 1 and codecs.lookup(encoding).name != "utf-8"
+    except LookupError:
+        return False
+
+
+def chunk_offsets(path, chunk_bytes=CHUNK_BYTES):
+    """Return (start, stop) byte ranges of about chunk_bytes that cover a file and end on line breaks."""
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+    offsets = []
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        while start < size:
+            stop = mm.find(b"\n", min(start + chunk_bytes, size) - 1)
+            stop = size if stop == -1 else stop + 1
+            offsets.append((start, stop))
+            start = stop
+    return offsets
+
+
+def _line_bounds(buf):
+    ends = np.flatnonzero(buf == 10)
+    if len(buf) and buf[-1] != 10:
+        ends = np.append(ends, len(buf))
+    starts = np.concatenate(([0], ends[:-1] + 1)).astype(np.int64)
+    stops = ends.astype(np.int64)
+    # drop the carriage return of Windows line endings
+    crlf = (stops > starts) & (buf[np.maximum(stops - 1, 0)] == 13)
+    stops[crlf] -= 1
+    keep = stops > starts
+    return starts[keep], stops[keep]
+
+
+def _slice(buf, starts, stops, start, end):
+    """Return the bytes start:end of every line as a fixed-size bytes array padded with spaces."""
+    idx = starts[:, None] + np.arange(start, end)
+    valid = idx < stops[:, None]
+    out = np.full(idx.shape, 32, dtype=np.uint8)
+    out[valid] = buf[idx[valid]]
+    return out.view(f"S{end - start}").ravel()
+
+
+def _convert(raw, kind, encoding):
+    if (raw.view(np.uint8) >= 128).any():
+        # only non-ASCII cells need decoding; everything else is valid UTF-8 as it is. Bytes the encoding
+        # does not define are replaced, so they become missing values in numeric columns
+        text = pa.array(np.char.decode(raw, encoding, "replace"), type=pa.string())
+    else:
+        text = pa.array(raw, type=pa.binary()).cast(pa.string())
+    text = pc.utf8_trim_whitespace(text)
+    text = pc.if_else(pc.equal(text, ""), pa.scalar(None, pa.string()), text)
+    if kind == "string":
+        return text
+
+    target = pa.int64() if kind == "int" else pa.float64()
+    try:
+        return text.cast(target)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        # values that do not parse become missing, as with pd.to_numeric(errors="coerce")
+        values = pd.to_numeric(pd.Series(text.to_pandas()).str.replace(",", ".", regex=False), errors="coerce")
+        if kind == "int" and (values.dropna() % 1 == 0).all():
+            return pa.array(values.astype("Int64"), type=pa.int64())
+        return pa.array(values, type=pa.float64())
+
+
+def _pandas_chunk(data, colnames, colspecs, types, encoding):
+    df = pd.read_fwf(pd.io.common.BytesIO(data), colspecs=colspecs, names=colnames, encoding=encoding,
+                     dtype=str, header=None)
+    arrays = []
+    for name in colnames:
+        kind = types.get(name, "string")
+        if kind == "string":
+            arrays.append(pa.array(df[name], type=pa.string(), from_pandas=True))
+        else:
+            values = pd.to_numeric(df[name], errors="coerce")
+            arrays.append(pa.array(values.astype("Int64") if kind == "int" else values,
+                                   type=pa.int64() if kind == "int" else pa.float64(), from_pandas=True))
+    return arrays
+
+
+def parse_chunk(path, start, stop, colnames, colspecs, types, encoding):
+    """
+    Parse a range of lines of a fixed-width file.
+
+    Parameters:
+    path (str): Fixed-width file
+    start (int), stop (int): Byte range, from chunk_offsets()
+    colnames (list): Column names
+    colspecs (list): (start, end) character offsets of each column
+    types (dict): Column name -> "int", "float" or "string"; undeclared columns are strings
+    encoding (str): Encoding of the file
+
+    Returns:
+    pa.Table: The parsed lines
+    """
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        buf = np.frombuffer(mm[start:stop], dtype=np.uint8)
+
+    if not _single_byte(encoding) and (buf >= 128).any():
+        arrays = _pandas_chunk(buf.tobytes(), colnames, colspecs, types, encoding)
+    else:
+        if not _single_byte(encoding):
+            encoding = "ascii"
+        starts, stops = _line_bounds(buf)
+        arrays = [_convert(_slice(buf, starts, stops, s, e), types.get(name, "string"), encoding)
+                  for name, (s, e) in zip(colnames, colspecs)]
+    return pa.table(arrays, names=list(colnames))
+
+
+def _write_chunk(path, start, stop, colnames, colspecs, types, encoding, target):
+    table = parse_chunk(path, start, stop, colnames, colspecs, types, encoding)
+    table = table.append_column("filename", pa.array([os.path.basename(path)]).take(np.zeros(len(table), int)))
+    pq.write_table(table, target)
+    return len(table)
+
+
+@instrumented("Fixed-width parsing")
+def fwf_to_parquet(path, colnames, colspecs, directory, types=None, encoding="latin1", chunk_bytes=CHUNK_BYTES):
+    """
+    Convert a fixed-width file into a Parquet dataset, one partition per chunk, parsed in parallel.
+
+    Parameters:
+    path (str): Fixed-width file
+    colnames (list): Column names
+    colspecs (list): (start, end) offsets of each column
+    directory (str): Directory in which the dataset is created
+    types (dict | None): Declared types, from declared_types()
+    encoding (str): Encoding of the file
+    chunk_bytes (int): Approximate size of each chunk
+
+    Returns:
+    str: Path of the Parquet dataset
+    """
+    target = Path(directory) / f"{Path(path).stem}-{uuid.uuid4().hex[:8]}"
+    target.mkdir(parents=True, exist_ok=True)
+    tasks = [dask.delayed(_write_chunk)(str(path), start, stop, list(colnames), list(colspecs), types or {},
+                                        encoding, str(target / f"part.{i}.parquet"))
+             for i, (start, stop) in enumerate(chunk_offsets(path, chunk_bytes))]
+    rows = sum(dask.compute(*tasks))
+    logging.info(f"Parsed {rows} rows of {os.path.basename(path)} in {len(tasks)} chunks")
+    return str(target)
+
+
+class FwfExtractor(Extractor):
+    """Extractor that reads fixed-width files with fwf_to_parquet() and the dictionary's declared types."""
+
+    def __init__(self, *args, coltypes=None, **kwargs):
+        """
+        Parameters:
+        coltypes (dict | None): Declared type of each column, from declared_types()
+
+        The other parameters are those of Extractor.
+        """
+        super().__init__(*args, **kwargs)
+        self.coltypes = coltypes or {}
+
+    def _read_file(self, filepath):
+        if not self.is_fwf:
+            return super()._read_file(filepath)
+        # errors are raised as Extractor._read_file raises them
+        if not self.colnames or not self.colspecs:
+            logging.error("Column specs required for fixed-width files")
+            raise ValueError("Column specs required for fixed-width files")
+        try:
+            path = fwf_to_parquet(filepath, self.colnames, self.colspecs, os.path.join(self.output_path, "fwf"),
+                                  types=self.coltypes, encoding=self.encoding or "latin1")
+            df = dd.read_parquet(path)
+            if df.npartitions:
+                self.dataframes.append(df)
+        except Exception as e:
+            logging.error(f"Error reading {filepath}: {e}")
+            raise ValueError(f"Error reading file: {e}")
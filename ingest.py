@@ -0,0 +1,139 @@
+"""Incremental ingestion of uploaded files.
+
+Every upload is identified by the SHA-256 of its content plus a fingerprint of
+the extraction options (extensions, separator, encoding and fixed-width specs).
+The first time a file is seen it is extracted on its own and the resulting
+datasets are written as Parquet under ``S4H_INGEST_DIR`` (default
+``./data/ingest``). A manifest maps each key to those Parquet outputs, so
+uploading the same file again with the same options only reopens them. The
+outputs are shared by every session and referenced from the workspace by
+handles that do not own them.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import dask
+import dask.dataframe as dd
+
+from fwf import FwfExtractor
+from instrumentation import instrumented
+from workspace import handle_for
+
+INGEST_DIR = Path(os.environ.get("S4H_INGEST_DIR", "./data/ingest"))
+MANIFEST_PATH = INGEST_DIR / "manifest.json"
+
+_manifest_lock = threading.Lock()
+
+
+def options_fingerprint(options):
+    """Return a short hash of the extraction options that affect the parsed result."""
+    payload = json.dumps(options, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def file_key(data, fingerprint):
+    """
+    Return the manifest key of an upload.
+
+    Parameters:
+    data (bytes | memoryview): Content of the uploaded file
+    fingerprint (str): Result of options_fingerprint()
+
+    Returns:
+    str: Content hash combined with the options fingerprint
+    """
+    return f"{hashlib.sha256(data).hexdigest()}-{fingerprint}"
+
+
+def load_manifest():
+    if not MANIFEST_PATH.exists():
+        return {}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(manifest):
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = MANIFEST_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def lookup(key):
+    """Return the manifest entry for a key, or None if it has no outputs or they are missing."""
+    entry = load_manifest().get(key)
+    if entry is None or not entry["outputs"] or not all(os.path.exists(p) for p in entry["outputs"]):
+        return None
+    return entry
+
+
+def load_entry(entry):
+    """Return workspace handles to the Parquet outputs of a manifest entry."""
+    return [handle_for(p) for p in entry["outputs"]]
+
+
+def stage_upload(uploaded_file, key):
+    """Write an upload to its own staging directory and return that directory."""
+    upload_dir = INGEST_DIR / "uploads" / key
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    with open(upload_dir / uploaded_file.name, "wb") as f:
+        f.write(uploaded_file.getbuffer())
+    return str(upload_dir)
+
+
+@instrumented("Extraction")
+def ingest_file(upload_dir, key, name, options):
+    """
+    Extract a single staged upload and record its Parquet outputs in the manifest.
+
+    Parameters:
+    upload_dir (str): Staging directory that contains only this upload
+    key (str): Manifest key of the upload
+    name (str): Original file name, kept for display
+    options (dict): Keyword arguments for FwfExtractor
+
+    Returns:
+    list: Workspace handles to the Parquet outputs
+    """
+    out_dir = INGEST_DIR / "parquet" / key
+    extracted_dir = INGEST_DIR / "extracted" / key
+    extractor = FwfExtractor(input_path=upload_dir, output_path=str(extracted_dir), **options)
+    dfs = extractor.s4h_extract() or []
+
+    outputs = []
+    for i, df in enumerate(dfs):
+        if not dask.is_dask_collection(df):
+            df = dd.from_pandas(df, npartitions=1)
+        path = out_dir / f"part_{i}"
+        df.to_parquet(path, write_index=False, overwrite=True)
+        outputs.append(str(path))
+
+    handles = [handle_for(p) for p in outputs]
+
+    with _manifest_lock:
+        manifest = load_manifest()
+        manifest[key] = {"name": name, "outputs": outputs, "rows": [h.rows for h in handles]}
+        _save_manifest(manifest)
+    shutil.rmtree(upload_dir, ignore_errors=True)
+    shutil.rmtree(extracted_dir, ignore_errors=True)
+    return handles
+
+
+def ingest_files(staged):
+    """
+    Job body: ingest several staged uploads one after the other.
+
+    Parameters:
+    staged (list): (key, name, upload_dir, options) for each new upload, options being
+    the keyword arguments for FwfExtractor with the separator and encoding of that file
+
+    Returns:
+    list: (key, workspace handles of its datasets) for each upload
+    """
+    return [(key, ingest_file(upload_dir, key, name, options)) for key, name, upload_dir, options in staged]
@@ -0,0 +1,254 @@
+"""Timing and memory instrumentation of the pipeline steps.
+
+Every pipeline call (extraction, dictionary standardization, NaN profiling and
+cleaning, vertical merge, model loading, classification, translation, data
+selection, dtype optimization and exports) is wrapped with ``instrumented``,
+which records for each call:
+
+- its wall time
+- the peak resident memory of the app process when it finished, and how much the call raised it
+- the rows it received and returned, when they are known without computing anything
+- the Dask tasks it ran: the exact count with the local schedulers, or the cluster-wide
+  scheduler transitions during the call with the distributed one (whose workers' memory is
+  shown in the Compute resources panel instead)
+
+Records are kept in a process-wide ring buffer of the last ``S4H_TRACE_SIZE``
+(default 500) calls, tagged with the session they ran for. Each page shows the
+session's records as a timeline that can be downloaded as JSON to track
+regressions.
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+import streamlit as st
+from dask.callbacks import Callback
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from cluster import cluster_stats, format_bytes
+from jobs import current_job
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACE_SIZE = int(os.environ.get("S4H_TRACE_SIZE", "500"))
+
+_records = deque(maxlen=TRACE_SIZE)
+_records_lock = threading.Lock()
+# instrumented calls running on each thread, to nest the records of inner steps
+_stack = threading.local()
+
+
+def peak_rss():
+    """Return the peak resident memory of the process in bytes, or None where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def count_rows(value):
+    """
+    Return the number of rows of a step's input or output when it is known without computing.
+
+    Dataset handles carry their row count and pandas DataFrames have one; lists
+    are summed and tuples give the count of their first element that has one.
+    Lazy Dask DataFrames and anything else count as unknown.
+
+    Returns:
+    int | None: Number of rows, or None if unknown
+    """
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    rows = getattr(value, "rows", None)
+    if isinstance(rows, int):
+        return rows
+    if isinstance(value, list) and value:
+        counts = [count_rows(item) for item in value]
+        return sum(counts) if all(c is not None for c in counts) else None
+    if isinstance(value, tuple):
+        return next((c for c in map(count_rows, value) if c is not None), None)
+    return None
+
+
+class _TaskCounter(Callback):
+    """Count the tasks of the graphs computed on one thread with the local schedulers."""
+
+    def __init__(self):
+        super().__init__()
+        self.thread = threading.get_ident()
+        self.tasks = 0
+
+    def _start(self, dsk):
+        # callbacks are global, graphs computed by other threads at the same time are not ours
+        if threading.get_ident() == self.thread:
+            self.tasks += len(dsk)
+
+
+def _transitions():
+    # only a client the app already started is asked; recording a trace never starts a cluster
+    try:
+        from distributed import default_client
+        client = default_client()
+    except (ImportError, ValueError):
+        return None
+    try:
+        return cluster_stats(client)["transitions"]
+    except Exception:
+        return None
+
+
+def _session():
+    job = current_job()
+    if job is not None:
+        return job.session
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx is not None else None
+
+
+def record(entry):
+    with _records_lock:
+        _records.append(entry)
+
+
+def records(session=None):
+    """
+    Return the recorded calls, oldest first.
+
+    Parameters:
+    session (str | None): Only return the calls made for this session
+
+    Returns:
+    list: One dict per call
+    """
+    with _records_lock:
+        entries = list(_records)
+    return [e for e in entries if session is None or e["session"] == session]
+
+
+def clear(session=None):
+    """Forget the recorded calls of a session, or all of them."""
+    with _records_lock:
+        kept = [e for e in _records if session is not None and e["session"] != session]
+        _records.clear()
+        _records.extend(kept)
+
+
+def instrumented(step):
+    """
+    Decorate a pipeline call so that each run is recorded under a step name.
+
+    Parameters:
+    step (str): Name of the step shown in the timeline
+
+    Returns:
+    callable: Decorator
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            depth = getattr(_stack, "depth", 0)
+            job = current_job()
+            entry = {
+                "step": step,
+                "function": f"{fn.__module__}.{fn.__qualname__}",
+                "session": _session(),
+                "job": job.id if job is not None else None,
+                "depth": depth,
+                "started": time.time(),
+                "rows_in": count_rows(args[0]) if args else None,
+            }
+            rss_before = peak_rss()
+            transitions_before = _transitions()
+            counter = _TaskCounter()
+            result = None
+            entry["error"] = None
+            start = time.perf_counter()
+            _stack.depth = depth + 1
+            try:
+                with counter:
+                    result = fn(*args, **kwargs)
+                return result
+            except Exception as e:
+                entry["error"] = str(e)
+                raise
+            finally:
+                _stack.depth = depth
+                entry["wall"] = time.perf_counter() - start
+                entry["rows_out"] = count_rows(result)
+                entry["peak_rss"] = peak_rss()
+                entry["rss_growth"] = (entry["peak_rss"] - rss_before) if rss_before is not None else None
+                entry["tasks"] = counter.tasks if transitions_before is None else None
+                transitions_after = _transitions() if transitions_before is not None else None
+                entry["transitions"] = (transitions_after - transitions_before
+                                        if transitions_after is not None else None)
+                record(entry)
+                logging.debug(f"{step} took {entry['wall']:.2f}s")
+        return wrapper
+    return decorator
+
+
+def timeline_json(entries):
+    """Serialize recorded calls for download."""
+    return json.dumps({"records": entries}, indent=2)
+
+
+def _render_timeline():
+    session = _session()
+    entries = records(session)
+    if not entries:
+        st.write("No pipeline steps recorded yet.")
+        return
+    rows = []
+    for e in entries:
+        rows.append({
+            "step": "  " * e["depth"] + e["step"],
+            "started": pd.to_datetime(e["started"], unit="s"),
+            "wall (s)": round(e["wall"], 3),
+            "peak RSS": format_bytes(e["peak_rss"]) if e["peak_rss"] is not None else None,
+            "RSS growth": format_bytes(e["rss_growth"]) if e["rss_growth"] is not None else None,
+            "rows in": e["rows_in"],
+            "rows out": e["rows_out"],
+            "tasks": e["tasks"] if e["tasks"] is not None else e["transitions"],
+            "error": e["error"],
+        })
+    timeline = pd.DataFrame(rows)
+    timeline["finished"] = timeline["started"] + pd.to_timedelta(timeline["wall (s)"], unit="s")
+    st.vega_lite_chart(timeline, {
+        "mark": {"type": "bar", "tooltip": True},
+        "encoding": {
+            "x": {"field": "started", "type": "temporal", "title": None},
+            "x2": {"field": "finished"},
+            "y": {"field": "step", "type": "nominal", "sort": None, "title": None},
+            "color": {"field": "error", "type": "nominal", "legend": None},
+        },
+    }, use_container_width=True)
+    st.dataframe(timeline.drop(columns="finished"), hide_index=True)
+    if any(e["transitions"] is not None for e in entries):
+        st.caption("With the distributed scheduler, tasks are the cluster-wide scheduler transitions during the step.")
+
+    download_col, clear_col = st.columns(2)
+    download_col.download_button(
+        label="Download timeline as JSON",
+        data=timeline_json(entries),
+        file_name="timeline.json",
+        mime="application/json",
+    )
+    if clear_col.button("Clear timeline"):
+        clear(session)
+        st.rerun()
+
+
+def show_timeline():
+    """Expander with the timeline of the pipeline steps run for this session."""
+    with st.expander("Step timeline", expanded=False):
+        st.fragment(_render_timeline)()
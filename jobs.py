@@ -0,0 +1,248 @@
+"""Background jobs for long-running pipeline steps.
+
+Extraction, vertical merge, classification and data selection are submitted to
+a thread pool shared by every session of the server, so they run to completion
+even if the user interacts with the page while they are running. Each session
+keeps the ids of the jobs it submitted and polls them; when a job finishes its
+result is handed to the callback given at submission time, inside the session's
+own script run.
+
+The number of jobs running at the same time across all sessions is limited by
+the ``S4H_MAX_JOBS`` environment variable (default 2).
+
+Before Python 3.12, ``functools.cached_property`` computes a value under one
+lock per property, shared by all instances. Dask builds and optimizes its
+expression graphs through nested cached properties, so two threads building
+graphs at once (jobs, or a job and a page script) could take those locks in
+opposite orders and deadlock. The job runner therefore gives every cached
+property of Dask's classes the same re-entrant lock, GRAPH_LOCK: computing
+cached graph properties is serialized, which rules out the lock-order
+inversion, while running the tasks of a graph is not.
+"""
+
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+MAX_JOBS = int(os.environ.get("S4H_MAX_JOBS", "2"))
+POLL_INTERVAL = float(os.environ.get("S4H_JOB_POLL_SECONDS", "2"))
+# finished jobs nobody collected (e.g. the browser tab was closed) are dropped after this
+JOB_TTL = 3600
+LOG_LINES = 200
+
+GRAPH_LOCK = threading.RLock()
+
+
+def share_graph_lock():
+    """
+    Make the cached properties of every Dask class loaded so far compute under GRAPH_LOCK.
+
+    Only needed before Python 3.12, where each cached_property has a lock of its own;
+    classes loaded later are covered by the next call.
+    """
+    if sys.version_info >= (3, 12):
+        return
+    classes = [value for name, module in list(sys.modules.items())
+               if module is not None and (name == "dask" or name.startswith("dask."))
+               for value in list(vars(module).values())
+               if isinstance(value, type) and value.__module__.split(".")[0] == "dask"]
+    seen = set()
+    while classes:
+        cls = classes.pop()
+        if cls in seen:
+            continue
+        seen.add(cls)
+        for value in list(vars(cls).values()):
+            if isinstance(value, functools.cached_property) and value.lock is not GRAPH_LOCK:
+                value.lock = GRAPH_LOCK
+        classes.extend(type.__subclasses__(cls))
+
+
+class Job:
+    """State of a single background job, shared between its worker thread and the session."""
+
+    def __init__(self, label, session=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.label = label
+        # id of the Streamlit session that submitted the job
+        self.session = session
+        self.state = "queued"
+        self.result = None
+        self.error = None
+        self.log = deque(maxlen=LOG_LINES)
+        # name -> (fraction done, description), shown as progress bars in the job panel
+        self.progress = {}
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def done(self):
+        return self.state in ("done", "error")
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class _JobLogHandler(logging.Handler):
+    """Route log records emitted from a worker thread to the job running on it."""
+
+    def __init__(self):
+        super().__init__()
+        self.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s", "%H:%M:%S"))
+        self.running = {}
+
+    def emit(self, record):
+        job = self.running.get(record.thread)
+        if job is not None:
+            job.log.append(self.format(record))
+
+
+class JobRunner:
+    """Process-wide registry of jobs backed by a bounded thread pool."""
+
+    def __init__(self, max_workers=MAX_JOBS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s4h-job")
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.log_handler = _JobLogHandler()
+        logging.getLogger().addHandler(self.log_handler)
+
+    def submit(self, job, fn, *args, **kwargs):
+        share_graph_lock()
+        with self.lock:
+            self._prune()
+            self.jobs[job.id] = job
+        self.executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def forget(self, job_id):
+        with self.lock:
+            self.jobs.pop(job_id, None)
+
+    def active(self):
+        return [job for job in self.jobs.values() if not job.done]
+
+    def _run(self, job, fn, args, kwargs):
+        thread_id = threading.get_ident()
+        self.log_handler.running[thread_id] = job
+        job.state = "running"
+        job.started = time.time()
+        try:
+            job.result = fn(*args, **kwargs)
+            job.state = "done"
+        except Exception as e:
+            logging.exception(f"Job {job.id} ({job.label}) failed")
+            job.error = str(e)
+            job.state = "error"
+        finally:
+            job.finished = time.time()
+            self.log_handler.running.pop(thread_id, None)
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.done and now - job.finished > JOB_TTL:
+                del self.jobs[job_id]
+
+
+@st.cache_resource
+def get_job_runner():
+    """Return the job runner shared by all sessions of this server."""
+    return JobRunner()
+
+
+def submit_job(label, fn, *args, on_done=None, **kwargs):
+    """
+    Run ``fn(*args, **kwargs)`` in the background on behalf of the current session.
+
+    Parameters:
+    label (str): Name shown in the job panel
+    fn (callable): Work to run; it must not call Streamlit
+    on_done (callable | None): Called with the result inside the session once
+        the job finished; may return a message for the Process Log
+
+    Returns:
+    Job: The submitted job
+    """
+    ctx = get_script_run_ctx()
+    job = get_job_runner().submit(Job(label, ctx.session_id if ctx is not None else None), fn, *args, **kwargs)
+    st.session_state.jobs[job.id] = on_done
+    return job
+
+
+def current_job():
+    """Return the job running on the calling thread, or None outside of a job."""
+    return get_job_runner().log_handler.running.get(threading.get_ident())
+
+
+def session_jobs():
+    """Return the jobs submitted by the current session that are still registered."""
+    runner = get_job_runner()
+    jobs = [runner.get(job_id) for job_id in st.session_state.get("jobs", {})]
+    return [job for job in jobs if job is not None]
+
+
+def collect_finished_jobs():
+    """
+    Hand the results of this session's finished jobs to their callbacks.
+
+    Returns:
+    bool: True if at least one job was collected
+    """
+    runner = get_job_runner()
+    callbacks = st.session_state.get("jobs", {})
+    collected = False
+    for job_id in list(callbacks):
+        job = runner.get(job_id)
+        if job is None:
+            callbacks.pop(job_id)
+            continue
+        if not job.done:
+            continue
+        on_done = callbacks.pop(job_id)
+        if job.state == "error":
+            st.session_state.messages.append(("error", f"{job.label} failed: {job.error}"))
+        else:
+            msg = on_done(job.result) if on_done is not None else None
+            st.session_state.messages.append(("success", msg or f"{job.label} completed in {job.elapsed():.1f}s"))
+        runner.forget(job_id)
+        collected = True
+    return collected
+
+
+def _render_jobs():
+    if collect_finished_jobs():
+        st.rerun()
+    jobs = session_jobs()
+    if not jobs:
+        return
+    st.subheader("Running jobs")
+    for job in jobs:
+        with st.status(f"{job.label} ({job.state}, {job.elapsed():.0f}s)", state="running", expanded=False):
+            for name, (fraction, text) in list(job.progress.items()):
+                st.progress(min(max(fraction, 0.0), 1.0), text=f"{name}: {text}")
+            st.code("\n".join(job.log) or "Waiting for output...")
+    queued = [job for job in get_job_runner().active() if job.state == "queued"]
+    if queued:
+        st.caption(f"{len(queued)} job(s) queued on the server (limit {MAX_JOBS} at a time).")
+
+
+def show_jobs():
+    """Show this session's jobs and poll them until they finish."""
+    running = bool(st.session_state.get("jobs"))
+    st.fragment(_render_jobs, run_every=POLL_INTERVAL if running else None)()
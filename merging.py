@@ -0,0 +1,140 @@
+"""Vertical merge planned from cached column similarities.
+
+Harmonizer.s4h_vertical_merge compares the columns of every pair of datasets
+each time it runs, so trying several similarity thresholds repeats all the
+comparisons. Here the pairwise similarity and dtype compatibility of the
+dataset schemas are computed once per set of schemas and cached; grouping the
+datasets for a threshold is then derived from the cached matrices, which also
+allows showing the groups before any merged dataset is built.
+"""
+
+import dask.dataframe as dd
+import streamlit as st
+
+from instrumentation import instrumented
+from optimization import optimize_datasets, reference_dtypes
+from workspace import write_dataset
+
+
+def dataset_schemas(dfs):
+    """
+    Return the schema of each dataset without computing it.
+
+    Returns:
+    tuple: For each dataset, a tuple of (column, dtype) pairs in column order
+    """
+    return tuple(tuple((str(column), str(dtype)) for column, dtype in df.dtypes.items()) for df in dfs)
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def similarity_matrix(schemas):
+    """
+    Compute the pairwise column similarity and dtype compatibility of several schemas.
+
+    Similarity is the number of shared columns over the column count of the
+    wider dataset; two datasets are compatible when their shared columns have
+    the same dtypes. Both follow Harmonizer.s4h_vertical_merge.
+
+    Parameters:
+    schemas (tuple): Result of dataset_schemas()
+
+    Returns:
+    tuple: Similarity, shared column count and compatibility matrices, as nested lists
+    """
+    dtypes = [dict(schema) for schema in schemas]
+    n = len(dtypes)
+    similarity = [[1.0] * n for _ in range(n)]
+    common = [[len(d)] * n for d in dtypes]
+    compatible = [[True] * n for _ in range(n)]
+    for i in range(n):
+        for j in range(i + 1, n):
+            shared = dtypes[i].keys() & dtypes[j].keys()
+            widest = max(len(dtypes[i]), len(dtypes[j]))
+            similarity[i][j] = similarity[j][i] = len(shared) / widest if widest else 0.0
+            common[i][j] = common[j][i] = len(shared)
+            compatible[i][j] = compatible[j][i] = all(dtypes[i][c] == dtypes[j][c] for c in shared)
+    return similarity, common, compatible
+
+
+def merge_groups(schemas, similarity_threshold, min_common_columns=1):
+    """
+    Group datasets for a vertical merge, as Harmonizer.s4h_vertical_merge does.
+
+    Datasets are taken in order; each one that is not grouped yet starts a
+    group and pulls in the following datasets whose dtypes agree with it and
+    whose columns are similar enough to the columns gathered by the group so
+    far. Only the cached pairwise matrices and set operations are used.
+
+    Parameters:
+    schemas (tuple): Result of dataset_schemas()
+    similarity_threshold (float): Minimum similarity to join a group
+    min_common_columns (int): Minimum number of shared columns to join a group
+
+    Returns:
+    list: Groups of dataset indices
+    """
+    similarity, common, compatible = similarity_matrix(schemas)
+    columns = [{column for column, _ in schema} for schema in schemas]
+    groups = []
+    used = set()
+    for i in range(len(schemas)):
+        if i in used:
+            continue
+        group_columns = set(columns[i])
+        group = [i]
+        used.add(i)
+        for j in range(i + 1, len(schemas)):
+            if j in used or not compatible[i][j]:
+                continue
+            if len(group) == 1:
+                shared, score = common[i][j], similarity[i][j]
+            else:
+                # the group has grown beyond dataset i, compare against all its columns
+                shared = len(group_columns & columns[j])
+                score = shared / max(len(group_columns), len(columns[j]))
+            if shared >= min_common_columns and score >= similarity_threshold:
+                group.append(j)
+                used.add(j)
+                group_columns |= columns[j]
+        groups.append(group)
+    return groups
+
+
+@instrumented("Vertical merge")
+def merge_datasets(handles, groups, directory, dictionary=None):
+    """
+    Job body: concatenate each group of datasets and store the result.
+
+    Columns shared by the whole group come first, in the order of each
+    dataset, as in Harmonizer.s4h_vertical_merge. Datasets left alone in
+    their group are kept as they are stored; merged ones are rewritten with
+    memory-optimized dtypes (see optimization.optimize_datasets).
+
+    Parameters:
+    handles (list): DatasetHandle of each dataset
+    groups (list): Result of merge_groups()
+    directory (str): Session directory
+    dictionary (pd.DataFrame | None): Standardized dictionary, for the optimization
+
+    Returns:
+    list: DatasetHandle of each merged dataset
+    """
+    merged, new = [], []
+    for group in groups:
+        if len(group) == 1:
+            merged.append(handles[group[0]])
+            continue
+        dfs = [handles[i].open() for i in group]
+        shared = set(dfs[0].columns).intersection(*(df.columns for df in dfs[1:]))
+        aligned = [df[[c for c in df.columns if c in shared] + [c for c in df.columns if c not in shared]]
+                   for df in dfs]
+        new.append(len(merged))
+        merged.append(write_dataset(dd.concat(aligned, axis=0, ignore_index=True), directory))
+
+    if new:
+        kept = [h for i, h in enumerate(merged) if i not in new]
+        optimized = optimize_datasets([merged[i] for i in new], directory, dictionary, reference_dtypes(kept),
+                                      discard=True)
+        for i, handle in zip(new, optimized):
+            merged[i] = handle
+    return merged
@@ -0,0 +1,196 @@
+"""Shared registry of classification models.
+
+Uploaded model zips are identified by the SHA-256 of their content and
+extracted once into ``S4H_MODELS_DIR/<hash>`` (default ``bert_model``), so
+sessions uploading the same model share one copy on disk and different models
+never overwrite each other. Loaded pipelines are kept in a process-wide
+registry and shared read-only by every session; at most ``S4H_MAX_MODELS``
+(default 2) stay in memory, least recently used first out.
+
+Models listed (as zip paths, comma separated) in ``S4H_WARM_MODELS`` are
+installed and loaded when the app starts.
+
+Classified rows are memoized on disk, so re-running a dictionary, or the
+dictionary of a new survey wave, only sends new or changed rows to the model.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from pathlib import Path
+
+import streamlit as st
+
+from cache_store import KeyValueCache
+from instrumentation import instrumented
+
+MODELS_DIR = Path(os.environ.get("S4H_MODELS_DIR", "bert_model"))
+MAX_MODELS = int(os.environ.get("S4H_MAX_MODELS", "2"))
+BATCH_SIZE = int(os.environ.get("S4H_CLASSIFY_BATCH_SIZE", "32"))
+WARM_MODELS = [p.strip() for p in os.environ.get("S4H_WARM_MODELS", "").split(",") if p.strip()]
+
+
+def _file_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(1024 * 1024), b""):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def _model_folder(directory):
+    # if the zip contained a single top-level folder, use it
+    children = list(directory.iterdir())
+    if len(children) == 1 and children[0].is_dir():
+        return children[0]
+    return directory
+
+
+def install_model(zip_file):
+    """
+    Extract a model zip into its content-addressed folder, unless it is already there.
+
+    Parameters:
+    zip_file (file-like | str): Uploaded zip or path to a zip file
+
+    Returns:
+    tuple: Model key (content hash) and path of the model folder
+    """
+    if isinstance(zip_file, (str, Path)):
+        with open(zip_file, "rb") as f:
+            key = _file_hash(f)
+    else:
+        key = _file_hash(zip_file)
+    target = MODELS_DIR / key[:16]
+
+    if not target.exists():
+        MODELS_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(dir=MODELS_DIR, prefix=".extract-"))
+        try:
+            with zipfile.ZipFile(zip_file, "r") as zip_ref:
+                zip_ref.extractall(tmp_dir)
+            os.replace(tmp_dir, target)
+        except OSError:
+            # another session installed the same model meanwhile
+            if not target.exists():
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return key, str(_model_folder(target))
+
+
+@instrumented("Model load")
+def _load_classifier(model_path):
+    import torch
+    from transformers import pipeline
+
+    device = 0 if torch.cuda.is_available() else -1
+    return pipeline("text-classification", model=model_path, tokenizer=model_path, device=device)
+
+
+class ModelRegistry:
+    """Process-wide LRU cache of loaded classification pipelines, keyed by model hash."""
+
+    def __init__(self, max_models=MAX_MODELS):
+        self.max_models = max_models
+        self.models = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, model_path):
+        """Return the pipeline of a model, loading it on first use."""
+        with self.lock:
+            if key in self.models:
+                self.models.move_to_end(key)
+                return self.models[key]
+            classifier = _load_classifier(model_path)
+            self.models[key] = classifier
+            while len(self.models) > self.max_models:
+                self.models.popitem(last=False)
+            return classifier
+
+    def loaded(self):
+        return list(self.models)
+
+
+@st.cache_resource
+def get_model_registry():
+    """Return the model registry shared by all sessions, warming S4H_WARM_MODELS on creation."""
+    registry = ModelRegistry()
+    for zip_path in WARM_MODELS:
+        registry.get(*install_model(zip_path))
+    return registry
+
+
+def _row_text(values):
+    valid_parts = [
+        str(x).strip()
+        for x in values
+        if isinstance(x, str) and x.strip() and x.strip().lower() != "not applicable"
+    ]
+    return " ".join(valid_parts)
+
+
+def _row_key(values, model_key):
+    payload = json.dumps([x if isinstance(x, str) else None for x in values] + [model_key])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@instrumented("Dictionary classification")
+def classify_rows(data, col1, col2, col3, load_classifier, model_key, new_column_name="category",
+                  batch_size=BATCH_SIZE, cache=None):
+    """
+    Classify each dictionary row, running the model only on rows it has not seen.
+
+    Same rules as harmonizer_utils.s4h_classify_rows: the three text columns
+    are joined, skipping empty and "not applicable" values, and rows without
+    any text get an empty category. Labels are memoized in ``cache`` by the
+    hash of the three column values and the model key. The remaining texts
+    are deduplicated, sorted by length so each batch needs little padding, and
+    sent to the model ``batch_size`` at a time. The model is only loaded,
+    with ``load_classifier()``, when some rows are not in the cache.
+
+    Returns:
+    tuple: Classified DataFrame and a dict with the number of rows taken from
+    the cache ("cached") and classified by the model ("computed")
+    """
+    if new_column_name in data.columns:
+        raise ValueError(f"The column '{new_column_name}' already exists in the DataFrame.")
+    cache = cache if cache is not None else get_classification_cache()
+
+    values = list(zip(data[col1], data[col2], data[col3]))
+    keys = [_row_key(v, model_key) for v in values]
+    cached = cache.get_many(keys)
+
+    texts = {}
+    for key, v in zip(keys, values):
+        if key not in cached:
+            texts[key] = _row_text(v)
+
+    pending = sorted({t for t in texts.values() if t}, key=len)
+    labels = {"": ""}
+    classifier = load_classifier() if pending else None
+    for i in range(0, len(pending), batch_size):
+        batch = pending[i:i + batch_size]
+        results = classifier(batch, truncation=True, max_length=128, batch_size=batch_size)
+        labels.update((text, result["label"]) for text, result in zip(batch, results))
+
+    computed = {key: labels[text] for key, text in texts.items()}
+    cache.set_many(computed)
+
+    df = data.copy()
+    df[new_column_name] = [cached[key] if key in cached else computed[key] for key in keys]
+    n_cached = sum(key in cached for key in keys)
+    return df, {"cached": n_cached, "computed": len(keys) - n_cached}
+
+
+@st.cache_resource
+def get_classification_cache():
+    """Return the on-disk memo of classified rows shared by all sessions."""
+    return KeyValueCache("classification")
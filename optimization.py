@@ -0,0 +1,211 @@
+"""Memory-optimized dtypes for workspace datasets.
+
+Extractor reads every CSV column as text, so survey microdata made of small
+integer codes and heavily repeated strings is stored and loaded as strings.
+After extraction and after each vertical merge the datasets are rewritten with
+smaller dtypes:
+
+- text variables the standardized dictionary lists with possible answers become categoricals
+- text columns that only hold numbers become (nullable) integers or floats, unless
+  some value has a leading zero (identifiers) or does not fit a float exactly
+- integers are downcast to the smallest nullable integer type that fits
+- other text columns become categoricals when their values repeat enough, Arrow strings otherwise
+
+The statistics that decide each dtype are computed for all the datasets of a
+batch in one Dask pass, and a column gets the same dtype in every dataset of
+the batch and keeps the dtype it already has elsewhere in the workspace when
+its values fit, so datasets that could be merged before still can.
+"""
+
+import shutil
+import uuid
+from pathlib import Path
+
+import dask
+import dask.dataframe as dd
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented
+from workspace import DatasetHandle, enforce_quota, handle_for, parquet_schema
+
+CATEGORY_RATIO = 0.5
+INT_DTYPES = ("Int8", "Int16", "Int32", "Int64")
+# larger integers are not exact once parsed as floats
+MAX_EXACT_INT = 2 ** 53
+
+
+def coded_variables(dictionary):
+    """Return the names of the variables the dictionary lists possible answers for, upper-cased."""
+    if dictionary is None or "variable_name" not in dictionary.columns:
+        return set()
+    coded = dictionary
+    for column in ("possible_answers", "value"):
+        if column in dictionary.columns:
+            coded = coded[coded[column].notna()]
+            break
+    else:
+        return set()
+    return {str(name).upper() for name in coded["variable_name"]}
+
+
+def reference_dtypes(handles):
+    """Return the dtype of every column already in the workspace, read from the Parquet metadata."""
+    reference = {}
+    for handle in handles:
+        df = handle.open() if isinstance(handle, DatasetHandle) else handle
+        for column, dtype in df.dtypes.items():
+            reference.setdefault(str(column), str(dtype))
+    return reference
+
+
+def _kind(dtype):
+    if isinstance(dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(dtype):
+        return None
+    if pd.api.types.is_object_dtype(dtype) or pd.api.types.is_string_dtype(dtype):
+        return "string"
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_float_dtype(dtype):
+        return "numeric"
+    return None
+
+
+def _lazy_stats(df):
+    columns = {}
+    for column, dtype in df.dtypes.items():
+        kind = _kind(dtype)
+        if kind is None:
+            continue
+        s = df[column]
+        num = dd.to_numeric(s, errors="coerce") if kind == "string" else s
+        columns[column] = {
+            "kind": kind,
+            "count": s.count(),
+            "numeric": num.count(),
+            "fractional": ((num % 1) > 0).sum(),
+            "leading_zero": s.str.match(r"^\s*[+-]?0\d").sum() if kind == "string" else 0,
+            "min": num.min(),
+            "max": num.max(),
+            "distinct": s.nunique_approx(),
+        }
+    return {"memory": df.memory_usage(deep=True).sum(), "columns": columns}
+
+
+def _combine(results):
+    combined = {}
+    for result in results:
+        for column, stats in result["columns"].items():
+            stats = {k: (v.item() if hasattr(v, "item") else v) for k, v in stats.items()}
+            if column not in combined:
+                combined[column] = stats
+                continue
+            total = combined[column]
+            if total["kind"] != stats["kind"]:
+                total["kind"] = None
+                continue
+            for key in ("count", "numeric", "fractional", "leading_zero", "distinct"):
+                total[key] += stats[key]
+            total["min"] = pd.Series([total["min"], stats["min"]]).min()
+            total["max"] = pd.Series([total["max"], stats["max"]]).max()
+    return combined
+
+
+def _int_dtype(low, high):
+    for dtype in INT_DTYPES:
+        bounds = np.iinfo(dtype.lower())
+        if bounds.min <= low and high <= bounds.max:
+            return dtype
+    return None
+
+
+def target_dtype(column, stats, coded=(), reference=None):
+    """
+    Choose the dtype of a column from its statistics.
+
+    Parameters:
+    column (str): Column name
+    stats (dict): Combined statistics of the column
+    coded (set): Upper-cased names of the coded variables
+    reference (str | None): Dtype the column already has in the workspace
+
+    Returns:
+    str | None: Target dtype, or None to keep the column as it is
+    """
+    if stats["kind"] is None or not stats["count"]:
+        return None
+    all_numeric = stats["numeric"] == stats["count"] and not stats["leading_zero"]
+    if str(column).upper() in coded and stats["kind"] == "string":
+        # coded variables the reader already parsed as numbers are as small as integers
+        target = "category"
+    elif all_numeric and not stats["fractional"]:
+        if max(abs(stats["min"]), abs(stats["max"])) >= MAX_EXACT_INT and stats["kind"] == "string":
+            target = "string[pyarrow]"
+        else:
+            target = _int_dtype(stats["min"], stats["max"])
+    elif all_numeric:
+        target = "float64" if stats["kind"] == "string" else None
+    elif stats["kind"] == "string":
+        target = "category" if stats["distinct"] <= CATEGORY_RATIO * stats["count"] else "string[pyarrow]"
+    else:
+        target = None
+
+    # keep the dtype the column has elsewhere in the workspace, as long as its values fit
+    if reference is not None and target is not None:
+        if target in INT_DTYPES and reference in INT_DTYPES:
+            target = max(target, reference, key=INT_DTYPES.index)
+        elif target in ("category", "string[pyarrow]") and reference in ("category", "string[pyarrow]", "string"):
+            target = "category" if reference == "category" else "string[pyarrow]"
+    return target
+
+
+@instrumented("Dtype optimization")
+def optimize_datasets(handles, directory, dictionary=None, reference=None, discard=False):
+    """
+    Job body: rewrite datasets with memory-optimized dtypes.
+
+    Parameters:
+    handles (list): DatasetHandle of each dataset, optimized together
+    directory (str): Session directory the optimized datasets are written to
+    dictionary (pd.DataFrame | None): Standardized dictionary, whose coded variables become categoricals
+    reference (dict | None): Dtypes of the columns already in the workspace, from reference_dtypes()
+    discard (bool): Delete the stored files of the datasets that were rewritten, for datasets the caller just created
+
+    Returns:
+    list: DatasetHandle of each optimized dataset, with its "memory" before and after in bytes;
+    datasets that need no change are returned as they are
+    """
+    if not handles:
+        return []
+    dfs = [h.open() for h in handles]
+    results = dask.compute([_lazy_stats(df) for df in dfs])[0]
+    combined = _combine(results)
+    coded = coded_variables(dictionary)
+    reference = reference or {}
+    targets = {column: target_dtype(column, stats, coded, reference.get(str(column)))
+               for column, stats in combined.items()}
+
+    optimized = []
+    for handle, df, result in zip(handles, dfs, results):
+        before = int(result["memory"])
+        changes = {column: target for column, target in targets.items()
+                   if target is not None and column in df.columns
+                   and df.dtypes[column] != pd.api.types.pandas_dtype(target)}
+        if not changes:
+            handle.memory = {"before": before, "after": before}
+            optimized.append(handle)
+            continue
+        for column, target in changes.items():
+            if _kind(df.dtypes[column]) == "string" and target != "category" and target != "string[pyarrow]":
+                df[column] = dd.to_numeric(df[column], errors="coerce").astype(target)
+            else:
+                df[column] = df[column].astype(target)
+
+        enforce_quota(directory)
+        path = Path(directory) / uuid.uuid4().hex
+        after = dask.compute(df.to_parquet(path, write_index=False, schema=parquet_schema(df), compute=False),
+                             df.memory_usage(deep=True).sum())[1]
+        new_handle = handle_for(path, owned=True)
+        new_handle.memory = {"before": before, "after": int(after)}
+        optimized.append(new_handle)
+        if discard:
+            shutil.rmtree(handle.path, ignore_errors=True)
+    return optimized
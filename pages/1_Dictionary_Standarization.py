@@ -1,25 +1,11 @@
 import streamlit as st
-import pandas as pd
-from socio4health.utils import extractor_utils, harmonizer_utils
 
+from dictionaries import content_hash, parse_dictionary, standardize_dictionary, fwf_specs
+from fwf import TYPE_COLUMNS
+from recipe import record_step
 from utils import initialize_session_state, show_session_state, add_logo
 
 
-def dictionary_standardization(df):
-    """
-    Standardize a dictionary dataframe using harmonizer utilities.
-
-    Parameters:
-    df (pd.DataFrame): Raw dictionary dataframe
-
-    Returns:
-    pd.DataFrame: Standardized dictionary
-    """
-    if df is not None:
-        return harmonizer_utils.s4h_standardize_dict(df)
-    return None
-
-
 st.set_page_config(page_title="Dictionary Standardization", page_icon="assets/s4h.ico", layout="wide")
 add_logo()
 
@@ -58,18 +44,20 @@ uploaded_file = st.file_uploader("Choose a CSV or Excel file", type=["csv", "xls
 
 raw_dic = None
 if uploaded_file is not None:
-    if uploaded_file.name.endswith('.csv'):
-        raw_dic = pd.read_csv(uploaded_file)
-    else:
-        raw_dic = pd.read_excel(uploaded_file)
+    # parsed once per file content, whichever session uploads it
+    dictionary_key = content_hash(uploaded_file.getbuffer())
+    raw_dic = parse_dictionary(dictionary_key, uploaded_file.name, uploaded_file.getvalue())
 
 if raw_dic is not None:
     if st.button("Standardize Dictionary"):
         with st.spinner("Standardizing dictionary..."):
-            standardized_dic = dictionary_standardization(raw_dic)
+            standardized_dic, cached = standardize_dictionary(dictionary_key, uploaded_file.name,
+                                                              uploaded_file.getvalue())
             if standardized_dic is not None:
                         st.session_state.standardized_dict = standardized_dic
-                        msg = "Dictionary standardized successfully!"
+                        record_step("standardize_dictionary", file=uploaded_file.name)
+                        msg = ("Dictionary standardized successfully!" if not cached
+                               else "Dictionary standardized successfully! (reused an earlier standardization)")
                         st.success(msg)
                         st.session_state.messages.append(("success", msg))
 
@@ -88,9 +76,15 @@ if st.session_state.standardized_dict is not None:
     if is_fwf:
         try:
             st.session_state.is_fwf = is_fwf
-            colnames, colspecs = extractor_utils.s4h_parse_fwf_dict(st.session_state.standardized_dict)
+            # derived once per dictionary content, not on every interaction
+            colnames, colspecs, coltypes = fwf_specs(st.session_state.standardized_dict)
+            # the parse runs on every rerun, record it only when it produced new specs
+            if (colnames, colspecs) != (st.session_state.colnames, st.session_state.colspecs):
+                record_step("parse_fwf")
             st.session_state.colnames = colnames
             st.session_state.colspecs = colspecs
+            # declared variable types let the fixed-width reader convert columns while parsing
+            st.session_state.coltypes = coltypes
 
             msg = "Fixed width file parsed successfully!"
             st.success(msg)
@@ -101,6 +95,13 @@ if st.session_state.standardized_dict is not None:
 
             st.write("**Column Specifications:**")
             st.write(colspecs)
+
+            if coltypes:
+                st.write("**Declared Types:**")
+                st.write(coltypes)
+            else:
+                st.caption("The standardized dictionary declares no variable types (no column named any of "
+                           f"{', '.join(TYPE_COLUMNS)}), so every fixed-width column is read as text.")
         except Exception as e:
             msg = f"Error parsing fixed width file: {str(e)}"
             st.error(msg)
@@ -1,11 +1,14 @@
-from pathlib import Path
-
 import streamlit as st
 import os
-import tempfile
-from socio4health import Extractor
 
-from utils import initialize_session_state, show_session_state, add_logo
+from ingest import options_fingerprint, file_key, lookup, load_entry, stage_upload, ingest_files
+from downloads import download_and_extract
+from jobs import submit_job, show_jobs
+from optimization import optimize_datasets, reference_dtypes
+from recipe import recorded
+from sniffing import MIN_CONFIDENCE, SNIFF_EXTENSIONS, sniff, is_confident
+from utils import initialize_session_state, show_session_state, add_logo, add_data_sources
+from workspace import session_dir
 
 st.set_page_config(page_title="Data Extraction", page_icon="assets/s4h.ico", layout="wide")
 add_logo()
@@ -34,6 +37,7 @@ with st.expander("Instructions", expanded=True):
         - "File extensions to look for" tells the extractor which file types (for example `.csv`, `.zip`) it should search for and download.
         - "CSV Options" lets you set the separator and file encoding if your CSVs use a custom format.
         - Turn on "Is a fixed width file?" if your dataset is stored as fixed-width text (not CSV). Use the dictionary page first to standardize and provide column widths.
+        - Files you already processed with the same options are not read again: the app reuses the earlier result and skips files that are already in your workspace.
 
         **If something goes wrong:**
 
@@ -57,27 +61,52 @@ st.session_state.source_data = st.selectbox(
 )
 
 
-def handle_extraction(extractor, source_type):
-    try:
-        with st.status(f"🔄 Extracting data from {source_type}...", expanded=True) as status:
-            result = extractor.s4h_extract()
+def attach_extraction(handles):
+    add_data_sources(handles)
+    st.session_state.state = "Data Loaded"
+    return f"Added {len(handles)} datasets to your workspace"
+
+
+def extract_url(url, depth, key_words, options, directory, dictionary, workspace):
+    """Job body: download and extract the files of a URL, then optimize the dtypes of their datasets."""
+    handles = download_and_extract(url, depth, key_words, options, directory)
+    return optimize_datasets(handles, directory, dictionary, reference_dtypes(workspace), discard=True)
+
+
+def extract_local(staged, reused, directory, dictionary, workspace):
+    """
+    Job body: ingest the new uploads, then optimize the dtypes of their datasets and of the reused ones.
+
+    Returns:
+    tuple: Paths of the datasets added for each upload key, and the handles of all of them
+    """
+    ingested = [(key, load_entry(entry)) for key, entry in reused] + ingest_files(staged)
+    # ingested datasets are shared between sessions, the optimized copies belong to this one
+    handles = optimize_datasets([h for _, hs in ingested for h in hs], directory, dictionary,
+                                reference_dtypes(workspace))
+    # optimize_datasets keeps the order of the datasets
+    paths, start = {}, 0
+    for key, hs in ingested:
+        paths[key] = [h.path for h in handles[start:start + len(hs)]]
+        start += len(hs)
+    return paths, handles
 
-            if result:
-                status.update(label="✅ Data extraction completed successfully!", state="complete")
-                if isinstance(result, list):
-                    st.session_state.Data_Sources.extend(result)
-                    st.info(f"Added {len(result)} datasets to your workspace")
-                else:
-                    st.session_state.Data_Sources.append(result)
-                    st.info("Added 1 dataset to your workspace")
-                return True
-            else:
-                status.update(label="⚠️ No data extracted", state="error")
-                return False
 
-    except Exception as e:
-        st.error(f"❌ Error during extraction: {str(e)}")
-        return False
+def in_workspace(paths):
+    """Return whether the datasets stored at these paths are all among the session's datasets."""
+    current = {getattr(df, "path", None) for df in st.session_state.Data_Sources}
+    return bool(paths) and all(p in current for p in paths)
+
+
+def handle_extraction(source_type, options, fn, *args):
+    job = submit_job(f"Extraction from {source_type}", fn, *args,
+                     on_done=recorded(attach_extraction, "extract", **options))
+    st.info(f"🔄 Extraction from {source_type} started in the background (job {job.id}). "
+            "You can keep using the app; the datasets are added to your workspace when it finishes.")
+
+
+ENCODINGS = ['latin1', 'utf-8', 'iso-8859-1', 'cp1252']
+ARCHIVE_EXTENSIONS = ('.zip', '.7z', '.tar', '.gz', '.tgz')
 
 
 def render_csv_options():
@@ -86,11 +115,64 @@ def render_csv_options():
         sep = st.text_input("Separator", value=",", key="csv_sep")
         encoding = st.selectbox(
             "Encoding",
-            ['latin1', 'utf-8', 'iso-8859-1', 'cp1252'],
+            ENCODINGS,
             key="csv_encoding"
         )
     return sep, encoding
 
+def render_sniffed_options(uploaded_files, is_fwf, sep, encoding):
+    """
+    Detect the separator and encoding of each CSV/TXT upload and ask only about the uncertain ones.
+
+    Parameters:
+    uploaded_files (list): Uploaded files
+    is_fwf (bool): Whether text files are fixed-width, in which case only the encoding matters
+    sep (str): Separator of the files that are not sniffed
+    encoding (str): Encoding of the files that are not sniffed
+
+    Returns:
+    dict: File id -> (separator, encoding)
+    """
+    if "sniffed" not in st.session_state:
+        st.session_state.sniffed = {}
+    settings, rows, uncertain = {}, [], []
+    for uploaded_file in uploaded_files:
+        if os.path.splitext(uploaded_file.name)[1].lower() not in SNIFF_EXTENSIONS:
+            settings[uploaded_file.file_id] = (sep, encoding)
+            continue
+        cache_key = (uploaded_file.file_id, is_fwf)
+        if cache_key not in st.session_state.sniffed:
+            st.session_state.sniffed[cache_key] = sniff(uploaded_file, is_fwf)
+        result = st.session_state.sniffed[cache_key]
+        # an encoding detected without confidence is only offered; the given one (latin1 by default) is preselected
+        file_encoding = result["encoding"] if result["encoding_confidence"] >= MIN_CONFIDENCE else encoding
+        settings[uploaded_file.file_id] = (result["sep"] or sep, file_encoding)
+        rows.append({
+            "File": uploaded_file.name,
+            "Encoding": result["encoding"],
+            "Encoding confidence": round(result["encoding_confidence"], 2),
+            "Separator": repr(result["sep"]) if result["sep"] else "-",
+            "Separator confidence": round(result["sep_confidence"], 2) if result["sep_confidence"] is not None else None,
+        })
+        if not is_confident(result):
+            uncertain.append((uploaded_file, result))
+
+    if rows:
+        st.write("Detected file settings:")
+        st.dataframe(rows, hide_index=True)
+    for uploaded_file, result in uncertain:
+        with st.expander(f"Check the settings of {uploaded_file.name}", expanded=True):
+            st.warning("These settings could not be detected with confidence. Please confirm them.")
+            file_sep = sep
+            if not is_fwf:
+                file_sep = st.text_input("Separator", value=result["sep"] or sep, key=f"sep_{uploaded_file.file_id}")
+            encodings = list(dict.fromkeys([settings[uploaded_file.file_id][1], result["encoding"]] + ENCODINGS))
+            file_encoding = st.selectbox("Encoding", encodings, key=f"encoding_{uploaded_file.file_id}",
+                                         help=f"Detected: {result['encoding']} "
+                                              f"(confidence {result['encoding_confidence']:.2f})")
+            settings[uploaded_file.file_id] = (file_sep, file_encoding)
+    return settings
+
 def render_fwf_options():
     is_fwf = st.toggle("Is a fixed width file?")
     colnames = st.session_state.get("colnames", None)
@@ -115,7 +197,7 @@ def render_extensions(detected_exts = ('.csv', '.zip')):
 
 is_fwf = False
 
-if st.session_state.source_data == "Internet (URL)":
+if st.session_state.source_data == "URL":
     st.subheader("Enter URLs for datasets")
 
     col1, col2 = st.columns(2)
@@ -134,6 +216,8 @@ if st.session_state.source_data == "Internet (URL)":
             is_fwf = False
             colnames = None
             colspecs = None
+        sep = ','
+        encoding = 'latin1'
         if any(ext in ['.csv', '.txt'] for ext in extensions):
             sep, encoding = render_csv_options()
 
@@ -151,23 +235,21 @@ if st.session_state.source_data == "Internet (URL)":
 
     if st.button("Extract Data from URL"):
         if url and url.strip():
-            extractor = Extractor(
-                input_path=url,
+            options = dict(
                 down_ext=extensions,
                 sep=sep,
                 encoding=encoding,
-                output_path="./data",
-                depth=depth,
-                key_words=[kw.strip() for kw in key_words.split(",")] if key_words else None,
                 is_fwf = is_fwf,
                 colnames = colnames,
-                colspecs = colspecs
+                colspecs = colspecs,
+                coltypes = st.session_state.coltypes if is_fwf else None
             )
+            key_words = [kw.strip() for kw in key_words.split(",")] if key_words else None
 
-            # Perform extraction
-            if handle_extraction(extractor, "URL"):
-                st.session_state.state = "Data Loaded"
-                st.rerun()
+            # files are downloaded concurrently and cached, so retrying only fetches what changed
+            handle_extraction("URL", dict(down_ext=extensions, sep=sep, encoding=encoding, is_fwf=is_fwf),
+                              extract_url, url.strip(), depth, key_words, options, session_dir(),
+                              st.session_state.standardized_dict, list(st.session_state.Data_Sources))
 
         else:
             st.warning("Please enter a valid URL")
@@ -197,48 +279,64 @@ elif st.session_state.source_data == "Local file":
 
     sep = ','
     encoding = 'latin1'
-    if any(ext in ['.csv'] for ext in extensions):
+    # files inside archives cannot be sniffed before extraction and use these settings
+    if any(ext in ARCHIVE_EXTENSIONS for ext in files_extensions):
         sep, encoding = render_csv_options()
-
-    if uploaded_files is not None and st.button("Process Local Files"):
-        if 'temp_dir' not in st.session_state:
-            st.session_state.temp_dir = tempfile.mkdtemp()
-
+    file_settings = render_sniffed_options(uploaded_files or [], is_fwf, sep, encoding)
+
+    if uploaded_files and st.button("Process Local Files"):
+        # Ensure extensions list has unique values before passing to Extractor
+        extensions = list(dict.fromkeys(extensions)) if extensions else []
+        options = dict(
+            down_ext=extensions,
+            sep=sep,
+            encoding=encoding,
+            is_fwf=is_fwf,
+            colnames=colnames,
+            colspecs=colspecs,
+            coltypes=st.session_state.coltypes if is_fwf else None
+        )
+        staged, reused, skipped = [], [], []
         try:
             for uploaded_file in uploaded_files:
-                file_path = Path(st.session_state.temp_dir) / uploaded_file.name
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-
-            # Ensure extensions list has unique values before passing to Extractor
-            extensions = list(dict.fromkeys(extensions)) if extensions else []
-
-            extractor = Extractor(
-                input_path=st.session_state.temp_dir,
-                down_ext=extensions,
-                sep=sep,
-                output_path="./data",
-                encoding=encoding,
-                is_fwf=is_fwf,
-                colnames=colnames,
-                colspecs=colspecs
-            )
-            dask_dfs = extractor.s4h_extract()
-            if dask_dfs:
-                if isinstance(dask_dfs, list):
-                    st.session_state.Data_Sources.extend(dask_dfs)
-                    st.info(f"Added {len(dask_dfs)} datasets to your workspace")
+                file_sep, file_encoding = file_settings[uploaded_file.file_id]
+                file_options = dict(options, sep=file_sep, encoding=file_encoding)
+                key = file_key(uploaded_file.getbuffer(), options_fingerprint(file_options))
+                # skipped only while the datasets it added are still in the workspace
+                if in_workspace(st.session_state.ingested.get(key)):
+                    skipped.append(uploaded_file.name)
+                    continue
+                entry = lookup(key)
+                if entry is not None:
+                    reused.append((key, entry))
                 else:
-                    st.session_state.Data_Sources.append(dask_dfs)
-                    st.info("Added 1 dataset to your workspace")
-
-                st.success("Data extraction completed successfully!")
+                    staged.append((key, uploaded_file.name, stage_upload(uploaded_file, key), file_options))
+        except Exception as e:
+            st.error(f"Failed to process {uploaded_file.name}: {str(e)}")
+            st.stop()
+
+        if skipped:
+            st.info(f"Already in your workspace with these options, skipped: {', '.join(skipped)}")
+
+        if reused:
+            st.info(f"Reusing earlier extraction of {len(reused)} file(s): "
+                    f"{', '.join(entry['name'] for _, entry in reused)}")
+        # fixed-width specs are not recorded, a recipe derives them from its own dictionary
+        recipe_options = {k: v for k, v in options.items() if k not in ("colnames", "colspecs", "coltypes")}
+
+        if staged or reused:
+            def attach_ingestion(output):
+                paths, handles = output
+                add_data_sources(handles)
+                st.session_state.ingested.update(paths)
                 st.session_state.state = "Data Loaded"
-                st.rerun()
-            else:
-                st.error("No data was extracted. Please check your input files.")
+                return f"Added {len(handles)} datasets to your workspace"
 
-        except Exception as e:
-            st.error(f"Failed to process {os.path.basename(file_path)}: {str(e)}")
+            job = submit_job("Extraction from local files", extract_local, staged, reused, session_dir(),
+                             st.session_state.standardized_dict, list(st.session_state.Data_Sources),
+                             on_done=recorded(attach_ingestion, "extract", **recipe_options))
+            st.info(f"🔄 Extracting {len(staged)} new file(s) in the background (job {job.id}). "
+                    "You can keep using the app; the datasets are added to your workspace when it finishes.")
 
+show_jobs()
 show_session_state()
\ No newline at end of file
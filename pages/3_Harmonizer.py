@@ -1,13 +1,22 @@
-import tempfile
-import io
-import zipfile
+import os
 from pathlib import Path
 
 import streamlit as st
 import pandas as pd
-from socio4health.utils import harmonizer_utils
 
-from utils import mode, initialize_session_state, show_session_state, add_logo
+from export import FORMATS, MIME_TYPES, export_datasets
+from jobs import submit_job, show_jobs
+from recipe import recorded
+from snapshots import stage_key, lookup_snapshot, save_snapshot, versions
+from translation import TRANSLATOR, translate_columns, get_translation_cache
+from merging import dataset_schemas, similarity_matrix, merge_groups, merge_datasets
+from selection import select_datasets, get_key_index_cache, cached_value_indexes, value_indexes, \
+    estimate_kept_rows
+from profiling import profile_datasets, cached_profiles, columns_to_drop, drop_nan_columns, get_profile_cache
+from models import install_model, get_model_registry, get_classification_cache, classify_rows, BATCH_SIZE
+from utils import mode, initialize_session_state, show_session_state, add_logo, set_data_sources, open_data_sources, \
+    show_dataset_preview, available_columns, version_cached
+from workspace import session_dir, export_dir
 from socio4health import Harmonizer  # asumiendo que tu clase se llama así
 
 st.set_page_config(page_title="Harmonizer", page_icon="assets/s4h.ico", layout="wide")
@@ -48,7 +57,6 @@ with st.expander("Deep guide (easy read for beginners)", expanded=True):
         st.info("Add an explanatory diagram at 'assets/harmonizer_diagram.png' to show a visual overview here.")
 
 
-st.subheader("Vertical Merge")
 if not st.session_state.Data_Sources:
     st.warning("⚠️ No data sources loaded. Please upload data first.")
     st.stop()
@@ -57,278 +65,387 @@ if st.session_state.standardized_dict is None:
     st.warning("⚠️ No standardized dictionary found. Please standardize a dictionary first.")
     st.stop()
 
-har = Harmonizer()
-har.dict_df = st.session_state.standardized_dict
-
-similarity_threshold = st.slider(
-    "Similarity Threshold",
-    min_value=0.0, max_value=1.0, value=0.9, step=0.05
-)
-
-nan_threshold = st.slider(
-    "NaN Threshold",
-    min_value=0.0, max_value=1.0, value=0.9, step=0.05
-)
-
-dfs = st.session_state.Data_Sources
-
-har.similarity_threshold = similarity_threshold
-har.nan_threshold = nan_threshold
-
-# Clean NaN columns tool
-st.subheader("Clean NaN Columns")
-with st.expander("Drop columns with many NaNs (options)", expanded=False):
-    st.markdown("Columns where the proportion of missing values is greater than the NaN Threshold will be dropped.")
-    use_sampling = st.checkbox("Use sampling for NaN detection (faster for large datasets)")
-    sample_frac = None
-    if use_sampling:
-        sample_frac = st.number_input("Sample fraction (0 < frac <= 1)", min_value=0.01, max_value=1.0, value=0.1, step=0.01)
-
-    if st.button("Drop NaN Columns"):
-        # apply settings
-        try:
-            har.sample_frac = sample_frac
-            # run on the session Data_Sources
-            with st.spinner("Cleaning columns with many NaNs..."):
-                dfs_in = st.session_state.Data_Sources
-                cleaned = har.drop_nan_columns(dfs_in)
-
-                # harmonizer returns either a DataFrame or list
-                if isinstance(cleaned, list):
-                    st.session_state.Data_Sources = cleaned
-                else:
-                    st.session_state.Data_Sources = [cleaned]
-
-                st.success("Dropped columns with many NaNs")
-                st.write("Preview of cleaned datasets:")
-                for i, df in enumerate(st.session_state.Data_Sources):
-                    try:
-                        st.write(f"DataFrame {i + 1} shape: {len(df)} rows, {len(df.columns)} columns")
-                        st.dataframe(df.head(5))
-                    except Exception:
-                        st.write(f"DataFrame {i + 1}: preview not available")
-
-        except Exception as e:
-            st.error(f"Error while dropping NaN columns: {e}")
-
-if st.button("Run Vertical Merge"):
-    with st.spinner("Running vertical merge..."):
-        try:
-            merged = har.s4h_vertical_merge(dfs)
-            st.session_state.Data_Sources = merged
-
-            st.success("Vertical merge completed!")
-            st.write("Preview of merged data:")
-
-            for i, df in enumerate(merged):
-                st.write(f"DataFrame {i + 1} shape: {len(df)} rows, {len(df.columns)} columns")
-                st.dataframe(df.head(5))
-
-        except Exception as e:
-            st.error(f"Error during harmonization: {e}")
-
-st.subheader("Dictionary Grouping")
-with st.expander("Dictionary Grouping Options", expanded=False):
-    options = har.s4h_get_available_columns(dfs)
-    extra_cols = st.multiselect("Extra Columns", options=options)
-    har.extra_cols = extra_cols
-
-    st.markdown("**Model (for classification)**")
-    model_file = st.file_uploader("Upload model (zip with a model folder inside)", type=["zip"])
-
-    # Button to extract/upload model and remember extracted path in session_state
-    if st.button("Upload & Extract Model"):
-        if model_file is None:
-            st.error("Please choose a model zip file to upload.")
-        else:
-            # Create models directory in project root and extract the zip
-            models_dir = Path("bert_model")
-            if models_dir.exists():
-                import shutil
-                shutil.rmtree(models_dir)
-            models_dir.mkdir(exist_ok=True)
-
-            import zipfile
-            try:
-                with zipfile.ZipFile(model_file, 'r') as zip_ref:
-                    zip_ref.extractall(models_dir)
 
-                # Determine actual model folder: if the zip contained a single top-level folder, use it.
-                children = [p for p in models_dir.iterdir()]
-                model_path = models_dir
-                if len(children) == 1 and children[0].is_dir():
-                    model_path = children[0]
+def new_harmonizer():
+    har = Harmonizer()
+    har.dict_df = st.session_state.standardized_dict
+    return har
 
-                st.session_state.bert_model_path = str(model_path)
-                st.success(f"Model extracted to {model_path}")
-                st.write("Model files:")
-                for p in model_path.rglob('*'):
-                    st.write('-', str(p.relative_to(model_path)))
 
-            except Exception as e:
-                st.error(f"Failed to extract model zip: {e}")
+# Each section below is a fragment: changing one of its widgets reruns only that section.
+# The Harmonizer holds the settings shared between sections and is kept per workspace version.
+har = version_cached("harmonizer", new_harmonizer)
 
-    # Show currently extracted model path if any
-    if 'bert_model_path' in st.session_state:
-        st.info(f"Using model at: `{st.session_state.bert_model_path}`")
 
-    st.markdown("---")
+def attach_step(preview_key, message):
+    def attach(handles):
+        set_data_sources(handles)
+        st.session_state[preview_key] = handles
+        return message
+    return attach
 
-    # Separate action: Translate dictionary (no model required)
-    if st.button("Run Dictionary Translation"):
-        with st.spinner("Running dictionary translation..."):
-            try:
-                dic = st.session_state.standardized_dict
-                dic = harmonizer_utils.s4h_translate_column(dic, "question", language="en")
-                st.success("Questions translation completed")
-                dic = harmonizer_utils.s4h_translate_column(dic, "description", language="en")
-                st.success("Descriptions translation completed")
-                dic = harmonizer_utils.s4h_translate_column(dic, "possible_answers", language="en")
-                st.success("Possible answers translation completed")
-                har.dict_df = dic
-                st.session_state.standardized_dict = dic
 
-                st.success("Dictionary translation completed")
+def start_job(label, fn, *args, on_done=None, **kwargs):
+    """Submit a job from a section and rerun the whole page, so the jobs panel starts polling it."""
+    job = submit_job(label, fn, *args, on_done=on_done, **kwargs)
+    message = f"{label} started in the background (job {job.id})."
+    st.session_state.messages.append(("info", message))
+    st.toast(message)
+    st.rerun()
 
-            except Exception as e:
-                st.error(f"Error during dictionary translation: {e}")
 
-    st.markdown("---")
+def run_stage(label, params, on_done, fn, *args):
+    """Run a stage as a job, or restore its snapshot if it already ran on this data with these parameters."""
+    inputs = list(st.session_state.Data_Sources)
+    key = stage_key(inputs, label, params)
 
-    # Separate action: Classification (requires an extracted model)
-    if st.button("Run Dictionary Classification"):
-        if 'bert_model_path' not in st.session_state:
-            st.error("Please upload and extract a model first using 'Upload & Extract Model'.")
-            st.stop()
+    def attach(handles):
+        save_snapshot(key, label, inputs, handles)
+        return on_done(handles)
 
-        model_path = st.session_state.bert_model_path
+    snapshot = lookup_snapshot(key)
+    if snapshot is not None:
+        message = f"{attach(snapshot)} (restored from an earlier run)"
+        st.session_state.messages.append(("success", message))
+        st.toast(message)
+        # the workspace changed, so every section is rerun
+        st.rerun()
+    start_job(label, fn, *args, on_done=attach)
 
-        with st.spinner("Running dictionary classification..."):
-            try:
-                dic = st.session_state.standardized_dict
-
-                required_cols = ["question_en", "description_en", "possible_answers_en"]
-                missing_cols = [col for col in required_cols if col not in dic.columns]
-                if missing_cols:
-                    st.error(f"Missing required columns: {', '.join(missing_cols)}")
-                    st.stop()
-
-                classified_dic = harmonizer_utils.s4h_classify_rows(
-                    dic,
-                    "question_en",
-                    "description_en",
-                    "possible_answers_en",
-                    new_column_name="category",
-                    MODEL_PATH=model_path
-                )
 
-                st.session_state.standardized_dict = classified_dic
+def show_preview(title, handles, key):
+    # pages are read from the stored Parquet files on demand, not kept in session_state
+    st.write(title)
+    for i, handle in enumerate(handles):
+        show_dataset_preview(handle, f"DataFrame {i + 1}", key=f"{key}_{i}")
 
-                st.success("Dictionary classification completed")
-                st.write("Preview of classified dictionary:")
-                st.dataframe(classified_dic.head(5))
 
-                # Add a download button so users can save the classified dictionary as CSV
-                try:
-                    csv = classified_dic.to_csv(index=False)
-                    st.download_button(
-                        label="Download classified dictionary as CSV",
-                        data=csv,
-                        file_name="classified_dictionary.csv",
-                        mime="text/csv",
-                    )
-                except Exception:
-                    st.warning("Unable to generate CSV for download (unexpected dtype).")
+# Every stage result is kept as a version, so earlier states come back without recomputing
+history = versions()
+if len(history) > 1:
+    with st.expander(f"Workspace history ({len(history)} versions)", expanded=False):
+        labels = [f"{i + 1}. {v['label']} ({len(v['handles'])} datasets)" for i, v in enumerate(history)]
+        choice = st.selectbox("Version", range(len(history)), index=len(history) - 1,
+                              format_func=lambda i: labels[i])
+        if st.button("Restore version"):
+            set_data_sources(history[choice]["handles"])
+            st.rerun()
 
-            except Exception as e:
-                st.error(f"Error during dictionary classification: {str(e)}")
-                raise e
-
-st.subheader("Data Selector")
-with st.expander("Data Joining Options", expanded=False):
-    category = st.multiselect(
-        "Categories",
-        options=[
-            "Business", "Education", "Fertility", "Housing",
-            "Identification", "Migration", "Nonstandard job", "Social Security"
-        ],
-        default=[
-            "Business", "Education", "Fertility", "Housing",
-            "Identification", "Migration", "Nonstandard job", "Social Security"
-        ]
+
+@st.fragment
+def merge_section():
+    st.subheader("Vertical Merge")
+    har.similarity_threshold = st.slider(
+        "Similarity Threshold",
+        min_value=0.0, max_value=1.0, value=0.9, step=0.05, key="similarity_threshold"
     )
-    # `st.multiselect` returns a list of selected categories; pass it directly.
-    har.categories = category
-    # Allow null/none selection by adding a 'None' option
-    key_col_options = ["None"] + options
-    key_col_choice = st.selectbox("Column Selection (optional)", options=key_col_options, index=0)
-    har.key_col = None if key_col_choice == "None" else key_col_choice
-
-    key_val_input = st.text_input("Values (comma separated, optional)")
-    if key_val_input and key_val_input.strip():
-        har.key_val = [v.strip() for v in key_val_input.split(',') if v.strip()]
-    else:
-        har.key_val = []
-
-    if st.button("Run Data Selector"):
-        if not har.categories:
-            st.error("Please select at least one category.")
-            st.stop()
-        # If a key column is provided, require at least one value
-        if har.key_col is not None and not har.key_val:
-            st.error("Please provide at least one value when a column is selected.")
-            st.stop()
-        with st.spinner("Running data selector..."):
+
+    # groups come from column similarities cached per set of schemas, so moving the slider is instant
+    schemas = version_cached("schemas", lambda: dataset_schemas(open_data_sources()))
+    merge_plan = merge_groups(schemas, har.similarity_threshold, har.min_common_columns)
+    with st.expander(f"Dry run: {len(merge_plan)} group(s) at a Similarity Threshold of {har.similarity_threshold:.2f}",
+                     expanded=False):
+        for n, group in enumerate(merge_plan):
+            st.write(f"Group {n + 1}: " + ", ".join(f"DataFrame {i + 1}" for i in group))
+        similarity = similarity_matrix(schemas)[0]
+        labels = [f"DataFrame {i + 1}" for i in range(len(schemas))]
+        st.dataframe(pd.DataFrame(similarity, index=labels, columns=labels))
+
+    if st.button("Run Vertical Merge"):
+        merge_params = dict(similarity_threshold=har.similarity_threshold, min_common_columns=har.min_common_columns)
+        run_stage("Vertical merge", merge_params,
+                  recorded(attach_step("merge_preview", "Vertical merge completed!"), "vertical_merge", **merge_params),
+                  merge_datasets, st.session_state.Data_Sources, merge_plan, session_dir(), st.session_state.standardized_dict)
+
+    if st.session_state.get("merge_preview"):
+        show_preview("Preview of merged data:", st.session_state.merge_preview, "merge_preview")
+
+
+@st.fragment
+def nan_section():
+    # Clean NaN columns tool
+    st.subheader("Clean NaN Columns")
+    har.nan_threshold = st.slider(
+        "NaN Threshold",
+        min_value=0.0, max_value=1.0, value=0.9, step=0.05, key="nan_threshold"
+    )
+    nan_threshold = har.nan_threshold
+    with st.expander("Drop columns with many NaNs (options)", expanded=False):
+        st.markdown("Columns where the proportion of missing values is greater than the NaN Threshold will be dropped.")
+        use_sampling = st.checkbox("Use sampling for NaN detection (faster for large datasets)")
+        sample_frac = None
+        if use_sampling:
+            sample_frac = st.number_input("Sample fraction (0 < frac <= 1)", min_value=0.01, max_value=1.0, value=0.1, step=0.01)
+
+        # profiles are computed once per dataset, so changing the threshold never reads the data again
+        handles = st.session_state.Data_Sources
+        profiles = cached_profiles(handles, sample_frac)
+        if all(profile is not None for profile in profiles):
+            st.write(f"Columns that would be dropped at a NaN Threshold of {nan_threshold:.2f}:")
+            for i, profile in enumerate(profiles):
+                drop = columns_to_drop(profile, nan_threshold)
+                with st.expander(f"DataFrame {i + 1}: {len(drop)} of {len(profile['columns'])} columns", expanded=False):
+                    st.dataframe(pd.DataFrame([
+                        {"column": column, "dtype": stats["dtype"], "NaN fraction": stats["null_fraction"],
+                         "distinct (approx.)": stats["distinct"], "drop": column in drop}
+                        for column, stats in profile["columns"].items()
+                    ]))
+        elif st.button("Profile missing values"):
+            start_job("Missing-value profiling", profile_datasets, handles, sample_frac, get_profile_cache(),
+                      on_done=lambda profiles: f"Profiled {len(profiles)} datasets")
+
+        if st.button("Drop NaN Columns"):
+            # apply settings
             try:
-                dfs = st.session_state.Data_Sources
-                filtered_dask_dfs = har.s4h_data_selector(dfs)
-                st.session_state.Data_Sources = filtered_dask_dfs
+                # run on the session Data_Sources, reusing their cached profiles
+                nan_params = dict(nan_threshold=nan_threshold, sample_frac=sample_frac)
+                run_stage("Drop NaN columns", nan_params,
+                          recorded(attach_step("nan_preview", "Dropped columns with many NaNs"), "drop_nan_columns",
+                                   **nan_params),
+                          drop_nan_columns, handles, nan_threshold, session_dir(), sample_frac, get_profile_cache())
 
-                st.success("Data selection completed!")
-                st.write("Preview of filtered data:")
-                for i, df in enumerate(filtered_dask_dfs):
-                    st.write(f"DataFrame {i + 1} shape: {len(df)} rows, {len(df.columns)} columns")
-                    st.dataframe(df.head(5))
+            except Exception as e:
+                st.error(f"Error while dropping NaN columns: {e}")
 
-                # Download buttons for each resulting DataFrame and a ZIP of all
+        if st.session_state.get("nan_preview"):
+            show_preview("Preview of cleaned datasets:", st.session_state.nan_preview, "nan_preview")
+
+
+@st.fragment
+def grouping_section():
+    st.subheader("Dictionary Grouping")
+    with st.expander("Dictionary Grouping Options", expanded=False):
+        extra_cols = st.multiselect("Extra Columns", options=available_columns(), key="extra_cols")
+        har.extra_cols = extra_cols
+
+        st.markdown("**Model (for classification)**")
+        model_file = st.file_uploader("Upload model (zip with a model folder inside)", type=["zip"])
+
+        # Button to extract/upload model and remember extracted path in session_state
+        if st.button("Upload & Extract Model"):
+            if model_file is None:
+                st.error("Please choose a model zip file to upload.")
+            else:
                 try:
-                    for i, df in enumerate(filtered_dask_dfs):
-                        try:
-                            dfp = df.compute() if hasattr(df, "compute") else df
-                            csv_bytes = dfp.to_csv(index=False).encode("utf-8")
-                            st.download_button(
-                                label=f"Download DataFrame {i+1} as CSV",
-                                data=csv_bytes,
-                                file_name=f"dataframe_{i+1}.csv",
-                                mime="text/csv",
-                            )
-                        except Exception:
-                            st.warning(f"Unable to prepare CSV for DataFrame {i+1}")
-
-                    if len(filtered_dask_dfs) > 1:
-                        zip_buffer = io.BytesIO()
-                        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zf:
-                            for i, df in enumerate(filtered_dask_dfs):
-                                try:
-                                    dfp = df.compute() if hasattr(df, "compute") else df
-                                    csv_data = dfp.to_csv(index=False).encode("utf-8")
-                                    zf.writestr(f"dataframe_{i+1}.csv", csv_data)
-                                except Exception:
-                                    # skip any problematic DF
-                                    pass
-                        zip_buffer.seek(0)
-                        st.download_button(
-                            label="Download all DataFrames as zip",
-                            data=zip_buffer.getvalue(),
-                            file_name="dataframes.zip",
-                            mime="application/zip",
-                        )
+                    # Extract once per distinct model; identical uploads reuse the same folder
+                    model_key, model_path = install_model(model_file)
+                    model_path = Path(model_path)
+
+                    st.session_state.bert_model_key = model_key
+                    st.session_state.bert_model_path = str(model_path)
+                    st.success(f"Model extracted to {model_path}")
+                    st.write("Model files:")
+                    for p in model_path.rglob('*'):
+                        st.write('-', str(p.relative_to(model_path)))
+
                 except Exception as e:
-                    st.warning(f"Could not create download buttons: {e}")
+                    st.error(f"Failed to extract model zip: {e}")
+
+        # Show currently extracted model path if any
+        if 'bert_model_path' in st.session_state:
+            st.info(f"Using model at: `{st.session_state.bert_model_path}`")
+        registry = get_model_registry()
+        st.caption(f"Models loaded in memory: {len(registry.loaded())} of {registry.max_models}")
+
+        st.markdown("---")
+
+        # Separate action: Translate dictionary (no model required)
+        if st.button("Run Dictionary Translation"):
+            def attach_translation(output):
+                dic, stats = output
+                st.session_state.standardized_dict = dic
+                return (f"Dictionary translation completed: {stats['unique']} distinct texts, "
+                        f"{stats['cached']} from cache, {stats['translated']} translated")
+
+            start_job(
+                "Dictionary translation",
+                translate_columns,
+                st.session_state.standardized_dict,
+                ["question", "description", "possible_answers"],
+                language="en",
+                cache=get_translation_cache(),
+                on_done=recorded(attach_translation, "translate_dictionary",
+                                 columns=["question", "description", "possible_answers"], language="en",
+                                 translator=TRANSLATOR),
+            )
+
+        st.markdown("---")
+
+        # Separate action: Classification (requires an extracted model)
+        batch_size = st.number_input("Classification batch size", min_value=1, max_value=512, value=BATCH_SIZE, step=8)
+        if st.button("Run Dictionary Classification"):
+            if 'bert_model_key' not in st.session_state:
+                st.error("Please upload and extract a model first using 'Upload & Extract Model'.")
+                st.stop()
+
+            model_key = st.session_state.bert_model_key
+            model_path = st.session_state.bert_model_path
+            dic = st.session_state.standardized_dict
+
+            required_cols = ["question_en", "description_en", "possible_answers_en"]
+            missing_cols = [col for col in required_cols if col not in dic.columns]
+            if missing_cols:
+                st.error(f"Missing required columns: {', '.join(missing_cols)}")
+                st.stop()
+
+            def attach_classification(output):
+                classified_dic, stats = output
+                st.session_state.standardized_dict = classified_dic
+                st.session_state.classified_dict = classified_dic
+                return (f"Dictionary classification completed: {stats['cached']} rows from cache, "
+                        f"{stats['computed']} classified by the model")
+
+            def run_classification(registry, model_key, model_path, dic, batch_size, cache):
+                """Job body: classify with the shared model, loading it only if some rows are not cached."""
+                return classify_rows(dic, "question_en", "description_en", "possible_answers_en",
+                                     lambda: registry.get(model_key, model_path), model_key,
+                                     new_column_name="category", batch_size=batch_size, cache=cache)
+
+            start_job(
+                "Dictionary classification",
+                run_classification,
+                registry,
+                model_key,
+                model_path,
+                dic,
+                batch_size,
+                get_classification_cache(),
+                on_done=recorded(attach_classification, "classify_dictionary", model_key=model_key,
+                                 model_path=model_path, batch_size=batch_size),
+            )
+
+        classified_dic = st.session_state.get("classified_dict")
+        if classified_dic is not None:
+            st.write("Preview of classified dictionary:")
+            st.dataframe(classified_dic.head(5))
+
+            # Add a download button so users can save the classified dictionary as CSV
+            try:
+                csv = classified_dic.to_csv(index=False)
+                st.download_button(
+                    label="Download classified dictionary as CSV",
+                    data=csv,
+                    file_name="classified_dictionary.csv",
+                    mime="text/csv",
+                )
+            except Exception:
+                st.warning("Unable to generate CSV for download (unexpected dtype).")
+
+
+def attach_data_selection(handles):
+    set_data_sources(handles)
+    st.session_state.selector_preview = handles
+    st.session_state.exports = None
+    return "Data selection completed!"
+
+
+def attach_exports(files):
+    st.session_state.exports = files
+    return f"Prepared {len(files)} file(s) for download"
+
+
+@st.fragment
+def selector_section():
+    st.subheader("Data Selector")
+    with st.expander("Data Joining Options", expanded=False):
+        category = st.multiselect(
+            "Categories",
+            options=[
+                "Business", "Education", "Fertility", "Housing",
+                "Identification", "Migration", "Nonstandard job", "Social Security"
+            ],
+            default=[
+                "Business", "Education", "Fertility", "Housing",
+                "Identification", "Migration", "Nonstandard job", "Social Security"
+            ]
+        )
+        # `st.multiselect` returns a list of selected categories; pass it directly.
+        har.categories = category
+        # Allow null/none selection by adding a 'None' option
+        key_col_options = ["None"] + available_columns()
+        key_col_choice = st.selectbox("Column Selection (optional)", options=key_col_options, index=0)
+        har.key_col = None if key_col_choice == "None" else key_col_choice
+
+        # frequent values of the column come from an index built once per dataset and column
+        value_options = {}
+        key_indexes = None
+        if har.key_col is not None:
+            key_indexes = cached_value_indexes(st.session_state.Data_Sources, har.key_col)
+            if all(index is not None for index in key_indexes):
+                for index in key_indexes:
+                    for value, count in index["top"]:
+                        value_options[value] = value_options.get(value, 0) + count
+            elif st.button(f"Index values of {har.key_col}"):
+                start_job(f"Value index of {har.key_col}", value_indexes, st.session_state.Data_Sources,
+                          har.key_col, cache=get_key_index_cache(),
+                          on_done=lambda indexes: f"Indexed the values of {len(indexes)} datasets")
+
+        key_val_choice = []
+        if value_options:
+            key_val_choice = st.multiselect(
+                "Values",
+                options=sorted(value_options, key=value_options.get, reverse=True),
+                format_func=lambda value: f"{value} ({value_options[value]} rows)",
+            )
+        key_val_input = st.text_input("Other values (comma separated, optional)" if value_options
+                                      else "Values (comma separated, optional)")
+        har.key_val = list(key_val_choice)
+        if key_val_input and key_val_input.strip():
+            har.key_val += [v.strip() for v in key_val_input.split(',') if v.strip() and v.strip() not in har.key_val]
+
+        if har.key_val and value_options:
+            kept = sum(estimate_kept_rows(index, har.key_val) for index in key_indexes)
+            total = sum(index["rows"] for index in key_indexes)
+            st.caption(f"Estimated rows kept: ~{kept} of {total}")
+
+        if st.button("Run Data Selector"):
+            if not har.categories:
+                st.error("Please select at least one category.")
+                st.stop()
+            # If a key column is provided, require at least one value
+            if har.key_col is not None and not har.key_val:
+                st.error("Please provide at least one value when a column is selected.")
+                st.stop()
+            # columns and matching row groups are selected while reading the stored files
+            select_params = dict(categories=har.categories, key_col=har.key_col, key_val=har.key_val,
+                                 extra_cols=har.extra_cols)
+            # the selected columns also depend on the dictionary categories
+            dictionary_hash = str(pd.util.hash_pandas_object(har.dict_df, index=False).sum())
+            run_stage("Data selection", dict(select_params, dictionary=dictionary_hash),
+                      recorded(attach_data_selection, "select_data", **select_params),
+                      select_datasets, st.session_state.Data_Sources, har, session_dir(), get_key_index_cache())
+
+        if st.session_state.get("selector_preview"):
+            filtered_handles = st.session_state.selector_preview
+            show_preview("Preview of filtered data:", filtered_handles, "selector_preview")
+
+            # Each result is written to disk once per format and the download buttons serve those files
+            export_format = st.selectbox("Download format", list(FORMATS))
+            if st.button("Prepare downloads"):
+                start_job("Export", export_datasets, filtered_handles, export_format, export_dir(),
+                          on_done=attach_exports)
+
+            # Streamlit reads the data of every download button into memory on each run, so only the
+            # file the user picks gets a button; the zip archive of all of them is offered first
+            exports = {name: path for path, name in reversed(st.session_state.get("exports") or [])
+                       if os.path.exists(path)}
+            if exports:
+                name = st.selectbox("File to download", list(exports))
+                with open(exports[name], "rb") as f:
+                    st.download_button(
+                        label=f"Download {name}",
+                        data=f,
+                        file_name=name,
+                        mime=MIME_TYPES[name.split(".", 1)[1]],
+                        # no rerun, which would read the file again
+                        on_click="ignore",
+                    )
 
-            except Exception as e:
-                st.error(f"Error during data selection: {e}")
 
+merge_section()
+nan_section()
+grouping_section()
+selector_section()
 
 # st.subheader("Data Joining")
 # with st.expander("Data Joining Options", expanded=False):
@@ -358,5 +475,6 @@ with st.expander("Data Joining Options", expanded=False):
 #             except Exception as e:
 #                 st.error(f"Error during data joining: {e}")
 
+show_jobs()
 show_session_state()
 
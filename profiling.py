@@ -0,0 +1,132 @@
+"""Missing-value profiles of workspace datasets.
+
+A profile holds, for every column of a dataset, its dtype, the fraction of
+missing values and an approximate count of distinct values (HyperLogLog, via
+``nunique_approx``). Profiles of all the datasets that are not profiled yet are
+computed together in a single Dask pass and stored in a persistent cache keyed
+by the dataset fingerprint, so previewing or dropping columns at any NaN
+threshold afterwards never reads the data again.
+"""
+
+import hashlib
+import json
+from pathlib import Path
+
+import dask
+import streamlit as st
+
+from cache_store import KeyValueCache
+from instrumentation import instrumented
+from workspace import write_dataset
+
+
+def dataset_fingerprint(handle, sample_frac=None):
+    """
+    Return the profile cache key of a stored dataset.
+
+    Parameters:
+    handle (DatasetHandle): Dataset to identify
+    sample_frac (float | None): Sample fraction the profile is computed on
+
+    Returns:
+    str: Hash of the Parquet files (path, size and modification time) and the sample fraction
+    """
+    path = Path(handle.path)
+    files = sorted(path.rglob("*")) if path.is_dir() else [path]
+    stats = [(str(f), f.stat().st_size, f.stat().st_mtime_ns) for f in files if f.is_file()]
+    payload = json.dumps([handle.path, stats, sample_frac])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _lazy_profile(df, sample_frac):
+    if sample_frac is not None:
+        df = df.sample(frac=sample_frac)
+    return {
+        "rows": df.shape[0],
+        "null_fraction": df.isna().mean(),
+        "distinct": {column: df[column].nunique_approx() for column in df.columns},
+    }
+
+
+@instrumented("Missing-value profiling")
+def profile_datasets(handles, sample_frac=None, cache=None):
+    """
+    Return the profile of each dataset, computing the missing ones in one pass.
+
+    Parameters:
+    handles (list): DatasetHandle of each dataset
+    sample_frac (float | None): Profile a random sample of this fraction of the rows
+    cache (KeyValueCache | None): Profile cache, defaults to the shared one
+
+    Returns:
+    list: For each dataset, a dict with "rows" and per-column "columns"
+    entries holding "dtype", "null_fraction" and "distinct"
+    """
+    if sample_frac is not None and not 0 < sample_frac <= 1:
+        raise ValueError("sample_frac must be between 0 and 1")
+    cache = cache if cache is not None else get_profile_cache()
+    keys = [dataset_fingerprint(h, sample_frac) for h in handles]
+    profiles = cache.get_many(keys)
+
+    pending = {key: h for key, h in zip(keys, handles) if key not in profiles}
+    if pending:
+        dfs = {key: h.open() for key, h in pending.items()}
+        results = dask.compute({key: _lazy_profile(df, sample_frac) for key, df in dfs.items()})[0]
+        computed = {}
+        for key, result in results.items():
+            df = dfs[key]
+            computed[key] = {
+                "rows": int(result["rows"]),
+                "columns": {
+                    str(column): {
+                        "dtype": str(df.dtypes[column]),
+                        "null_fraction": float(result["null_fraction"][column]),
+                        "distinct": int(round(result["distinct"][column])),
+                    }
+                    for column in df.columns
+                },
+            }
+        cache.set_many(computed)
+        profiles.update(computed)
+    return [profiles[key] for key in keys]
+
+
+def cached_profiles(handles, sample_frac=None, cache=None):
+    """Return the cached profile of each dataset, or None where it has not been computed."""
+    cache = cache if cache is not None else get_profile_cache()
+    keys = [dataset_fingerprint(h, sample_frac) for h in handles]
+    profiles = cache.get_many(keys)
+    return [profiles.get(key) for key in keys]
+
+
+def columns_to_drop(profile, nan_threshold):
+    """Return the columns whose fraction of missing values is greater than the threshold."""
+    if not 0 <= nan_threshold <= 1:
+        raise ValueError("Threshold must be between 0 and 1")
+    return [column for column, stats in profile["columns"].items() if stats["null_fraction"] > nan_threshold]
+
+
+@instrumented("Drop NaN columns")
+def drop_nan_columns(handles, nan_threshold, directory, sample_frac=None, cache=None):
+    """
+    Job body: drop the columns with too many missing values, using cached profiles.
+
+    Same rule as Harmonizer.drop_nan_columns, but only datasets that were never
+    profiled are read to compute their missing-value fractions.
+
+    Returns:
+    list: DatasetHandle of each cleaned dataset
+    """
+    profiles = profile_datasets(handles, sample_frac=sample_frac, cache=cache)
+    cleaned = []
+    for handle, profile in zip(handles, profiles):
+        drop = columns_to_drop(profile, nan_threshold)
+        # datasets without columns to drop are kept as they are stored
+        cleaned.append(write_dataset(handle.open().drop(columns=drop), directory) if drop else handle)
+    return cleaned
+
+
+@st.cache_resource
+def get_profile_cache():
+    """Return the on-disk cache of dataset profiles shared by all sessions."""
+    return KeyValueCache("profiles")
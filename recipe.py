@@ -0,0 +1,342 @@
+"""Recipes: the steps of a session, replayed without Streamlit.
+
+While the app is used, every step that succeeds (dictionary standardization,
+fixed-width parsing, extraction, NaN dropping, vertical merge, translation,
+classification and data selection) is recorded with its parameters in
+``st.session_state.recipe``. The recipe can be downloaded from the sidebar as
+a JSON file and replayed from the command line on new input folders, e.g. the
+files of a new survey wave::
+
+    python recipe.py recipe.json wave_2023/ wave_2024/ --dictionary dict.xlsx --output results/
+
+Each input folder is processed in its own worker process. The output of every
+stage is stored under ``S4H_RECIPE_CACHE_DIR`` (default ``./data/recipes``),
+keyed by the fingerprint of its inputs and of the parameters of that stage and
+all earlier ones, so re-running a recipe skips every stage whose inputs did
+not change.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import dask
+import dask.dataframe as dd
+
+RECIPE_VERSION = 1
+# layout of the stage directories; part of the stage keys, so stages stored in another layout are not reused
+STAGE_VERSION = 2
+CACHE_DIR = Path(os.environ.get("S4H_RECIPE_CACHE_DIR", "./data/recipes"))
+STEPS = (
+    "standardize_dictionary", "parse_fwf", "extract", "drop_nan_columns",
+    "vertical_merge", "translate_dictionary", "classify_dictionary", "select_data",
+)
+
+
+def record_step(step, **params):
+    """
+    Append a step to the recipe of the current session.
+
+    A step identical to the last recorded one (e.g. the fixed-width parse
+    repeated on every rerun) is recorded only once.
+    """
+    import streamlit as st
+
+    if step not in STEPS:
+        raise ValueError(f"Unknown recipe step '{step}'")
+    entry = {"step": step, "params": json.loads(json.dumps(params, default=str))}
+    recipe = st.session_state.setdefault("recipe", [])
+    if not recipe or recipe[-1] != entry:
+        recipe.append(entry)
+
+
+def recorded(on_done, step, **params):
+    """Wrap a job callback so the step is recorded once the job has succeeded."""
+    def callback(result):
+        record_step(step, **params)
+        return on_done(result)
+    return callback
+
+
+def recipe_json(steps):
+    """Serialize recorded steps as a recipe file."""
+    return json.dumps({"version": RECIPE_VERSION, "steps": steps}, indent=2)
+
+
+def load_recipe(path):
+    """Read a recipe file and return its steps."""
+    with open(path, "r", encoding="utf-8") as f:
+        recipe = json.load(f)
+    if recipe.get("version") != RECIPE_VERSION:
+        raise ValueError(f"Unsupported recipe version {recipe.get('version')}")
+    for entry in recipe["steps"]:
+        if entry["step"] not in STEPS:
+            raise ValueError(f"Unknown recipe step '{entry['step']}'")
+    return recipe["steps"]
+
+
+class PipelineState:
+    """Data flowing between recipe stages: dictionary, fixed-width specs and datasets."""
+
+    def __init__(self, dictionary=None, colnames=None, colspecs=None, handles=None):
+        self.dictionary = dictionary
+        self.colnames = colnames
+        self.colspecs = colspecs
+        self.handles = handles or []
+
+    def save(self, directory, final_directory=None):
+        """Write the state into a stage directory that is renamed to ``final_directory`` afterwards."""
+        directory = Path(directory)
+        datasets = [h.path for h in self.handles]
+        if final_directory is not None:
+            datasets = [str(Path(final_directory) / Path(p).relative_to(directory))
+                        if Path(p).is_relative_to(directory) else p for p in datasets]
+        if self.dictionary is not None:
+            from dictionaries import plain_dictionary, write_dictionary
+
+            write_dictionary(plain_dictionary(self.dictionary), directory / "dictionary.json")
+        with open(directory / "state.json", "w", encoding="utf-8") as f:
+            json.dump({"colnames": self.colnames, "colspecs": self.colspecs, "datasets": datasets}, f)
+
+    @classmethod
+    def load(cls, directory):
+        from dictionaries import read_dictionary
+        from workspace import handle_for
+
+        directory = Path(directory)
+        with open(directory / "state.json", "r", encoding="utf-8") as f:
+            state = json.load(f)
+        dictionary_path = directory / "dictionary.json"
+        dictionary = read_dictionary(dictionary_path) if dictionary_path.exists() else None
+        colspecs = [tuple(spec) for spec in state["colspecs"]] if state["colspecs"] else state["colspecs"]
+        return cls(dictionary, state["colnames"], colspecs, [handle_for(p) for p in state["datasets"]])
+
+
+def _hash_files(paths):
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(str(Path(path).name).encode("utf-8"))
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _store(dfs, directory):
+    from workspace import handle_for
+
+    handles = []
+    for i, df in enumerate(dfs):
+        if not dask.is_dask_collection(df):
+            df = dd.from_pandas(df, npartitions=1)
+        path = Path(directory) / f"dataset_{i}"
+        df.to_parquet(path, write_index=False, overwrite=True)
+        handles.append(handle_for(path))
+    return handles
+
+
+def _harmonizer(state, **params):
+    from socio4health import Harmonizer
+
+    har = Harmonizer()
+    har.dict_df = state.dictionary
+    for name, value in params.items():
+        setattr(har, name, value)
+    return har
+
+
+def run_stage(step, params, state, inputs, directory):
+    """
+    Run one recipe stage.
+
+    Parameters:
+    step (str): One of STEPS
+    params (dict): Parameters recorded for the step
+    state (PipelineState): Output of the previous stage
+    inputs (dict): "folder" with the data files and "dictionary" file of this run
+    directory (Path): Empty directory for the outputs of the stage
+
+    Returns:
+    PipelineState: Output of the stage
+    """
+    from cache_store import KeyValueCache
+
+    if step == "standardize_dictionary":
+        from dictionaries import content_hash, standardize_dictionary
+
+        # the same dictionary file reuses the standardization done on the Dictionary page
+        path = inputs["dictionary"]
+        data = Path(path).read_bytes()
+        dictionary, _ = standardize_dictionary(content_hash(data), str(path), data)
+        return PipelineState(dictionary, state.colnames, state.colspecs, state.handles)
+
+    if step == "parse_fwf":
+        from socio4health.utils import extractor_utils
+
+        colnames, colspecs = extractor_utils.s4h_parse_fwf_dict(state.dictionary)
+        return PipelineState(state.dictionary, colnames, colspecs, state.handles)
+
+    if step == "extract":
+        from fwf import FwfExtractor, declared_types
+
+        is_fwf = params.get("is_fwf", False)
+        extractor = FwfExtractor(input_path=str(inputs["folder"]), output_path=str(directory / "extracted"),
+                              down_ext=params.get("down_ext"), sep=params.get("sep"),
+                              encoding=params.get("encoding", "latin1"), is_fwf=is_fwf,
+                              colnames=state.colnames if is_fwf else None,
+                              colspecs=state.colspecs if is_fwf else None,
+                              coltypes=declared_types(state.dictionary) if is_fwf and state.dictionary is not None
+                              else None)
+        dfs = extractor.s4h_extract() or []
+        if not dfs:
+            raise ValueError(f"No data was extracted from {inputs['folder']}")
+        from optimization import optimize_datasets, reference_dtypes
+
+        stored = _store(dfs, directory)
+        shutil.rmtree(directory / "extracted", ignore_errors=True)
+        handles = optimize_datasets(stored, str(directory), state.dictionary, reference_dtypes(state.handles),
+                                    discard=True)
+        return PipelineState(state.dictionary, state.colnames, state.colspecs, state.handles + handles)
+
+    if step == "drop_nan_columns":
+        from profiling import drop_nan_columns
+
+        handles = drop_nan_columns(state.handles, params["nan_threshold"], str(directory),
+                                   params.get("sample_frac"), KeyValueCache("profiles"))
+        return PipelineState(state.dictionary, state.colnames, state.colspecs, handles)
+
+    if step == "vertical_merge":
+        from merging import dataset_schemas, merge_datasets, merge_groups
+
+        schemas = dataset_schemas([h.open() for h in state.handles])
+        groups = merge_groups(schemas, params["similarity_threshold"], params.get("min_common_columns", 1))
+        handles = merge_datasets(state.handles, groups, str(directory), state.dictionary)
+        return PipelineState(state.dictionary, state.colnames, state.colspecs, handles)
+
+    if step == "translate_dictionary":
+        from translation import TRANSLATOR, get_translator, translate_columns
+
+        translator = params.get("translator", TRANSLATOR)
+        cache = KeyValueCache("translation_" + "".join(c if c.isalnum() else "_" for c in translator))
+        dictionary, _ = translate_columns(state.dictionary, params["columns"], language=params.get("language", "en"),
+                                          translator=get_translator(translator), cache=cache)
+        return PipelineState(dictionary, state.colnames, state.colspecs, state.handles)
+
+    if step == "classify_dictionary":
+        from models import ModelRegistry, classify_rows
+
+        registry = ModelRegistry(max_models=1)
+        dictionary, _ = classify_rows(state.dictionary, "question_en", "description_en", "possible_answers_en",
+                                      lambda: registry.get(params["model_key"], params["model_path"]),
+                                      params["model_key"], new_column_name="category",
+                                      batch_size=params.get("batch_size", 32), cache=KeyValueCache("classification"))
+        return PipelineState(dictionary, state.colnames, state.colspecs, state.handles)
+
+    if step == "select_data":
+        from selection import select_datasets
+
+        har = _harmonizer(state, categories=params["categories"], key_col=params.get("key_col"),
+                          key_val=params.get("key_val") or [], extra_cols=params.get("extra_cols") or [])
+        handles = select_datasets(state.handles, har, str(directory), KeyValueCache("key_index"))
+        return PipelineState(state.dictionary, state.colnames, state.colspecs, handles)
+
+    raise ValueError(f"Unknown recipe step '{step}'")
+
+
+def run_recipe(steps, folder, dictionary=None, output=None, cache_dir=CACHE_DIR):
+    """
+    Run a recipe on one input folder, reusing cached stage outputs.
+
+    Parameters:
+    steps (list): Steps of the recipe, see load_recipe()
+    folder (str): Folder with the data files to extract
+    dictionary (str | None): Dictionary file; defaults to the file recorded in the recipe, looked up in the folder
+    output (str | None): Directory where the final datasets and dictionary are written
+    cache_dir (Path): Directory of the stage cache
+
+    Returns:
+    dict: Folder, output directory and the number of stages computed and reused
+    """
+    folder = Path(folder)
+    if dictionary is None:
+        names = [e["params"].get("file") for e in steps if e["step"] == "standardize_dictionary"]
+        dictionary = folder / names[0] if names and names[0] else None
+    inputs = {"folder": folder, "dictionary": dictionary}
+
+    data_files = [p for p in folder.rglob("*") if p.is_file()]
+    key = _hash_files(data_files + ([Path(dictionary)] if dictionary else []))
+    state = PipelineState()
+    computed = reused = 0
+    for entry in steps:
+        payload = json.dumps([STAGE_VERSION, key, entry["step"], entry["params"]], sort_keys=True)
+        key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        directory = Path(cache_dir) / key
+        if (directory / "state.json").exists():
+            logging.info(f"{folder}: {entry['step']} reused")
+            state = PipelineState.load(directory)
+            reused += 1
+            continue
+        logging.info(f"{folder}: running {entry['step']}")
+        tmp_dir = directory.with_name(f"{directory.name}.{uuid.uuid4().hex}.tmp")
+        tmp_dir.mkdir(parents=True)
+        try:
+            state = run_stage(entry["step"], entry["params"], state, inputs, tmp_dir)
+            state.save(tmp_dir, final_directory=directory)
+            os.replace(tmp_dir, directory)
+        except OSError:
+            # another run with the same inputs stored this stage meanwhile
+            if not (directory / "state.json").exists():
+                raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        # handles written by the stage still point into the temporary directory
+        state = PipelineState.load(directory)
+        computed += 1
+
+    if output is not None:
+        from export import export_dataset
+
+        out_dir = Path(output) / folder.name
+        out_dir.mkdir(parents=True, exist_ok=True)
+        for i, handle in enumerate(state.handles):
+            export_dataset(handle.open(), str(out_dir / f"dataframe_{i + 1}.parquet"), "parquet")
+        if state.dictionary is not None:
+            state.dictionary.to_csv(out_dir / "dictionary.csv", index=False)
+        output = str(out_dir)
+    return {"folder": str(folder), "output": output, "computed": computed, "reused": reused}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a socio4health recipe on one or more input folders.")
+    parser.add_argument("recipe", help="Recipe file downloaded from the app")
+    parser.add_argument("folders", nargs="+", help="Input folders, one run each")
+    parser.add_argument("--dictionary", help="Dictionary file used by every run")
+    parser.add_argument("--output", default="./data/recipe_output", help="Directory for the results")
+    parser.add_argument("--jobs", type=int, default=2, help="Number of folders processed in parallel")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    steps = load_recipe(args.recipe)
+    failed = 0
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(run_recipe, steps, folder, args.dictionary, args.output): folder
+                   for folder in args.folders}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+                logging.info(f"{result['folder']}: done ({result['computed']} stages run, "
+                             f"{result['reused']} reused) -> {result['output']}")
+            except Exception as e:
+                failed += 1
+                logging.error(f"{futures[future]}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
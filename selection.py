@@ -0,0 +1,284 @@
+"""Data selection pushed down into the stored Parquet files.
+
+Harmonizer.s4h_data_selector reads every column and every row of each dataset
+and filters them afterwards. Here the same selection is turned into a read
+plan: the category filter becomes a column projection and the key-value
+filter selects the row groups that can contain the requested values.
+
+Row group statistics only help when the data is sorted by the key column, so
+each dataset gets a small index of the distinct values of ``key_col`` in each
+of its row groups. The index is built once per dataset and column (reading
+only that column), cached on disk, and lets selective queries skip every row
+group without a matching value. Row groups with more than
+``S4H_KEY_INDEX_MAX_VALUES`` (default 10000) distinct values are not indexed
+and always read.
+
+To help choose the values, a value index per dataset and column holds an
+approximate distinct count (HyperLogLog) and the ``S4H_TOP_VALUES`` (default
+50) most frequent values with their counts, computed for all datasets in one
+pass and cached, so the rows a filter keeps can be estimated before it runs.
+"""
+
+import hashlib
+import json
+import os
+
+import dask
+import dask.dataframe as dd
+import pandas as pd
+import pyarrow.parquet as pq
+import streamlit as st
+from socio4health.enums.dict_enum import ColumnMappingEnum
+
+from cache_store import KeyValueCache
+from instrumentation import instrumented
+from profiling import dataset_fingerprint
+from workspace import parquet_files, write_dataset
+
+MAX_INDEX_VALUES = int(os.environ.get("S4H_KEY_INDEX_MAX_VALUES", "10000"))
+TOP_VALUES = int(os.environ.get("S4H_TOP_VALUES", "50"))
+
+
+def selected_columns(columns, har):
+    """
+    Return the (upper-cased) columns s4h_data_selector keeps for a dataset.
+
+    Parameters:
+    columns (list): Columns of the dataset
+    har (Harmonizer): Harmonizer holding dict_df, categories, key_col, extra_cols and join_key
+
+    Returns:
+    list: Columns to keep, in output order
+    """
+    upper = [c.upper() for c in columns]
+    key_column = har.key_col.upper() if har.key_col else None
+
+    dict_df = har.dict_df.copy()
+    dict_df[ColumnMappingEnum.VARIABLE_NAME.value] = dict_df[ColumnMappingEnum.VARIABLE_NAME.value].str.upper()
+    in_categories = dict_df[dict_df[ColumnMappingEnum.CATEGORY.value].isin(har.categories)]
+    wanted = in_categories[ColumnMappingEnum.VARIABLE_NAME.value].dropna().unique().tolist()
+    if har.extra_cols:
+        wanted.extend(c.upper() for c in har.extra_cols if c.upper() not in wanted)
+    if har.join_key:
+        wanted.extend(c for c in upper if c == har.join_key)
+
+    if not wanted:
+        return [key_column] if key_column else upper
+    final = [key_column] if key_column else []
+    final.extend(c for c in wanted if c in upper)
+    return list(dict.fromkeys(final))
+
+
+def build_key_index(handle, column):
+    """
+    Return the distinct values of a column in each row group of a stored dataset.
+
+    Returns:
+    list: (file name, [values of each row group, or None when there are too many])
+    """
+    index = []
+    for f in parquet_files(handle.path):
+        pf = pq.ParquetFile(f)
+        groups = []
+        for i in range(pf.num_row_groups):
+            values = pf.read_row_group(i, columns=[column]).column(0).unique().to_pylist()
+            groups.append([str(v) for v in values] if len(values) <= MAX_INDEX_VALUES else None)
+        index.append((f.name, groups))
+    return index
+
+
+def get_key_index(handle, column, cache=None):
+    """Return the row-group index of a column, building and caching it on first use."""
+    cache = cache if cache is not None else get_key_index_cache()
+    key = hashlib.sha256(json.dumps([dataset_fingerprint(handle), column]).encode("utf-8")).hexdigest()
+    index = cache.get_many([key]).get(key)
+    if index is None:
+        index = build_key_index(handle, column)
+        cache.set_many({key: index})
+    return index
+
+
+def key_values(values, dtype):
+    """
+    Convert the values of a key-value filter to the dtype of the stored key column.
+
+    The values come from the page as (upper-cased) strings, while dtype
+    optimization may have stored the key column as numbers; values that are
+    not valid numbers for a numeric column cannot match and are dropped.
+
+    Parameters:
+    values (list): Values of the filter, as given to s4h_data_selector
+    dtype: Dtype of the key column
+
+    Returns:
+    list: Distinct values to compare the key column with
+    """
+    values = [v.upper() if isinstance(v, str) else v for v in values]
+    if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+        numbers = pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").dropna().astype("float64")
+        if pd.api.types.is_integer_dtype(dtype):
+            numbers = numbers[numbers == numbers.round()].astype("int64")
+        values = numbers.tolist()
+    return list(dict.fromkeys(values))
+
+
+def _read_piece(piece, source_columns, renames, key_column, values):
+    path, row_groups = piece
+    df = pq.ParquetFile(path).read_row_groups(row_groups, columns=source_columns).to_pandas()
+    df = df.rename(columns=renames)
+    return df[df[key_column].isin(values)]
+
+
+def select_dataset(handle, har, cache=None):
+    """
+    Build the lazy selection of one stored dataset, reading only what it keeps.
+
+    Parameters:
+    handle (DatasetHandle): Dataset to select from
+    har (Harmonizer): Harmonizer with the selection parameters
+    cache (KeyValueCache | None): Key index cache, defaults to the shared one
+
+    Returns:
+    dd.DataFrame: Selected rows and columns, with upper-cased column names
+    """
+    originals = {c.upper(): c for c in reversed(handle.columns)}
+    final = selected_columns(handle.columns, har)
+    source_columns = [originals[c] for c in final]
+    renames = {originals[c]: c for c in final}
+
+    if not (har.key_col and har.key_val):
+        return dd.read_parquet(handle.path, columns=source_columns).rename(columns=renames)
+
+    key_column = har.key_col.upper()
+    if key_column not in originals:
+        raise KeyError(f"Key column '{har.key_col}' not found in DataFrame")
+    # the key column is read for filtering even when the selection does not keep it
+    read_columns = list(dict.fromkeys(source_columns + [originals[key_column]]))
+    read_renames = {originals[c.upper()]: c.upper() for c in read_columns}
+    files = {f.name: f for f in parquet_files(handle.path)}
+    schema = pq.read_schema(next(iter(files.values())))
+    meta = schema.empty_table().select(read_columns).to_pandas().rename(columns=read_renames)
+    values = key_values(har.key_val, meta[key_column].dtype)
+    wanted = {str(v) for v in values}
+
+    pieces = []
+    for name, groups in get_key_index(handle, originals[key_column], cache):
+        row_groups = [i for i, group in enumerate(groups) if group is None or wanted.intersection(group)]
+        if row_groups:
+            pieces.append((str(files[name]), row_groups))
+
+    if not pieces:
+        return dd.from_pandas(meta[final], npartitions=1)
+    selected = dd.from_map(_read_piece, pieces, source_columns=read_columns, renames=read_renames,
+                           key_column=key_column, values=values, meta=meta, enforce_metadata=False)
+    return selected[final]
+
+
+@instrumented("Data selection")
+def select_datasets(handles, har, directory, cache=None):
+    """
+    Job body: run the data selection on stored datasets and store the results.
+
+    Keeps the same rows and columns as Harmonizer.s4h_data_selector.
+
+    Returns:
+    list: DatasetHandle of each selected dataset
+    """
+    return [write_dataset(select_dataset(handle, har, cache), directory) for handle in handles]
+
+
+def _source_column(handle, column):
+    # s4h_data_selector matches key_col case-insensitively
+    return next((c for c in handle.columns if c.upper() == column.upper()), None)
+
+
+def _value_index_key(handle, column, top_k):
+    return hashlib.sha256(json.dumps([dataset_fingerprint(handle), column.upper(), top_k]).encode("utf-8")).hexdigest()
+
+
+def cached_value_indexes(handles, column, top_k=TOP_VALUES, cache=None):
+    """Return the cached value index of a column in each dataset, or None where it is not built yet."""
+    cache = cache if cache is not None else get_key_index_cache()
+    keys = [_value_index_key(h, column, top_k) for h in handles]
+    indexes = cache.get_many(keys)
+    return [indexes.get(key) for key in keys]
+
+
+@instrumented("Value index")
+def value_indexes(handles, column, top_k=TOP_VALUES, cache=None):
+    """
+    Return the value index of a column in each dataset, building the missing ones in one pass.
+
+    Parameters:
+    handles (list): DatasetHandle of each dataset
+    column (str): Column to index, matched case-insensitively
+    top_k (int): Number of most frequent values to keep
+    cache (KeyValueCache | None): Index cache, defaults to the shared one
+
+    Returns:
+    list: For each dataset, a dict with "rows", the "dtype" of the column,
+    approximate "distinct" count and "top" [value, count] pairs, most
+    frequent first, with the values as strings; datasets without the column
+    have no distinct values
+    """
+    cache = cache if cache is not None else get_key_index_cache()
+    keys = [_value_index_key(h, column, top_k) for h in handles]
+    indexes = cache.get_many(keys)
+
+    computed = {}
+    lazy = {}
+    for key, handle in zip(keys, handles):
+        if key in indexes:
+            continue
+        source = _source_column(handle, column)
+        if source is None:
+            computed[key] = {"rows": handle.rows, "distinct": 0, "top": []}
+            continue
+        # only the key column is read
+        values = dd.read_parquet(handle.path, columns=[source])[source]
+        lazy[key] = (handle.rows, str(values.dtype), values.nunique_approx(), values.value_counts().nlargest(top_k))
+    for key, (rows, dtype, distinct, top) in dask.compute(lazy)[0].items():
+        computed[key] = {
+            "rows": rows,
+            "dtype": dtype,
+            "distinct": int(round(distinct)),
+            "top": [[str(value), int(count)] for value, count in top.items()],
+        }
+    cache.set_many(computed)
+    indexes.update(computed)
+    return [indexes[key] for key in keys]
+
+
+def estimate_kept_rows(index, values):
+    """
+    Estimate how many rows of a dataset a key-value filter keeps.
+
+    Values among the most frequent ones count exactly; any other value is
+    assumed to be as frequent as an average value outside that list. The
+    values are converted to the dtype of the column first, as the filter
+    itself does.
+
+    Parameters:
+    index (dict): Value index of the key column, see value_indexes()
+    values (list): Values of the filter, as given to s4h_data_selector
+
+    Returns:
+    int: Estimated number of rows kept
+    """
+    top = dict(index["top"])
+    tail_rows = index["rows"] - sum(top.values())
+    tail_values = max(index["distinct"] - len(top), 0)
+    kept = 0
+    dtype = pd.api.types.pandas_dtype(index.get("dtype", "object"))
+    for value in {str(v) for v in key_values(values, dtype)}:
+        if value in top:
+            kept += top[value]
+        elif tail_values:
+            kept += tail_rows / tail_values
+    return int(round(min(kept, index["rows"])))
+
+
+@st.cache_resource
+def get_key_index_cache():
+    """Return the on-disk cache of key-column and value indexes shared by all sessions."""
+    return KeyValueCache("key_index")
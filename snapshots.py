@@ -0,0 +1,98 @@
+"""Versioned snapshots of the workspace between Harmonizer stages.
+
+Every stage (NaN dropping, vertical merge, data selection) is keyed by the
+datasets it ran on and its parameters. Stored datasets never change and each
+has its own path, so the paths of the input handles fingerprint everything
+upstream of the stage. The handles a stage produced are kept as a snapshot
+under that key: running the same stage again on the same data with the same
+parameters restores the snapshot instead of recomputing it, and the session
+can step back to any earlier version of its workspace.
+
+At most ``S4H_MAX_SNAPSHOTS`` (default 20) snapshots are kept per session;
+the files of the ones dropped are deleted once no version refers to them.
+"""
+
+import hashlib
+import json
+import os
+
+import streamlit as st
+
+MAX_SNAPSHOTS = int(os.environ.get("S4H_MAX_SNAPSHOTS", "20"))
+
+
+def _init():
+    if "snapshots" not in st.session_state:
+        st.session_state.snapshots = {}
+    if "history" not in st.session_state:
+        st.session_state.history = []
+
+
+def stage_key(handles, stage, params):
+    """
+    Return the snapshot key of a stage.
+
+    Parameters:
+    handles (list): DatasetHandle of each input dataset
+    stage (str): Name of the stage
+    params (dict): Parameters of the stage
+
+    Returns:
+    str: Hash of the input paths, the stage and its parameters
+    """
+    payload = json.dumps([[h.path for h in handles], stage, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def lookup_snapshot(key):
+    """Return the handles stored for a stage key, or None if it never ran or its files are gone."""
+    _init()
+    snapshot = st.session_state.snapshots.get(key)
+    if snapshot is None or not all(h.exists() for h in snapshot["handles"]):
+        return None
+    return snapshot["handles"]
+
+
+def push_version(label, handles):
+    """Add a version of the workspace to the history, unless it is the latest one already."""
+    _init()
+    history = st.session_state.history
+    if history and [h.path for h in history[-1]["handles"]] == [h.path for h in handles]:
+        return
+    history.append({"label": label, "handles": list(handles)})
+
+
+def save_snapshot(key, label, inputs, handles):
+    """
+    Store the output of a stage and record it, and its input, as versions of the workspace.
+
+    Parameters:
+    key (str): Result of stage_key()
+    label (str): Name of the stage shown in the history
+    inputs (list): Handles the stage ran on
+    handles (list): Handles the stage produced
+    """
+    _init()
+    push_version("Before " + label.lower(), inputs)
+    snapshots = st.session_state.snapshots
+    snapshots.pop(key, None)
+    snapshots[key] = {"label": label, "handles": list(handles)}
+    while len(snapshots) > MAX_SNAPSHOTS:
+        snapshots.pop(next(iter(snapshots)))
+    push_version(label, handles)
+    # versions of dropped snapshots go with them
+    st.session_state.history = st.session_state.history[-(MAX_SNAPSHOTS + 1):]
+
+
+def referenced_handles():
+    """Return the handles of every snapshot and version, which must not be garbage collected."""
+    _init()
+    handles = [h for snapshot in st.session_state.snapshots.values() for h in snapshot["handles"]]
+    handles += [h for version in st.session_state.history for h in version["handles"]]
+    return handles
+
+
+def versions():
+    """Return the versions of the workspace that can still be restored, oldest first."""
+    _init()
+    return [v for v in st.session_state.history if all(h.exists() for h in v["handles"])]
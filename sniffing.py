@@ -0,0 +1,182 @@
+"""Per-file detection of the encoding and delimiter of text data files.
+
+Instead of applying one separator and encoding to every file of a batch, each
+CSV/TXT file is sampled (its first block and a few blocks at random offsets,
+cut on line breaks) and its encoding and delimiter are detected separately,
+each with a confidence between 0 and 1. Files detected with a confidence of
+at least ``S4H_SNIFF_MIN_CONFIDENCE`` (default 0.9) are extracted with their
+detected settings; only the others need the user to confirm them, and files
+extracted without the user fall back to the encoding they were given. A sample
+of only ASCII text says nothing about the encoding of the rest of the file, so
+its encoding is only confident when the sample is the whole file.
+"""
+
+import csv
+import logging
+import os
+import random
+from collections import Counter
+
+BLOCK_SIZE = 64 * 1024
+RANDOM_BLOCKS = 3
+MAX_LINES = 500
+MIN_CONFIDENCE = float(os.environ.get("S4H_SNIFF_MIN_CONFIDENCE", "0.9"))
+
+SNIFF_EXTENSIONS = ('.csv', '.txt')
+DELIMITERS = (',', ';', '\t', '|')
+# single-byte encodings tried when a file is not valid UTF-8, most specific first
+FALLBACK_ENCODINGS = ('cp1252', 'latin1')
+# non-ASCII characters other than letters that are common in survey data
+PLAUSIBLE_SYMBOLS = set("ºª°¿¡«»·€–—‘’“”…±×÷§¢£¥©®")
+# confidence of UTF-8 for a partial sample without non-ASCII bytes
+ASCII_CONFIDENCE = 0.5
+
+
+def sample_blocks(f, block_size=BLOCK_SIZE, blocks=RANDOM_BLOCKS):
+    """
+    Read the first block of a file and a few blocks at random offsets, each made of whole lines.
+
+    Parameters:
+    f (file): Binary file object that supports seek
+    block_size (int): Size of each block in bytes
+    blocks (int): Number of random blocks
+
+    Returns:
+    bytes: The blocks, separated by line breaks
+    """
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(0)
+    head = f.read(block_size)
+    if size <= block_size:
+        return head
+    parts = [head[:head.rfind(b"\n") + 1] or head]
+    # the offsets depend only on the size, so the same file always gives the same sample
+    rng = random.Random(size)
+    for offset in sorted(rng.randrange(block_size, size) for _ in range(min(blocks, size // block_size))):
+        f.seek(offset)
+        block = f.read(block_size)
+        first, last = block.find(b"\n"), block.rfind(b"\n")
+        if first != -1 and last > first:
+            parts.append(block[first + 1:last + 1])
+    f.seek(0)
+    return b"".join(parts)
+
+
+def _plausibility(text):
+    non_ascii = [c for c in text if ord(c) > 127]
+    if not non_ascii:
+        return 1.0
+    return sum(c.isalpha() or c in PLAUSIBLE_SYMBOLS for c in non_ascii) / len(non_ascii)
+
+
+def detect_encoding(sample, complete=True):
+    """
+    Detect the encoding of a sample.
+
+    Parameters:
+    sample (bytes): Sampled bytes of the file
+    complete (bool): Whether the sample is the whole file
+
+    Returns:
+    tuple: Encoding name and confidence
+    """
+    if sample.startswith(b"\xef\xbb\xbf"):
+        return "utf-8-sig", 1.0
+    if sample.startswith((b"\xff\xfe", b"\xfe\xff")):
+        return "utf-16", 1.0
+    if sample.isascii():
+        # any encoding fits; the bytes that were not sampled may still be UTF-8 or a single-byte encoding
+        return "utf-8", 1.0 if complete else ASCII_CONFIDENCE
+    try:
+        sample.decode("utf-8")
+        return "utf-8", 1.0
+    except UnicodeDecodeError:
+        pass
+
+    scores = {}
+    for encoding in FALLBACK_ENCODINGS:
+        # latin1 decodes every byte, but 0x80-0x9F become control characters that are not plausible
+        scores[encoding] = _plausibility(sample.decode(encoding, errors="replace"))
+    encoding = max(FALLBACK_ENCODINGS, key=lambda e: scores[e])
+    return encoding, scores[encoding]
+
+
+def detect_delimiter(text):
+    """
+    Detect the delimiter of delimited text.
+
+    The confidence is the share of lines that split into the most common
+    number of fields, which must be at least two.
+
+    Returns:
+    tuple: Delimiter and confidence
+    """
+    lines = [line for line in text.splitlines()[:MAX_LINES] if line.strip()]
+    best, best_key = ",", (0.0, 0)
+    for delimiter in DELIMITERS:
+        counts = Counter(len(row) for row in csv.reader(lines, delimiter=delimiter))
+        if not counts:
+            continue
+        fields, n = counts.most_common(1)[0]
+        if fields < 2:
+            continue
+        key = (n / len(lines), fields)
+        if key > best_key:
+            best, best_key = delimiter, key
+    return best, best_key[0]
+
+
+def sniff(f, is_fwf=False):
+    """
+    Detect the encoding and delimiter of a file.
+
+    Parameters:
+    f (file): Binary file object that supports seek
+    is_fwf (bool): Fixed-width files have no delimiter, only their encoding is detected
+
+    Returns:
+    dict: "encoding", "encoding_confidence", "sep" and "sep_confidence" (None for fixed-width files)
+    """
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    sample = sample_blocks(f)
+    encoding, encoding_confidence = detect_encoding(sample, complete=len(sample) == size)
+    result = {"encoding": encoding, "encoding_confidence": encoding_confidence,
+              "sep": None, "sep_confidence": None}
+    if not is_fwf:
+        result["sep"], result["sep_confidence"] = detect_delimiter(sample.decode(encoding, errors="replace"))
+    return result
+
+
+def is_confident(result, min_confidence=MIN_CONFIDENCE):
+    """Return whether both the encoding and the delimiter of a sniff() result can be trusted."""
+    return (result["encoding_confidence"] >= min_confidence
+            and (result["sep_confidence"] is None or result["sep_confidence"] >= min_confidence))
+
+
+def settings_for(path, sep, encoding, is_fwf=False):
+    """
+    Return the separator and encoding to extract a file with.
+
+    Detected settings are used when they are confident, the given ones otherwise.
+
+    Parameters:
+    path (str): Data file
+    sep (str): Separator to fall back to
+    encoding (str): Encoding to fall back to
+    is_fwf (bool): Whether the file is fixed-width
+
+    Returns:
+    tuple: Separator and encoding
+    """
+    if os.path.splitext(path)[1].lower() not in SNIFF_EXTENSIONS:
+        return sep, encoding
+    with open(path, "rb") as f:
+        result = sniff(f, is_fwf)
+    if not is_confident(result):
+        logging.info(f"Settings of {os.path.basename(path)} not detected with confidence; "
+                     f"using sep={sep!r}, encoding={encoding}")
+        return sep, encoding
+    logging.info(f"Detected sep={result['sep']!r}, encoding={result['encoding']} for {os.path.basename(path)}")
+    return result["sep"] or sep, result["encoding"]
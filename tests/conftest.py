@@ -0,0 +1,14 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# the app's modules live at the repository root
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# keep the workspace and caches of the tests out of ./data
+_data = tempfile.mkdtemp(prefix="s4h-tests-")
+for _name in ("WORKSPACE", "CACHE", "DICTIONARY", "DOWNLOAD", "INGEST"):
+    os.environ.setdefault(f"S4H_{_name}_DIR", os.path.join(_data, _name.lower()))
+# compute in the test process instead of starting a cluster
+os.environ.setdefault("S4H_DASK_SCHEDULER", "threads")
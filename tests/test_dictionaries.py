@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+from socio4health.utils import extractor_utils
+
+from dictionaries import content_hash, plain_dictionary, read_dictionary, standardize_dictionary, write_dictionary
+
+
+def _standardized_fwf():
+    # as s4h_standardize_dict leaves a fixed-width dictionary: positions are numpy arrays
+    return pd.DataFrame({
+        "question": ["department", "sex", "income"],
+        "variable_name": ["DPTO", "SEXO", "INGRESO"],
+        "description": [np.nan, np.nan, "monthly income"],
+        "value": ["5; 11", "1; 2", np.nan],
+        "possible_answers": ["antioquia; bolivar", "man; woman", np.nan],
+        "initial_position": [np.array([1]), np.array(4), np.array([5])],
+        "size": [np.array([3]), np.array(1), np.array([8])],
+    })
+
+
+def test_fwf_dictionary_round_trips_through_json(tmp_path):
+    dictionary = plain_dictionary(_standardized_fwf())
+    write_dictionary(dictionary, tmp_path / "dictionary.json")
+    stored = read_dictionary(tmp_path / "dictionary.json")
+
+    pd.testing.assert_frame_equal(stored, dictionary, check_dtype=False)
+    assert extractor_utils.s4h_parse_fwf_dict(stored) == (["DPTO", "SEXO", "INGRESO"], [(0, 3), (3, 4), (4, 12)])
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_mixed_answers_keep_their_types(tmp_path):
+    dictionary = pd.DataFrame({"variable_name": ["A", "B"], "value": [1, "x"]})
+    write_dictionary(plain_dictionary(dictionary), tmp_path / "dictionary.json")
+    assert read_dictionary(tmp_path / "dictionary.json")["value"].tolist() == [1, "x"]
+
+
+def test_standardized_fwf_dictionary_is_cached():
+    pytest.importorskip("socio4health.utils.harmonizer_utils")
+    # as in most survey dictionaries, the position is only given on the first row of a variable
+    data = (b"question,variable_name,description,value,initial_position,size\n"
+            b"department,DPTO,antioquia,5,1,3\n"
+            b"department,DPTO,bolivar,11,,\n"
+            b"sex,SEXO,man,1,4,1\n")
+    key = content_hash(data)
+    standardized, cached = standardize_dictionary(key, "dictionary.csv", data)
+    again, cached_again = standardize_dictionary(key, "dictionary.csv", data)
+    assert (cached, cached_again) == (False, True)
+    assert extractor_utils.s4h_parse_fwf_dict(again) == extractor_utils.s4h_parse_fwf_dict(standardized)
+
+
+def test_benchmark_dictionary_standardizes():
+    pytest.importorskip("socio4health.utils.harmonizer_utils")
+    from benchmarks import synthetic
+
+    data = synthetic.dictionary().to_csv(index=False).encode("utf-8")
+    standardized, _ = standardize_dictionary(content_hash(data), "dictionary.csv", data)
+    colnames, colspecs = extractor_utils.s4h_parse_fwf_dict(standardized)
+    widths = {name: width for name, _, _, _, width, _, _ in synthetic.VARIABLES}
+    assert sorted(colnames) == sorted(widths)
+    assert all(end - start == widths[name] for name, (start, end) in zip(colnames, colspecs))
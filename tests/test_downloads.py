@@ -0,0 +1,116 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import downloads
+from downloads import Downloader, scrape_links
+
+DATA = bytes(range(256)) * 4096 * 3
+ETAG = '"v1"'
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves DATA with an ETag and byte ranges; failures are queued in server.plan."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.requests.append(dict(self.headers))
+        action = self.server.plan.pop(0) if self.server.plan else None
+        if action == "unavailable":
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        byte_range = self.headers.get("Range")
+        if byte_range and self.headers.get("If-Range") == ETAG:
+            start = int(byte_range.split("=")[1].rstrip("-"))
+            if start >= len(DATA):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(DATA)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(DATA) - 1}/{len(DATA)}")
+        else:
+            self.send_response(200)
+        body = DATA[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", ETAG)
+        self.end_headers()
+        if action == "interrupt":
+            # the connection drops halfway through the body
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.requests, httpd.plan = [], []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/survey.csv"
+
+
+def test_interrupted_download_resumes(server, tmp_path):
+    downloader = Downloader(tmp_path)
+    server.plan = ["interrupt"]
+    with pytest.raises(Exception):
+        downloader.download(_url(server), "survey.csv")
+    part = tmp_path / "survey.csv.part"
+    size = part.stat().st_size
+    assert 0 < size < len(DATA)
+
+    path = downloader.download(_url(server), "survey.csv")
+    assert server.requests[-1]["Range"] == f"bytes={size}-"
+    assert open(path, "rb").read() == DATA
+    assert not part.exists()
+    assert not downloads._url_locks
+
+
+def test_complete_partial_file_is_downloaded_again(server, tmp_path):
+    downloader = Downloader(tmp_path)
+    server.plan = ["interrupt"]
+    with pytest.raises(Exception):
+        downloader.download(_url(server), "survey.csv")
+    # as if the transfer finished but the file was never moved into place
+    (tmp_path / "survey.csv.part").write_bytes(DATA)
+
+    path = downloader.download(_url(server), "survey.csv")
+    assert open(path, "rb").read() == DATA
+    assert "Range" in server.requests[-2] and "Range" not in server.requests[-1]
+
+
+def test_unavailable_server_is_retried_and_cached_copy_reused(server, tmp_path):
+    downloader = Downloader(tmp_path)
+    server.plan = ["unavailable"]
+    path = downloader.download(_url(server), "survey.csv")
+    assert open(path, "rb").read() == DATA
+    assert len(server.requests) == 2
+
+    assert Downloader(tmp_path).download(_url(server), "survey.csv") == path
+    assert server.requests[-1]["If-None-Match"] == ETAG
+
+
+def test_direct_link_to_archive():
+    assert scrape_links("http://example.org/data/survey.zip?v=2", 0, [".csv"], []) == {
+        "survey.zip": "http://example.org/data/survey.zip?v=2"}
@@ -0,0 +1,29 @@
+import os
+import zipfile
+
+import pandas as pd
+
+from export import export_datasets
+from workspace import write_dataset
+
+
+def test_exports_are_reused(tmp_path):
+    handles = [write_dataset(pd.DataFrame({"A": [1, 2], "B": ["x", "y"]}), str(tmp_path)),
+               write_dataset(pd.DataFrame({"C": [3.5]}), str(tmp_path))]
+    directory = str(tmp_path / "_exports")
+
+    files = export_datasets(handles, "CSV", directory)
+    assert [name for _, name in files] == ["dataframe_1.csv", "dataframe_2.csv", "dataframes.zip"]
+    assert pd.read_csv(files[0][0])["B"].tolist() == ["x", "y"]
+    with zipfile.ZipFile(files[2][0]) as zf:
+        assert zf.namelist() == ["dataframe_1.csv", "dataframe_2.csv"]
+    written = {path: os.stat(path).st_mtime_ns for path, _ in files}
+
+    again = export_datasets(handles, "CSV", directory)
+    assert again == files
+    assert {path: os.stat(path).st_mtime_ns for path, _ in again} == written
+
+    # the second dataset alone reuses its export under its own download name
+    single = export_datasets(handles[1:], "CSV", directory)
+    assert single == [(files[1][0], "dataframe_1.csv")]
+    assert len(os.listdir(directory)) == 3
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from fwf import _line_bounds, chunk_offsets, fwf_to_parquet, parse_chunk
+
+COLNAMES = ["DPTO", "NAME", "INCOME"]
+COLSPECS = [(0, 2), (2, 8), (8, 14)]
+TYPES = {"DPTO": "int", "NAME": "string", "INCOME": "float"}
+
+
+def _write(tmp_path, lines, newline=b"\n", encoding="latin1"):
+    path = tmp_path / "survey.txt"
+    path.write_bytes(newline.join(line.encode(encoding) for line in lines) + newline)
+    return path
+
+
+def test_chunks_end_on_line_breaks(tmp_path):
+    path = _write(tmp_path, [f"{i:02d}name{i:02d}{i * 1.5:6.1f}" for i in range(50)])
+    data = path.read_bytes()
+    offsets = chunk_offsets(path, chunk_bytes=20)
+
+    assert offsets[0][0] == 0 and offsets[-1][1] == len(data)
+    assert all(stop == start for (_, stop), (start, _) in zip(offsets, offsets[1:]))
+    assert all(data[stop - 1:stop] == b"\n" for _, stop in offsets)
+    assert chunk_offsets(path, chunk_bytes=len(data) * 2) == [(0, len(data))]
+
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+    assert chunk_offsets(empty) == []
+
+
+def test_line_bounds_skip_carriage_returns_and_empty_lines():
+    buf = np.frombuffer(b"05ana\r\n\r\n11\r\n76 lastline", dtype=np.uint8)
+    starts, stops = _line_bounds(buf)
+    assert [bytes(buf[s:e]) for s, e in zip(starts, stops)] == [b"05ana", b"11", b"76 lastline"]
+
+
+def test_short_lines_give_missing_values(tmp_path):
+    path = _write(tmp_path, ["05ana     12.5", "11", "76luis"], newline=b"\r\n")
+    table = parse_chunk(str(path), 0, path.stat().st_size, COLNAMES, COLSPECS, TYPES, "latin1").to_pydict()
+    assert table == {"DPTO": [5, 11, 76], "NAME": ["ana", None, "luis"], "INCOME": [12.5, None, None]}
+
+
+def test_non_ascii_cells(tmp_path):
+    # "1é" is not a number; the 0x81 byte is not defined in cp1252
+    path = _write(tmp_path, ["05Peña  1é", "11Núñez 7.25"])
+    path.write_bytes(path.read_bytes() + b"76\x81na    3\n")
+    size = path.stat().st_size
+
+    table = parse_chunk(str(path), 0, size, COLNAMES, COLSPECS, TYPES, "latin1").to_pydict()
+    assert table == {"DPTO": [5, 11, 76], "NAME": ["Peña", "Núñez", "\x81na"], "INCOME": [None, 7.25, 3.0]}
+
+    table = parse_chunk(str(path), 0, size, COLNAMES, COLSPECS, TYPES, "cp1252").to_pydict()
+    assert table["NAME"] == ["Peña", "Núñez", "�na"] and table["INCOME"] == [None, 7.25, 3.0]
+
+    bad_number = {**TYPES, "NAME": "int"}
+    assert parse_chunk(str(path), 0, size, COLNAMES, COLSPECS, bad_number, "latin1").column("NAME").null_count == 3
+
+
+def test_utf8_chunks_with_non_ascii_text(tmp_path):
+    path = _write(tmp_path, ["05ana   12.5", "11Núñez 7.25"], encoding="utf-8")
+    table = parse_chunk(str(path), 0, path.stat().st_size, COLNAMES, [(0, 2), (2, 8), (8, 12)], TYPES, "utf-8")
+    assert table.to_pydict() == {"DPTO": [5, 11], "NAME": ["ana", "Núñez"], "INCOME": [12.5, 7.25]}
+
+
+def test_fwf_to_parquet_across_chunks(tmp_path):
+    lines = [f"{i % 90:02d}{'Peña' if i % 7 == 0 else 'ana':<6}{i * 0.5:6.1f}" for i in range(200)]
+    path = _write(tmp_path, lines)
+    dataset = fwf_to_parquet(str(path), COLNAMES, COLSPECS, str(tmp_path / "out"), types=TYPES, chunk_bytes=100)
+
+    parts = sorted(pq.ParquetDataset(dataset).files, key=lambda part: int(part.split(".")[-2]))
+    assert len(parts) > 1
+    df = pd.concat([pq.read_table(part).to_pandas() for part in parts], ignore_index=True)
+    assert df["DPTO"].tolist() == [i % 90 for i in range(200)]
+    assert df["NAME"].tolist() == ["Peña" if i % 7 == 0 else "ana" for i in range(200)]
+    assert df["INCOME"].tolist() == [i * 0.5 for i in range(200)]
+    assert set(df["filename"]) == {"survey.txt"}
@@ -0,0 +1,25 @@
+import dask.dataframe as dd
+import pandas as pd
+import pytest
+
+import cluster
+from instrumentation import instrumented, records
+
+
+def test_recording_never_starts_a_cluster(monkeypatch):
+    distributed = pytest.importorskip("distributed")
+    monkeypatch.setattr(cluster, "SCHEDULER", "distributed")
+
+    @instrumented("Test step")
+    def step(df):
+        return df.assign(y=df["x"] + 1).compute()
+
+    step(dd.from_pandas(pd.DataFrame({"x": range(10)}), npartitions=2))
+
+    entry = records()[-1]
+    assert entry["step"] == "Test step" and entry["error"] is None
+    assert entry["rows_out"] == 10
+    # without a client the local scheduler's tasks are counted instead of cluster transitions
+    assert entry["tasks"] > 0 and entry["transitions"] is None
+    with pytest.raises(ValueError):
+        distributed.default_client()
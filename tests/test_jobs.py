@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+
+from jobs import Job, JobRunner
+from optimization import optimize_datasets
+from workspace import write_dataset
+
+
+def _wait(jobs, timeout=120):
+    deadline = time.time() + timeout
+    while not all(job.done for job in jobs):
+        assert time.time() < deadline, "jobs did not finish"
+        time.sleep(0.05)
+
+
+def _optimize(directory, barrier, seed):
+    # both jobs build and optimize Dask graphs at the same time, which deadlocked before Python 3.12
+    optimized = 0
+    for i in range(10):
+        df = pd.DataFrame({"A": [str(j % (seed + 5)) for j in range(2000)],
+                           "B": [f"x{j % 3}" for j in range(2000)],
+                           "C": [str(j * 1.5) for j in range(2000)],
+                           "D": [f"{i}{seed}"] * 2000})
+        handle = write_dataset(df, directory)
+        if i == 0:
+            barrier.wait(timeout=30)
+        optimized += len(optimize_datasets([handle, handle], directory))
+    return optimized
+
+
+def test_two_jobs_run_at_the_same_time(tmp_path):
+    runner = JobRunner(max_workers=2)
+    barrier = threading.Barrier(2)
+    jobs = [runner.submit(Job(f"job {seed}"), _optimize, str(tmp_path), barrier, seed) for seed in range(2)]
+    _wait(jobs)
+
+    assert [job.state for job in jobs] == ["done", "done"], [job.error for job in jobs]
+    assert [job.result for job in jobs] == [20, 20]
+    # the barrier only opens when both jobs are running at once
+    assert max(job.started for job in jobs) < min(job.finished for job in jobs)
+
+
+def test_failed_job_keeps_its_error_and_log():
+    runner = JobRunner(max_workers=1)
+
+    def fail():
+        import logging
+        logging.getLogger().setLevel(logging.INFO)
+        logging.info("starting")
+        raise ValueError("no data")
+
+    job = runner.submit(Job("failing"), fail)
+    _wait([job])
+    assert job.state == "error" and job.error == "no data"
+    assert any("starting" in line for line in job.log)
+
+
+def _session():
+    import streamlit as st
+
+    from jobs import collect_finished_jobs, submit_job
+
+    if "jobs" not in st.session_state:
+        st.session_state.jobs, st.session_state.messages = {}, []
+        submit_job("Adding", lambda: 1 + 1, on_done=lambda result: f"Sum is {result}")
+        submit_job("Dividing", lambda: 1 / 0)
+    collect_finished_jobs()
+
+
+def test_finished_jobs_are_collected_once():
+    at = AppTest.from_function(_session).run()
+    deadline = time.time() + 30
+    while at.session_state.jobs:
+        assert time.time() < deadline, "jobs were not collected"
+        time.sleep(0.05)
+        at.run()
+
+    assert sorted(at.session_state.messages) == [("error", "Dividing failed: division by zero"),
+                                                 ("success", "Sum is 2")]
+    at.run()
+    assert len(at.session_state.messages) == 2
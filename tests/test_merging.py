@@ -0,0 +1,31 @@
+import pandas as pd
+
+from merging import dataset_schemas, merge_datasets, merge_groups
+from workspace import write_dataset
+
+
+def _schema(*columns, dtype="int64"):
+    return tuple((column, dtype) for column in columns)
+
+
+def test_groups_follow_similarity_and_dtypes():
+    schemas = (_schema("A", "B", "C", "D"), _schema("A", "B", "C", "D", "E"), _schema("X", "Y"),
+               _schema("A", "B", "C", "D", dtype="string"), _schema("A", "B", "C", "F"))
+    assert merge_groups(schemas, 0.6) == [[0, 1, 4], [2], [3]]
+    # dataset 4 shares 3 of the 4 columns of dataset 0, but only 3 of the 5 columns of its group
+    assert merge_groups(schemas, 0.7) == [[0, 1], [2], [3], [4]]
+    assert merge_groups(schemas, 0.6, min_common_columns=5) == [[0], [1], [2], [3], [4]]
+
+
+def test_merge_puts_shared_columns_first(tmp_path):
+    handles = [write_dataset(pd.DataFrame({"A": ["1", "2"], "B": ["x", "y"]}), str(tmp_path)),
+               write_dataset(pd.DataFrame({"C": ["z"], "B": ["w"], "A": ["3"]}), str(tmp_path)),
+               write_dataset(pd.DataFrame({"Q": ["alone"]}), str(tmp_path))]
+    groups = merge_groups(dataset_schemas([h.open() for h in handles]), 0.6)
+    assert groups == [[0, 1], [2]]
+
+    merged = merge_datasets(handles, groups, str(tmp_path))
+    df = merged[0].open().compute()
+    assert list(df.columns) == ["A", "B", "C"]
+    assert df["A"].astype(str).tolist() == ["1", "2", "3"] and df["C"].isna().sum() == 2
+    assert merged[1] is handles[2]
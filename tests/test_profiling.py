@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from cache_store import KeyValueCache
+from profiling import cached_profiles, columns_to_drop, drop_nan_columns, profile_datasets
+from workspace import write_dataset
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    df = pd.DataFrame({"A": range(10), "B": [None] * 6 + [1.0] * 4, "C": [None] * 9 + ["x"]})
+    return write_dataset(df, str(tmp_path))
+
+
+def test_profiles_are_computed_once(dataset, tmp_path):
+    cache = KeyValueCache("profiles", tmp_path / "cache")
+    assert cached_profiles([dataset], cache=cache) == [None]
+
+    profile, = profile_datasets([dataset], cache=cache)
+    assert profile["rows"] == 10
+    assert {c: s["null_fraction"] for c, s in profile["columns"].items()} == {"A": 0.0, "B": 0.6, "C": 0.9}
+    assert profile["columns"]["A"]["distinct"] == 10
+    assert cached_profiles([dataset], cache=cache) == [profile]
+
+    assert columns_to_drop(profile, 0.5) == ["B", "C"]
+    assert columns_to_drop(profile, 0.6) == ["C"]
+    with pytest.raises(ValueError):
+        columns_to_drop(profile, 1.5)
+
+
+def test_drop_nan_columns_uses_the_cached_profile(dataset, tmp_path, monkeypatch):
+    cache = KeyValueCache("profiles", tmp_path / "cache")
+    profile_datasets([dataset], cache=cache)
+    # a cached profile means the dataset is only read again to write the kept columns
+    monkeypatch.setattr("profiling._lazy_profile", lambda df, sample_frac: pytest.fail("profiled again"))
+
+    cleaned, = drop_nan_columns([dataset], 0.8, str(tmp_path), cache=cache)
+    assert list(cleaned.open().columns) == ["A", "B"]
+    kept, = drop_nan_columns([dataset], 0.95, str(tmp_path), cache=cache)
+    assert kept is dataset
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from recipe import PipelineState, run_recipe
+from workspace import write_dataset
+
+STEPS = [
+    {"step": "extract", "params": {"down_ext": [".csv"], "sep": ",", "encoding": "utf-8", "is_fwf": False}},
+    {"step": "drop_nan_columns", "params": {"nan_threshold": 0.5}},
+    {"step": "vertical_merge", "params": {"similarity_threshold": 0.8}},
+]
+
+
+def test_stage_state_round_trips(tmp_path):
+    dictionary = pd.DataFrame({"variable_name": ["DPTO", "SEXO"], "question": ["department", "sex"],
+                               "initial_position": [np.array([1]), np.array([4])], "size": [np.array([3]), 1]})
+    handle = write_dataset(pd.DataFrame({"DPTO": ["5", "11"]}), str(tmp_path))
+    PipelineState(dictionary, ["DPTO", "SEXO"], [(0, 3), (3, 4)], [handle]).save(tmp_path)
+
+    assert not list(tmp_path.glob("*.pkl"))
+    state = PipelineState.load(tmp_path)
+    assert state.dictionary["initial_position"].tolist() == [1, 4] and state.dictionary["size"].tolist() == [3, 1]
+    assert state.colspecs == [(0, 3), (3, 4)]
+    assert state.handles[0].open().compute()["DPTO"].tolist() == ["5", "11"]
+
+
+def _wave(folder, rows):
+    folder.mkdir()
+    for i in range(2):
+        pd.DataFrame({"DPTO": [5, 11] * rows, "SEXO": [1, 2] * rows,
+                      "P7020": [None] * (2 * rows - 1) + [1]}).to_csv(folder / f"part_{i}.csv", index=False)
+    return folder
+
+
+def test_replay_reuses_unchanged_stages(tmp_path):
+    cache_dir, output = tmp_path / "cache", tmp_path / "out"
+    wave = _wave(tmp_path / "wave_2023", 3)
+
+    result = run_recipe(STEPS, wave, output=output, cache_dir=cache_dir)
+    assert (result["computed"], result["reused"]) == (3, 0)
+    merged = pd.read_parquet(output / "wave_2023" / "dataframe_1.parquet")
+    assert sorted(merged.columns) == ["DPTO", "SEXO", "filename"] and len(merged) == 12
+    assert not (output / "wave_2023" / "dataframe_2.parquet").exists()
+
+    again = run_recipe(STEPS, wave, output=output, cache_dir=cache_dir)
+    assert (again["computed"], again["reused"]) == (0, 3)
+
+    # a changed file changes the key of every stage after it
+    (wave / "part_1.csv").write_text("DPTO,SEXO,P7020\n76,1,2\n")
+    assert run_recipe(STEPS, wave, cache_dir=cache_dir)["computed"] == 3
+    # stages are keyed by the contents of the files, not by the folder they are in
+    assert run_recipe(STEPS[:2], _wave(tmp_path / "copy", 3), cache_dir=cache_dir)["reused"] == 2
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from cache_store import KeyValueCache
+from optimization import optimize_datasets
+from selection import estimate_kept_rows, key_values, select_dataset, value_indexes
+from workspace import write_dataset
+
+
+@pytest.fixture
+def survey(tmp_path):
+    df = pd.DataFrame({
+        "DPTO": ["5", "11", "5", "76", "11", "5"],
+        "SEXO": ["1", "2", "2", "1", "1", "2"],
+        "NAME": ["a", "b", "c", "d", "e", "f"],
+    })
+    return write_dataset(df, str(tmp_path))
+
+
+def _harmonizer(key_val):
+    dict_df = pd.DataFrame({"variable_name": ["SEXO"], "category": ["Demographic"]})
+    return SimpleNamespace(dict_df=dict_df, categories=["Demographic"], key_col="dpto", key_val=key_val,
+                           extra_cols=[], join_key=None)
+
+
+def test_key_values_follow_the_key_dtype():
+    assert key_values(["5", "11", "5"], pd.Int8Dtype()) == [5, 11]
+    assert key_values(["5", "x", "1.5"], pd.Int8Dtype()) == [5]
+    assert key_values(["5"], pd.Float64Dtype()) == [5.0]
+    assert key_values(["ant", "5"], pd.CategoricalDtype(["ANT", "5"])) == ["ANT", "5"]
+
+
+def test_select_after_optimization(survey, tmp_path):
+    optimized, = optimize_datasets([survey], str(tmp_path))
+    assert str(optimized.open().dtypes["DPTO"]) == "Int8"
+
+    cache = KeyValueCache("key_index", tmp_path / "cache")
+    selected = select_dataset(optimized, _harmonizer(["5", "11"]), cache).compute()
+    assert list(selected.columns) == ["DPTO", "SEXO"]
+    assert sorted(selected["DPTO"].tolist()) == [5, 5, 5, 11, 11]
+
+    assert select_dataset(optimized, _harmonizer(["99"]), cache).compute().empty
+
+
+def test_estimate_matches_selection_after_optimization(survey, tmp_path):
+    optimized, = optimize_datasets([survey], str(tmp_path))
+    cache = KeyValueCache("key_index", tmp_path / "cache")
+    index, = value_indexes([optimized], "dpto", cache=cache)
+    assert index["dtype"] == "Int8"
+
+    for values in (["5"], ["5", "11"], ["76", "99"]):
+        kept = len(select_dataset(optimized, _harmonizer(values), cache).compute())
+        assert estimate_kept_rows(index, values) == kept
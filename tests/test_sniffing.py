@@ -0,0 +1,40 @@
+import io
+
+from sniffing import ASCII_CONFIDENCE, BLOCK_SIZE, MIN_CONFIDENCE, detect_encoding, settings_for, sniff
+
+
+def _csv(rows, sep=";"):
+    return "".join(sep.join(row) + "\n" for row in rows)
+
+
+def test_small_files_are_sniffed_whole():
+    data = _csv([("DPTO", "NAME")] + [("05", "Peña"), ("11", "Núñez")] * 10).encode("latin1")
+    result = sniff(io.BytesIO(data))
+    assert result["encoding"] in ("cp1252", "latin1") and result["encoding_confidence"] == 1.0
+    assert result["sep"] == ";" and result["sep_confidence"] == 1.0
+
+    assert detect_encoding(data.decode("latin1").encode("utf-8")) == ("utf-8", 1.0)
+    assert detect_encoding(b"DPTO;NAME\n05;ana\n") == ("utf-8", 1.0)
+
+
+def test_partial_ascii_sample_is_not_confident(tmp_path):
+    # the sampled blocks are ASCII, so nothing is known about the encoding of the rest
+    rows = [("DPTO", "NAME")] + [(f"{i % 90:02d}", "ana") for i in range(40000)]
+    data = _csv(rows).encode("ascii")
+    assert len(data) > 2 * BLOCK_SIZE
+    result = sniff(io.BytesIO(data))
+    assert result["encoding"] == "utf-8" and result["encoding_confidence"] == ASCII_CONFIDENCE < MIN_CONFIDENCE
+
+    path = tmp_path / "survey.csv"
+    path.write_bytes(data)
+    assert settings_for(str(path), ",", "latin1") == (",", "latin1")
+
+
+def test_confident_settings_replace_the_given_ones(tmp_path):
+    path = tmp_path / "survey.csv"
+    path.write_bytes(_csv([("DPTO", "NAME"), ("05", "Peña")], sep="|").encode("utf-8"))
+    assert settings_for(str(path), ",", "latin1") == ("|", "utf-8")
+
+    other = tmp_path / "survey.xlsx"
+    other.write_bytes(b"PK")
+    assert settings_for(str(other), ",", "latin1") == (",", "latin1")
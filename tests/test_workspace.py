@@ -0,0 +1,66 @@
+import os
+import time
+import zipfile
+
+import pandas as pd
+import pytest
+
+import workspace
+from workspace import ACCESS_FILE, collect_garbage, enforce_quota, export_name, write_dataset
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    """Three sessions of 1000 bytes each, last used 3, 2 and 1 hours ago."""
+    monkeypatch.setattr(workspace, "WORKSPACE_DIR", tmp_path)
+    monkeypatch.setattr(workspace, "IDLE_SECONDS", 1800)
+    now = time.time()
+    directories = []
+    for name, hours in (("old", 3), ("older", 2), ("recent", 1)):
+        directory = tmp_path / name
+        directory.mkdir()
+        (directory / "data.bin").write_bytes(b"x" * 1000)
+        (directory / ACCESS_FILE).touch()
+        os.utime(directory / ACCESS_FILE, (now - hours * 3600, now - hours * 3600))
+        directories.append(directory)
+    return directories
+
+
+def test_quota_evicts_least_recently_used_idle_sessions(sessions, monkeypatch):
+    old, older, recent = sessions
+    monkeypatch.setattr(workspace, "QUOTA_BYTES", 2500)
+    enforce_quota(recent)
+    assert [d.exists() for d in sessions] == [False, True, True]
+
+    monkeypatch.setattr(workspace, "QUOTA_BYTES", 1000)
+    # the current session is never evicted, even when it is the least recently used
+    enforce_quota(older)
+    assert [d.exists() for d in sessions] == [False, True, False]
+
+
+def test_quota_spares_active_sessions(sessions, monkeypatch):
+    monkeypatch.setattr(workspace, "QUOTA_BYTES", 1500)
+    (sessions[0] / ACCESS_FILE).touch()
+    (sessions[1] / ACCESS_FILE).touch()
+    with pytest.raises(OSError):
+        enforce_quota(sessions[2])
+    assert all(d.exists() for d in sessions)
+
+
+def test_garbage_collection_keeps_referenced_datasets_and_their_exports(tmp_path):
+    kept = write_dataset(pd.DataFrame({"A": [1, 2]}), str(tmp_path))
+    dropped = write_dataset(pd.DataFrame({"B": [3]}), str(tmp_path))
+    exports = tmp_path / "_exports"
+    exports.mkdir()
+    for handle in (kept, dropped):
+        (exports / f"{export_name(handle)}.csv").write_text("exported")
+    with zipfile.ZipFile(exports / "both.zip", "w") as zf:
+        zf.comment = f"{export_name(kept)}.csv\n{export_name(dropped)}.csv".encode("utf-8")
+    with zipfile.ZipFile(exports / "kept.zip", "w") as zf:
+        zf.comment = f"{export_name(kept)}.csv".encode("utf-8")
+
+    collect_garbage(tmp_path, [kept])
+
+    assert os.path.exists(kept.path) and not os.path.exists(dropped.path)
+    assert sorted(p.name for p in exports.iterdir()) == sorted([f"{export_name(kept)}.csv", "kept.zip"])
+    assert kept.open().compute()["A"].tolist() == [1, 2]
@@ -0,0 +1,128 @@
+"""Cached, deduplicated translation of dictionary columns.
+
+Dictionaries repeat the same strings many times ("Sí; No" answer lists, shared
+question stems), and consecutive survey waves share most of their text. The
+columns to translate are therefore pooled, each distinct string is looked up
+in a persistent cache keyed by (text, source language, target language), and
+only the misses are sent to the translator, in batches that run concurrently.
+
+The translator is pluggable: ``S4H_TRANSLATOR`` selects one of ``TRANSLATORS``
+by name or points to a ``module:function`` taking ``(texts, source, target)``
+and returning the translated list, e.g. a local model for offline use.
+"""
+
+import hashlib
+import importlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from cache_store import KeyValueCache
+from instrumentation import instrumented
+
+TRANSLATOR = os.environ.get("S4H_TRANSLATOR", "google")
+BATCH_SIZE = int(os.environ.get("S4H_TRANSLATE_BATCH_SIZE", "50"))
+MAX_WORKERS = int(os.environ.get("S4H_TRANSLATE_WORKERS", "3"))
+# Google Translate rejects texts of 5000 characters or more
+MAX_CHARS = 5000
+TRUNCATE_TO = 4500
+
+
+def google_translate(texts, source, target):
+    from deep_translator import GoogleTranslator
+
+    return GoogleTranslator(source=source, target=target).translate_batch(texts)
+
+
+def identity_translate(texts, source, target):
+    """Offline stand-in that returns the texts unchanged."""
+    return list(texts)
+
+
+TRANSLATORS = {
+    "google": google_translate,
+    "identity": identity_translate,
+}
+
+
+def get_translator(name=TRANSLATOR):
+    """Resolve a translator by name, or by ``module:function`` import path."""
+    if name in TRANSLATORS:
+        return TRANSLATORS[name]
+    module_name, _, attr = name.partition(":")
+    if not attr:
+        raise ValueError(f"Unknown translator '{name}'. Use one of {list(TRANSLATORS)} or 'module:function'.")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def _cache_key(text, source, target):
+    payload = json.dumps([text, source, target])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _prepare(text):
+    if len(text) < MAX_CHARS:
+        return text
+    return text[:TRUNCATE_TO]
+
+
+@instrumented("Dictionary translation")
+def translate_columns(data, columns, language="en", source="auto", translator=None, cache=None,
+                      batch_size=BATCH_SIZE, max_workers=MAX_WORKERS):
+    """
+    Translate several text columns into new ``<column>_<language>`` columns.
+
+    Parameters:
+    data (pd.DataFrame): Dictionary with the text columns
+    columns (list): Names of the columns to translate
+    language (str): Target language code (default "en")
+    source (str): Source language code (default "auto")
+    translator (callable | None): Function (texts, source, target) -> list,
+        defaults to the one selected by S4H_TRANSLATOR
+    cache (KeyValueCache | None): Translation cache, defaults to the shared one
+
+    Returns:
+    tuple: Translated DataFrame and a dict with the number of distinct texts
+    ("unique"), taken from the cache ("cached") and translated ("translated")
+    """
+    for column in columns:
+        if column not in data.columns:
+            raise ValueError(f"The column '{column}' is not found in the DataFrame.")
+    if not isinstance(language, str) or len(language) != 2:
+        raise ValueError("The 'language' parameter must be a 2-letter ISO 639-1 language code (e.g. 'en').")
+    translator = translator if translator is not None else get_translator()
+    cache = cache if cache is not None else get_translation_cache()
+
+    texts = {_prepare(x) for column in columns for x in data[column] if isinstance(x, str) and x.strip()}
+    keys = {text: _cache_key(text, source, language) for text in texts}
+    cached = cache.get_many(keys.values())
+    missing = sorted(text for text, key in keys.items() if key not in cached)
+
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda batch: translator(batch, source, language), batches))
+
+    translated = {}
+    for batch, result in zip(batches, results):
+        translated.update(zip(batch, result))
+    cache.set_many({keys[text]: value for text, value in translated.items()})
+
+    def lookup(x):
+        if not isinstance(x, str) or not x.strip():
+            return x
+        text = _prepare(x)
+        return translated[text] if text in translated else cached[keys[text]]
+
+    df = data.copy()
+    for column in columns:
+        df[f"{column}_{language}"] = df[column].map(lookup)
+    return df, {"unique": len(texts), "cached": len(texts) - len(missing), "translated": len(missing)}
+
+
+@st.cache_resource
+def get_translation_cache(name=TRANSLATOR):
+    """Return the on-disk cache of a translator, shared by all sessions."""
+    # one cache per translator, so the offline stand-in never serves results to the real one
+    return KeyValueCache("translation_" + "".join(c if c.isalnum() else "_" for c in name))
@@ -1,7 +1,20 @@
+import dask
+import pandas as pd
 import streamlit as st
 from streamlit.components.v1 import html
 from streamlit_theme import st_theme
 
+from cluster import format_bytes, get_dask_client, show_cluster_panel
+from instrumentation import show_timeline
+from jobs import session_jobs
+from recipe import recipe_json
+from snapshots import referenced_handles
+from workspace import DatasetHandle, session_dir, touch_session, collect_garbage, read_rows
+
+# sorting in the preview only looks at this many leading rows
+PREVIEW_SAMPLE_ROWS = 1000
+PAGE_SIZES = [10, 25, 50, 100]
+
 def initialize_session_state():
     if 'Data_Sources' not in st.session_state:
         st.session_state.Data_Sources = []
@@ -13,8 +26,236 @@ def initialize_session_state():
         st.session_state.colnames = None
     if "colspecs" not in st.session_state:
         st.session_state.colspecs = None
+    if "coltypes" not in st.session_state:
+        st.session_state.coltypes = None
     if 'messages' not in st.session_state:
         st.session_state.messages = []
+    if 'dataset_meta' not in st.session_state:
+        st.session_state.dataset_meta = {}
+    if 'jobs' not in st.session_state:
+        st.session_state.jobs = {}
+    if 'ingested' not in st.session_state:
+        # upload key -> paths of the datasets it added to the workspace
+        st.session_state.ingested = {}
+
+    # start the shared cluster even when the app is opened on a page other than Home
+    get_dask_client()
+    touch_session(session_dir())
+    evicted = [h for h in st.session_state.Data_Sources if isinstance(h, DatasetHandle) and not h.exists()]
+    if evicted:
+        st.session_state.Data_Sources = [h for h in st.session_state.Data_Sources if h not in evicted]
+        st.session_state.messages.append(
+            ("error", f"{len(evicted)} dataset(s) were removed from the server to free disk space; please extract them again."))
+
+def dataset_key(df):
+    """
+    Return the key used to cache metadata for a dataset.
+
+    Stored datasets are keyed by their Parquet path and Dask DataFrames by
+    their graph name, which changes whenever the data they describe changes.
+    Eager frames fall back to their object id.
+    """
+    if isinstance(df, DatasetHandle):
+        return df.path
+    if dask.is_dask_collection(df):
+        return df._name
+    return id(df)
+
+def describe_dataset(df, rows=None):
+    """
+    Build the metadata entry for a dataset without computing it.
+
+    Parameters:
+    df (DatasetHandle | dd.DataFrame | pd.DataFrame): Dataset to describe
+    rows (int | None): Exact row count, or None if it has not been computed yet
+
+    Returns:
+    dict: Row count, column count, dtypes and partition count
+    """
+    if isinstance(df, DatasetHandle):
+        return {"rows": df.rows, "columns": len(df.columns), "dtypes": df.dtypes, "npartitions": df.npartitions}
+    if rows is None and not dask.is_dask_collection(df):
+        rows = len(df)
+    return {
+        "rows": rows,
+        "columns": len(df.columns),
+        "dtypes": {str(col): str(dtype) for col, dtype in df.dtypes.items()},
+        "npartitions": getattr(df, "npartitions", 1),
+    }
+
+def get_dataset_meta(df):
+    """Return the cached metadata for a dataset, registering it as pending if unknown."""
+    key = dataset_key(df)
+    meta = st.session_state.dataset_meta
+    if key not in meta:
+        meta[key] = describe_dataset(df)
+    return meta[key]
+
+def count_rows(dfs):
+    """Compute the exact row counts of several datasets in a single Dask pass."""
+    lazy = [df.rows if isinstance(df, DatasetHandle) else df.shape[0] if dask.is_dask_collection(df) else len(df)
+            for df in dfs]
+    return [int(n) for n in dask.compute(*lazy)]
+
+def set_data_sources(dfs, rows=None):
+    """
+    Replace the workspace datasets and refresh the metadata cache.
+
+    Parameters:
+    dfs (list): Datasets that make up the new workspace
+    rows (list | None): Known row count for each dataset, None where unknown
+
+    Datasets that were already in the workspace keep their cached metadata;
+    metadata of datasets that left the workspace is discarded, and so are
+    their stored files once no job of this session may still be reading them
+    and no snapshot refers to them.
+    """
+    dfs = list(dfs)
+    rows = list(rows) if rows is not None else [None] * len(dfs)
+    old_meta = st.session_state.dataset_meta
+    new_meta = {}
+    for df, n in zip(dfs, rows):
+        key = dataset_key(df)
+        if n is None and key in old_meta:
+            new_meta[key] = old_meta[key]
+        else:
+            new_meta[key] = describe_dataset(df, n)
+    st.session_state.Data_Sources = dfs
+    st.session_state.dataset_meta = new_meta
+    if not any(not job.done for job in session_jobs()):
+        # snapshots of earlier versions stay on disk so the session can step back to them
+        keep = [df for df in dfs if isinstance(df, DatasetHandle)] + referenced_handles()
+        collect_garbage(session_dir(), keep)
+
+def add_data_sources(dfs, rows=None):
+    """Append datasets to the workspace, see set_data_sources()."""
+    current = st.session_state.Data_Sources
+    known = [get_dataset_meta(df)["rows"] for df in current]
+    rows = list(rows) if rows is not None else [None] * len(dfs)
+    set_data_sources(current + list(dfs), known + rows)
+
+def open_data_sources():
+    """Return the workspace datasets as lazy Dask DataFrames."""
+    return [df.open() if isinstance(df, DatasetHandle) else df for df in st.session_state.Data_Sources]
+
+def workspace_version():
+    """
+    Return a key that changes whenever the workspace datasets or the standardized dictionary change.
+
+    Stored datasets never change under the same path, and the dictionary is
+    only ever replaced by a new DataFrame, so neither is read to build the key.
+    """
+    datasets = tuple(dataset_key(df) for df in st.session_state.Data_Sources)
+    return datasets, id(st.session_state.standardized_dict)
+
+def version_cached(name, compute):
+    """
+    Return compute(), computed again only when the workspace version changes.
+
+    Parameters:
+    name (str): Name of the cached value
+    compute (callable): Computes the value from the current workspace
+
+    Returns:
+    The value computed for the current workspace version
+    """
+    version = workspace_version()
+    cache = st.session_state.setdefault("version_cache", {})
+    entry = cache.get(name)
+    if entry is None or entry[0] != version:
+        # the dictionary is kept with the entry so that its id cannot be reused by another one
+        entry = cache[name] = (version, compute(), st.session_state.standardized_dict)
+    return entry[1]
+
+def available_columns():
+    """Return the sorted column names of all workspace datasets, cached per workspace version."""
+    def compute():
+        columns = set()
+        for df in st.session_state.Data_Sources:
+            columns.update(df.columns)
+        return sorted(columns)
+    return version_cached("available_columns", compute)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _preview_rows(path, start, stop):
+    # stored datasets never change, so pages can be shared by every session
+    return read_rows(path, start, stop)
+
+def estimate_rows(df):
+    """
+    Estimate the row count of a Dask DataFrame from its first partition.
+
+    Returns:
+    int: Rows of the first partition times the number of partitions
+    """
+    if df.npartitions == 0:
+        return 0
+    return len(df.partitions[0]) * df.npartitions
+
+def show_dataset_preview(df, title, key):
+    """
+    Show a dataset one page at a time, reading only the rows that page needs.
+
+    Stored datasets are paged through their Parquet row groups; other Dask
+    DataFrames through their leading partitions. Sorting applies to a bounded
+    sample of the first PREVIEW_SAMPLE_ROWS rows, never to the whole dataset.
+
+    Parameters:
+    df (DatasetHandle | dd.DataFrame): Dataset to preview
+    title (str): Caption shown above the table
+    key (str): Prefix for the widget keys, unique on the page
+    """
+    meta = get_dataset_meta(df)
+    if isinstance(df, DatasetHandle):
+        total = df.rows
+        st.write(f"{title}: {total} rows (from Parquet metadata), {meta['columns']} columns")
+    elif meta["rows"] is not None:
+        total = meta["rows"]
+        st.write(f"{title}: {total} rows, {meta['columns']} columns")
+    else:
+        total = estimate_rows(df)
+        st.write(f"{title}: ~{total} rows (estimated from {meta['npartitions']} partitions), {meta['columns']} columns")
+        if st.button("Exact row count", key=f"{key}_count"):
+            with st.spinner("Counting rows..."):
+                meta["rows"] = count_rows([df])[0]
+            st.rerun()
+
+    size_col, sort_col, order_col, page_col = st.columns(4)
+    page_size = size_col.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_size")
+    sort_by = sort_col.selectbox("Sort sample by", ["(none)"] + list(map(str, df.columns)), key=f"{key}_sort")
+    ascending = order_col.toggle("Ascending", value=True, key=f"{key}_asc")
+    if sort_by != "(none)":
+        total = min(total, PREVIEW_SAMPLE_ROWS)
+    n_pages = max(1, -(-total // page_size))
+    page = page_col.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, key=f"{key}_page")
+    start = (page - 1) * page_size
+
+    if sort_by == "(none)":
+        rows = _read_page(df, start, start + page_size)
+    else:
+        sample = _read_page(df, 0, PREVIEW_SAMPLE_ROWS)
+        rows = sample.sort_values(sort_by, ascending=ascending).iloc[start:start + page_size]
+    st.dataframe(rows)
+
+def _read_page(df, start, stop):
+    if isinstance(df, DatasetHandle):
+        return _preview_rows(df.path, start, stop)
+    parts = []
+    offset = 0
+    for i in range(df.npartitions):
+        part = df.partitions[i].compute()
+        if offset + len(part) > start:
+            parts.append(part.iloc[max(start - offset, 0):stop - offset])
+        offset += len(part)
+        if offset >= stop:
+            break
+    return pd.concat(parts) if parts else df._meta
+
+def format_rows(meta):
+    """Format the row count of a metadata entry, flagging counts that are still pending."""
+    if meta["rows"] is None:
+        return f"rows pending (~{meta['npartitions']} partitions)"
+    return f"{meta['rows']} rows"
 
 def show_session_state():
     st.sidebar.header("Session State")
@@ -29,8 +270,44 @@ def show_session_state():
     if st.session_state.Data_Sources:
         st.sidebar.write(f"Total databases loaded: {len(st.session_state.Data_Sources)}")
         st.sidebar.subheader("Loaded Data Sources:")
+        pending = []
         for i, df in enumerate(st.session_state.Data_Sources):
-            st.sidebar.write(f"DataFrame {i + 1} shape: {len(df)} rows, {len(df.columns)} columns")
+            meta = get_dataset_meta(df)
+            if meta["rows"] is None:
+                pending.append(df)
+            st.sidebar.write(f"DataFrame {i + 1} shape: {format_rows(meta)}, {meta['columns']} columns")
+            with st.sidebar.expander(f"DataFrame {i + 1} column types", expanded=False):
+                st.write(meta["dtypes"])
+
+        # sizes are measured when datasets are rewritten with optimized dtypes after extraction or a merge
+        memory = [df.memory for df in st.session_state.Data_Sources if getattr(df, "memory", None)]
+        if memory:
+            before = sum(m["before"] for m in memory)
+            after = sum(m["after"] for m in memory)
+            st.sidebar.write(f"Memory of {len(memory)} optimized datasets: {format_bytes(after)} "
+                             f"(was {format_bytes(before)})")
+
+        if pending and st.sidebar.button("Count pending rows"):
+            with st.spinner("Counting rows..."):
+                for df, n in zip(pending, count_rows(pending)):
+                    get_dataset_meta(df)["rows"] = n
+            st.rerun()
+
+    if st.session_state.get("recipe"):
+        st.sidebar.subheader("Recipe")
+        st.sidebar.write(f"{len(st.session_state.recipe)} recorded steps")
+        st.sidebar.download_button(
+            label="Download recipe",
+            data=recipe_json(st.session_state.recipe),
+            file_name="recipe.json",
+            mime="application/json",
+        )
+        if st.sidebar.button("Clear recipe"):
+            st.session_state.recipe = []
+            st.rerun()
+
+    show_cluster_panel()
+    show_timeline()
 
     #st.session_state.get("messages", []),
 
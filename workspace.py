@@ -0,0 +1,228 @@
+"""Parquet-backed storage for the datasets of each session's workspace.
+
+Instead of keeping Dask graphs (and whatever they hold in memory) in
+``st.session_state.Data_Sources``, every dataset is written as partitioned
+Parquet under a per-session directory in ``S4H_WORKSPACE_DIR`` (default
+``./data/workspace``) and the session only keeps a ``DatasetHandle``. Handles
+reopen their data lazily with ``dask.dataframe.read_parquet``.
+
+Files exported for download are kept in the session directory too (``_exports``)
+and are deleted with the datasets they come from.
+
+The total size of the workspace directory, exports included, is capped by
+``S4H_WORKSPACE_QUOTA_GB`` (default 50). When a write would exceed it, the
+directories of the least recently used sessions that have been idle for more
+than ``S4H_WORKSPACE_IDLE_MINUTES`` (default 60) are evicted first.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+import zipfile
+from pathlib import Path
+
+import dask
+import dask.dataframe as dd
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import streamlit as st
+
+WORKSPACE_DIR = Path(os.environ.get("S4H_WORKSPACE_DIR", "./data/workspace"))
+QUOTA_BYTES = int(float(os.environ.get("S4H_WORKSPACE_QUOTA_GB", "50")) * 1024 ** 3)
+IDLE_SECONDS = float(os.environ.get("S4H_WORKSPACE_IDLE_MINUTES", "60")) * 60
+ACCESS_FILE = ".last_access"
+
+
+class DatasetHandle:
+    """Lightweight reference to a dataset stored as Parquet."""
+
+    def __init__(self, path, rows, columns, dtypes, npartitions, owned=True):
+        self.path = str(path)
+        self.rows = rows
+        self.columns = columns
+        self.dtypes = dtypes
+        self.npartitions = npartitions
+        # datasets that live outside the session directory (e.g. ingestion outputs) are never deleted
+        self.owned = owned
+        # in-memory size in bytes "before" and "after" dtype optimization, when it ran
+        self.memory = None
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def open(self):
+        """Return the dataset as a lazy Dask DataFrame."""
+        if not self.exists():
+            raise FileNotFoundError(f"Dataset {self.path} is no longer stored; please extract it again.")
+        return dd.read_parquet(self.path)
+
+
+def _natural_key(path):
+    # same order as dask: part.2 before part.10
+    return [int(t) if t.isdigit() else t for t in re.split(r"(\d+)", path.name)]
+
+
+def parquet_files(path):
+    path = Path(path)
+    return sorted(path.glob("*.parquet"), key=_natural_key) if path.is_dir() else [path]
+
+
+def handle_for(path, owned=False):
+    """Build a handle for an existing Parquet dataset, reading only its footer metadata."""
+    files = parquet_files(path)
+    rows = sum(pq.ParquetFile(f).metadata.num_rows for f in files)
+    schema = pq.read_schema(files[0])
+    columns = [name for name in schema.names if not name.startswith("__index_level_")]
+    dtypes = {name: str(schema.field(name).type) for name in columns}
+    return DatasetHandle(path, rows, columns, dtypes, len(files), owned=owned)
+
+
+def read_rows(path, start, stop):
+    """
+    Read rows ``start:stop`` of a stored dataset, loading only the row groups that hold them.
+
+    Row group sizes come from the Parquet footers, so pages deep into a large
+    dataset cost the same as the first one.
+    """
+    frames = []
+    offset = 0
+    for f in parquet_files(path):
+        pf = pq.ParquetFile(f)
+        for i in range(pf.num_row_groups):
+            n = pf.metadata.row_group(i).num_rows
+            if offset < stop and offset + n > start:
+                part = pf.read_row_group(i).to_pandas()
+                frames.append(part.iloc[max(start - offset, 0):stop - offset])
+            offset += n
+            if offset >= stop:
+                return pd.concat(frames, ignore_index=True)
+    if not frames:
+        return pq.read_schema(parquet_files(path)[0]).empty_table().to_pandas()
+    return pd.concat(frames, ignore_index=True)
+
+
+def parquet_schema(df):
+    """
+    Return the Parquet types of the categorical columns of a dataset, to pass as to_parquet's schema.
+
+    Categories of a Dask DataFrame are only known partition by partition, and
+    pyarrow gives each partition the smallest dictionary index that fits its
+    own categories, which Dask rejects when it differs from the first
+    partition's. Categorical columns (always strings in the workspace) are
+    therefore written with int32 indices.
+    """
+    return {str(column): pa.dictionary(pa.int32(), pa.string())
+            for column, dtype in df.dtypes.items() if isinstance(dtype, pd.CategoricalDtype)}
+
+
+def write_dataset(df, directory):
+    """
+    Materialize a dataset into the given session directory.
+
+    Parameters:
+    df (dd.DataFrame | pd.DataFrame): Dataset to store
+    directory (str): Session directory returned by session_dir()
+
+    Returns:
+    DatasetHandle: Handle to the stored dataset
+    """
+    enforce_quota(directory)
+    if not dask.is_dask_collection(df):
+        df = dd.from_pandas(df, npartitions=1)
+    path = Path(directory) / uuid.uuid4().hex
+    df.to_parquet(path, write_index=False, schema=parquet_schema(df))
+    return handle_for(path, owned=True)
+
+
+def write_datasets(dfs, directory):
+    return [write_dataset(df, directory) for df in dfs]
+
+
+def session_dir():
+    """Return (and create) the workspace directory of the current session."""
+    if 'workspace_id' not in st.session_state:
+        st.session_state.workspace_id = uuid.uuid4().hex
+    directory = WORKSPACE_DIR / st.session_state.workspace_id
+    directory.mkdir(parents=True, exist_ok=True)
+    return str(directory)
+
+
+def export_dir():
+    """Return the directory of the current session where downloads are prepared."""
+    return str(Path(session_dir()) / "_exports")
+
+
+def export_name(handle):
+    """Return the name (without extension) of the exports of a stored dataset."""
+    return hashlib.sha256(handle.path.encode("utf-8")).hexdigest()[:16]
+
+
+def _export_sources(path):
+    # exports are named after their dataset; a zip archive lists the exports it bundles in its comment
+    if path.suffix == ".zip":
+        try:
+            with zipfile.ZipFile(path) as zf:
+                return [name.split(".")[0] for name in zf.comment.decode("utf-8").split()]
+        except (OSError, zipfile.BadZipFile):
+            return [None]
+    return [path.name.split(".")[0]]
+
+
+def touch_session(directory):
+    """Record that a session used its workspace, for LRU eviction."""
+    Path(directory, ACCESS_FILE).touch()
+
+
+def _last_access(directory):
+    marker = Path(directory, ACCESS_FILE)
+    return marker.stat().st_mtime if marker.exists() else 0.0
+
+
+def _dir_size(directory):
+    return sum(f.stat().st_size for f in Path(directory).rglob("*") if f.is_file())
+
+
+def enforce_quota(current_dir):
+    """
+    Evict idle sessions, least recently used first, until the workspace fits its quota.
+
+    Raises:
+    OSError: If the quota is still exceeded once no idle session is left
+    """
+    if not WORKSPACE_DIR.exists():
+        return
+    sessions = [d for d in WORKSPACE_DIR.iterdir() if d.is_dir()]
+    sizes = {d: _dir_size(d) for d in sessions}
+    total = sum(sizes.values())
+    now = time.time()
+    for directory in sorted(sessions, key=_last_access):
+        if total <= QUOTA_BYTES:
+            return
+        if directory == Path(current_dir) or now - _last_access(directory) < IDLE_SECONDS:
+            continue
+        shutil.rmtree(directory, ignore_errors=True)
+        total -= sizes[directory]
+    if total > QUOTA_BYTES:
+        raise OSError("Workspace disk quota exceeded; remove datasets or try again later.")
+
+
+def collect_garbage(directory, keep):
+    """Delete the datasets of a session directory that no handle in ``keep`` refers to, and their exports."""
+    kept = {os.path.abspath(h.path) for h in keep}
+    for path in Path(directory).iterdir():
+        # entries starting with "_" hold derived files such as exports, not datasets
+        if path.name.startswith("_"):
+            continue
+        if path.is_dir() and os.path.abspath(path) not in kept:
+            shutil.rmtree(path, ignore_errors=True)
+
+    exports = Path(directory) / "_exports"
+    if exports.is_dir():
+        kept_exports = {export_name(h) for h in keep}
+        for path in exports.iterdir():
+            if not kept_exports.issuperset(_export_sources(path)):
+                path.unlink(missing_ok=True)